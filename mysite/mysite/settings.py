@@ -1,4 +1,6 @@
 # Django settings for mysite project.
+import os
+import tempfile
 
 DEBUG = True
 TEMPLATE_DEBUG = DEBUG
@@ -21,6 +23,33 @@ DATABASES = {
     }
 }
 
+# Pragmas applied to each new SQLite connection, from polls.sqlite.PROFILES
+# (None for SQLite's defaults)
+POLLS_SQLITE_PROFILE = 'high-concurrency'
+
+# To read polls from a replica, add it as a second database, e.g.
+#
+# DATABASES['replica'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': 'replica.sqlite',
+#     # Tests run against the primary's test database
+#     'TEST_MIRROR': 'default',
+# }
+DATABASE_ROUTERS = ['polls.routers.PrimaryReplicaRouter']
+POLLS_REPLICA_DATABASE = 'replica'
+# After writing, a client keeps reading from the primary for this many
+# seconds (0 to disable)
+POLLS_REPLICA_STICKY_SECONDS = 5
+POLLS_REPLICA_STICKY_COOKIE = 'polls_primary'
+
+CACHES = {
+    'default': {
+        # Swap for 'django.core.cache.backends.filebased.FileBasedCache' (with
+        # a directory as LOCATION) to share the cache between processes.
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Hosts/domain names that are valid for this site; required if DEBUG is False
 # See https://docs.djangoproject.com/en/1.5/ref/settings/#allowed-hosts
 ALLOWED_HOSTS = []
@@ -93,6 +122,9 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    # First, so the queries of every other middleware are counted too
+    'polls.middleware.QueryInstrumentationMiddleware',
+    'polls.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -130,6 +162,109 @@ INSTALLED_APPS = (
 
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 
+# Number of polls listed per page on the home page and in search results
+POLLS_PER_PAGE = 20
+
+# Deepest page of search results served; ranked results are paged with
+# OFFSET, which costs more the deeper the page
+POLLS_SEARCH_MAX_PAGE = 50
+
+# Polls with more choices than this are edited on the paginated choice
+# changelist rather than inline on the poll's admin page
+POLLS_ADMIN_INLINE_CHOICES = 50
+
+# Cache alias and timeout (seconds) for rendered poll results
+POLLS_RENDER_CACHE = 'default'
+POLLS_RENDER_CACHE_TIMEOUT = 300
+
+# Buffer votes in memory and write them in batches, once SIZE votes are
+# pending or the oldest is MAX_STALENESS seconds old. Votes pending in a
+# process that is killed are lost.
+POLLS_VOTE_BUFFER_ENABLED = False
+POLLS_VOTE_BUFFER_SIZE = 500
+POLLS_VOTE_BUFFER_MAX_STALENESS = 1.0
+
+# Allow one vote per voter per poll, voters being told apart by 'ip' or
+# 'session' (falling back to IP). See polls.dedup for the trade-offs.
+POLLS_VOTE_DEDUP_ENABLED = False
+POLLS_VOTE_DEDUP_KEY = 'ip'
+POLLS_VOTE_DEDUP_CAPACITY = 1000000
+POLLS_VOTE_DEDUP_ERROR_RATE = 0.01
+# Bytes of Bloom filters held in memory per process
+POLLS_VOTE_DEDUP_MEMORY = 64 * 1024 * 1024
+# Directory the filters are saved to (None keeps them in memory only)
+POLLS_VOTE_DEDUP_DIR = None
+POLLS_VOTE_DEDUP_PERSIST_SECONDS = 60
+
+# Token-bucket limits on vote POSTs, as (scope, tokens per second, burst)
+# with scope 'client' or 'client-poll'; empty to disable. Buckets are
+# shared by all processes on the host through RATE_LIMIT_FILE.
+POLLS_VOTE_RATE_LIMITS = ()
+# POLLS_VOTE_RATE_LIMITS = (('client', 2.0, 20), ('client-poll', 0.2, 3))
+POLLS_VOTE_RATE_LIMIT_FILE = os.path.join(tempfile.gettempdir(), 'polls-vote-buckets')
+POLLS_VOTE_RATE_LIMIT_SLOTS = 65536
+
+# Per-minute vote counts for every choice, rolled up into hours and days
+# by the rollup_vote_history command. Counts are buffered in each process
+# and written once BUFFER_SIZE votes are pending or the oldest is
+# MAX_STALENESS seconds old; history pending in a process that is killed
+# is lost. Minute and hour buckets are kept for the given number of
+# seconds, day buckets forever. History queries pick the finest
+# granularity that needs at most MAX_POINTS buckets.
+POLLS_VOTE_HISTORY_ENABLED = False
+POLLS_VOTE_HISTORY_BUFFER_SIZE = 1000
+POLLS_VOTE_HISTORY_MAX_STALENESS = 5.0
+POLLS_VOTE_HISTORY_MINUTE_RETENTION = 2 * 24 * 60 * 60
+POLLS_VOTE_HISTORY_HOUR_RETENTION = 90 * 24 * 60 * 60
+POLLS_VOTE_HISTORY_MAX_POINTS = 500
+
+# Half-life (seconds) of a vote's weight in the trending list; the
+# decay_trend_scores command applies the decay and should run every few
+# minutes. Scores that decay below MIN_SCORE are reset to 0.
+POLLS_TRENDING_HALF_LIFE = 6 * 60 * 60
+POLLS_TRENDING_MIN_SCORE = 0.01
+
+# Clients of the bulk vote endpoint (kiosks, partners), as API key to
+# client name; the key is sent as "Authorization: Token <key>". Empty
+# disables the endpoint.
+POLLS_BULK_VOTES_API_KEYS = {}
+# Largest batch accepted by the bulk vote endpoint, largest count of a
+# single entry and most votes applied by one request
+POLLS_BULK_VOTES_MAX_ENTRIES = 10000
+POLLS_BULK_VOTES_MAX_COUNT = 1000
+POLLS_BULK_VOTES_MAX_REQUEST_VOTES = 100000
+
+# Fraction of requests whose SQL is recorded by
+# polls.middleware.QueryInstrumentationMiddleware, and the query count or
+# database time (ms) from which a request and its slowest statements are
+# logged to 'polls.sql'
+POLLS_SQL_SAMPLE_RATE = 1.0
+POLLS_SQL_LOG_MIN_QUERIES = 20
+POLLS_SQL_LOG_MIN_TIME_MS = 100
+POLLS_SQL_LOG_SLOWEST = 3
+
+# Age (days) from which the archive_polls command moves polls out of the
+# live tables by default
+POLLS_ARCHIVE_AFTER_DAYS = 365
+
+# Polls read per batch when exporting results
+POLLS_EXPORT_CHUNK_SIZE = 1000
+# Clients allowed to download /export/results.*, as API key to client name,
+# sent as for the bulk vote endpoint. Staff users signed in to the admin
+# can always download it.
+POLLS_EXPORT_API_KEYS = {}
+# Polls written per transaction by the import_polls command
+POLLS_IMPORT_CHUNK_SIZE = 1000
+
+# Live results: each process checks a watched poll for changes at most
+# once per INTERVAL seconds. Event streams send a keepalive after
+# HEARTBEAT quiet seconds and end after STREAM seconds (clients reconnect);
+# long-poll requests wait up to LONG_POLL seconds.
+POLLS_LIVE_INTERVAL = 1.0
+POLLS_LIVE_HEARTBEAT_SECONDS = 15
+POLLS_LIVE_STREAM_SECONDS = 300
+POLLS_LIVE_LONG_POLL_SECONDS = 25
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -148,7 +283,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -156,5 +295,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'polls.sql': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
@@ -8,7 +8,13 @@ urlpatterns = patterns('',
     # Examples:
     # url(r'^$', 'mysite.views.home', name='home'),
     url(r'^$', 'polls.views.home'),
+    url(r'^search/$', 'polls.views.search'),
     url(r'^poll/(\d+)/$', 'polls.views.poll'),
+    url(r'^poll/(\d+)/results\.json$', 'polls.views.poll_results'),
+    url(r'^poll/(\d+)/live/$', 'polls.views.poll_live'),
+    url(r'^poll/(\d+)/live/wait/$', 'polls.views.poll_live_wait'),
+    url(r'^votes/bulk/$', 'polls.views.bulk_votes'),
+    url(r'^export/results\.(csv|json|jsonl)$', 'polls.views.export_results'),
     # url(r'^mysite/', include('mysite.foo.urls')),
 
     # Uncomment the admin/doc line below to enable admin documentation:
@@ -1,16 +1,69 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.urlresolvers import reverse
+from django.utils.html import format_html
 from polls.models import Choice, Poll
+from polls.search import deferred_indexing
 
 
 class ChoiceInline(admin.StackedInline):
 
     model = Choice
     extra = 3
+    # Only ever changed by votes
+    readonly_fields = ('votes', )
 
 
 class PollAdmin(admin.ModelAdmin):
 
     inlines = [ChoiceInline]
+    # vote_total is stored and indexed, so sorting by it needs no aggregate
+    list_display = ('question', 'pub_date', 'vote_total')
+    # Fixed date ranges over the (pub_date, id) index; date_hierarchy would
+    # scan every poll for the distinct dates to offer
+    list_filter = ('pub_date', )
+    # The counters are only ever changed by votes
+    fields = ('question', 'pub_date', 'counter_shards', 'vote_total', 'choices')
+    readonly_fields = ('vote_total', 'choices')
+
+    def _choice_count(self, obj):
+        if not hasattr(obj, '_admin_choice_count'):
+            obj._admin_choice_count = obj.choice_set.count()
+        return obj._admin_choice_count
+
+    def get_inline_instances(self, request, obj=None):
+        # A poll with many choices would load them all into one form; those
+        # are edited on the paginated choice changelist instead
+        if obj is not None and self._choice_count(obj) > settings.POLLS_ADMIN_INLINE_CHOICES:
+            return []
+        return super(PollAdmin, self).get_inline_instances(request, obj)
+
+    # The poll and each of its inline choices would otherwise reindex the
+    # poll in turn
+    def add_view(self, *args, **kwargs):
+        with deferred_indexing():
+            return super(PollAdmin, self).add_view(*args, **kwargs)
+
+    def change_view(self, *args, **kwargs):
+        with deferred_indexing():
+            return super(PollAdmin, self).change_view(*args, **kwargs)
+
+    def choices(self, obj):
+        if obj.pk is None:
+            return ''
+        url = '%s?poll__id__exact=%d' % (reverse('admin:polls_choice_changelist'), obj.pk)
+        return format_html('<a href="{0}">Edit the {1} choices of this poll</a>',
+                           url, self._choice_count(obj))
+    choices.short_description = 'Choices'
+
+
+class ChoiceAdmin(admin.ModelAdmin):
+
+    list_display = ('choice', 'poll', 'votes')
+    # A select would list every poll
+    raw_id_fields = ('poll', )
+    readonly_fields = ('votes', )
 
 
 admin.site.register(Poll, PollAdmin)
+admin.site.register(Choice, ChoiceAdmin)
@@ -0,0 +1,76 @@
+"""Move old polls out of the live tables.
+
+An archived poll becomes one ``ArchivedPoll`` row holding its question and
+final results; its choices, vote history and search entries are deleted.
+The poll and results pages fall back to the archive for ids missing from
+``Poll``, read-only.
+
+Rows are deleted with plain SQL rather than through the ORM, which would
+load every choice and send a signal per row.
+"""
+import json
+
+from django.db import connection, transaction
+from django.db.models import Max
+from polls.cache import invalidate_choices, invalidate_results
+from polls.models import (
+    ArchivedPoll, Choice, ChoiceVoteShard, Poll, SearchTerm, VoteBucket, choice_votes, tally)
+
+# Keeps ``IN`` lists below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+def _delete_rows(model, column, ids):
+    qn = connection.ops.quote_name
+    connection.cursor().execute('DELETE FROM %s WHERE %s IN (%s)' % (
+        qn(model._meta.db_table), qn(column), ', '.join(['%s'] * len(ids))), ids)
+
+
+def archive_chunk(cutoff, chunk_size=BATCH_SIZE):
+    """Archive up to ``chunk_size`` of the oldest polls published before
+    ``cutoff``, in one transaction. Returns their ids.
+
+    An archived id must never be handed out again. New polls get theirs
+    from a sequence, or on SQLite from an ``AUTOINCREMENT`` key (see
+    ``polls.sqlite``), and ``import_polls`` starts above the archive. The
+    poll with the highest id is still never archived, which also protects
+    SQLite databases whose poll table predates ``AUTOINCREMENT``.
+    """
+    chunk_size = min(chunk_size, BATCH_SIZE)
+    with transaction.commit_on_success():
+        newest_id = Poll.objects.aggregate(pk=Max('pk'))['pk']
+        polls = list(Poll.objects.filter(pub_date__lt=cutoff).exclude(pk=newest_id)
+                     .order_by('pub_date', 'id').values_list('pk', 'question', 'pub_date')
+                     [:chunk_size])
+        if not polls:
+            return []
+        poll_ids = [pk for pk, question, pub_date in polls]
+        choices = dict((pk, []) for pk in poll_ids)
+        for row in choice_votes(Choice.objects.filter(poll__in=poll_ids), 'poll'):
+            choices[row.pop('poll')].append(row)
+        ArchivedPoll.objects.bulk_create([
+            ArchivedPoll(id=pk, question=question, pub_date=pub_date,
+                         results_json=json.dumps(tally(choices[pk])))
+            for pk, question, pub_date in polls
+        ])
+        for model in (SearchTerm, VoteBucket, ChoiceVoteShard, Choice):
+            _delete_rows(model, model._meta.get_field('poll').column, poll_ids)
+        _delete_rows(Poll, Poll._meta.pk.column, poll_ids)
+        transaction.set_dirty()
+    for pk in poll_ids:
+        invalidate_results(pk)
+        invalidate_choices(pk)
+    return poll_ids
+
+
+def archive_polls(cutoff, chunk_size=BATCH_SIZE, progress=None):
+    """Archive every poll published before ``cutoff``, a chunk per
+    transaction. Returns how many were archived."""
+    archived = 0
+    while True:
+        poll_ids = archive_chunk(cutoff, chunk_size)
+        if not poll_ids:
+            return archived
+        archived += len(poll_ids)
+        if progress is not None:
+            progress(archived)
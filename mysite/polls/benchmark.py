@@ -0,0 +1,226 @@
+"""Synthetic data and read-path measurements for the polls views."""
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.core.cache import get_cache
+from django.conf import settings
+from django.test.client import Client
+from django.utils import timezone
+from polls.instrumentation import QueryRecorder
+from polls.models import Choice, Poll
+from polls.pagination import encode_cursor
+from polls.votes import compact_vote_shards, rebuild_vote_totals, record_vote
+
+SEED_BATCH_SIZE = 500
+
+
+def seed(polls, choices_per_poll, votes_per_poll, rng=random):
+    """Create ``polls`` polls, each with its votes spread over its choices."""
+    now = timezone.now()
+    first_id = (Poll.objects.order_by('-pk').values_list('pk', flat=True)[:1] or [0])[0] + 1
+    for start in range(0, polls, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, polls - start)
+        ids = range(first_id + start, first_id + start + count)
+        Poll.objects.bulk_create([
+            Poll(pk=pk, question='Synthetic poll %d' % (pk, ),
+                 pub_date=now - timedelta(seconds=polls - (pk - first_id)))
+            for pk in ids
+        ])
+        choices = []
+        for pk in ids:
+            spread = [0] * choices_per_poll
+            for i in range(votes_per_poll if choices_per_poll else 0):
+                spread[rng.randrange(choices_per_poll)] += 1
+            choices.extend(Choice(poll_id=pk, choice='Choice %d' % (i, ), votes=votes)
+                           for i, votes in enumerate(spread))
+        Choice.objects.bulk_create(choices, batch_size=SEED_BATCH_SIZE)
+        rebuild_vote_totals(ids)
+    return list(range(first_id, first_id + polls))
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return None
+    # Rounding first stops float noise (0.99 * 100 == 99.00000000000001)
+    # from pushing the rank up by one
+    rank = int(math.ceil(round(fraction * len(samples), 6)))
+    return samples[max(1, rank) - 1]
+
+
+def summarize(measurements):
+    latencies = sorted(m['latency'] for m in measurements)
+    count = len(measurements)
+    return {
+        'requests': count,
+        'latency_ms': dict(
+            (name, percentile(latencies, fraction) * 1000)
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+        ),
+        'queries_per_request': float(sum(m['queries'] for m in measurements)) / count,
+        'rows_per_request': float(sum(m['rows'] for m in measurements)) / count,
+        'statuses': sorted(set(m['status'] for m in measurements)),
+    }
+
+
+def measure(client, url):
+    with QueryRecorder(using=None) as recorder:
+        start = time.time()
+        response = client.get(url)
+        latency = time.time() - start
+    return {'latency': latency, 'queries': recorder.count, 'rows': recorder.rows,
+            'status': response.status_code}
+
+
+def run_read_benchmark(poll_ids, requests, cold_cache=False, rng=random):
+    """Time ``requests`` GETs each of the home page and poll detail pages.
+
+    Home page requests land on a random page depth, detail requests on a
+    random poll. With ``cold_cache`` the render cache is cleared before
+    every request.
+    """
+    client = Client()
+    cache = get_cache(settings.POLLS_RENDER_CACHE)
+    home, detail = [], []
+    for i in range(requests):
+        poll = Poll.objects.get(pk=rng.choice(poll_ids))
+        if cold_cache:
+            cache.clear()
+        home.append(measure(client, '/?after=%s' % (encode_cursor(poll.pub_date, poll.pk), )
+                            if i % 2 else '/'))
+        if cold_cache:
+            cache.clear()
+        detail.append(measure(client, '/poll/%d/' % (poll.pk, )))
+    return {'home': summarize(home), 'poll': summarize(detail)}
+
+
+def _sqlite_schema(path, choices):
+    import sqlite3
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        'CREATE TABLE poll (id INTEGER PRIMARY KEY, vote_total INTEGER NOT NULL);'
+        'CREATE TABLE choice (id INTEGER PRIMARY KEY, poll_id INTEGER NOT NULL,'
+        ' choice TEXT NOT NULL, votes INTEGER NOT NULL);'
+        'CREATE INDEX choice_poll_id ON choice (poll_id);')
+    connection.execute('INSERT INTO poll VALUES (1, 0)')
+    connection.executemany('INSERT INTO choice VALUES (?, 1, ?, 0)',
+                           [(i, 'Choice %d' % (i, )) for i in range(1, choices + 1)])
+    connection.commit()
+    connection.close()
+
+
+def run_sqlite_benchmark(path, pragmas, writers, readers, seconds, choices=10):
+    """Hammer a fresh SQLite file with vote transactions and result reads.
+
+    Writers run the same two UPDATEs as ``record_vote`` in one transaction;
+    readers run the query behind ``Poll.results()``. Each thread has its own
+    connection with ``pragmas`` applied. Returns operations per second and
+    the number of "database is locked" failures.
+    """
+    import sqlite3
+    import threading
+    from polls.sqlite import apply_pragmas
+
+    _sqlite_schema(path, choices)
+    counts = {'votes': 0, 'reads': 0, 'vote_errors': 0, 'read_errors': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker(kind):
+        # Python's default 5 second timeout, as Django uses
+        connection = sqlite3.connect(path, timeout=5)
+        apply_pragmas(connection, pragmas)
+        done = errors = 0
+        rng = random.Random()
+        while not stop.is_set():
+            try:
+                if kind == 'votes':
+                    connection.execute('UPDATE choice SET votes = votes + 1 WHERE id = ? AND poll_id = 1',
+                                       (rng.randint(1, choices), ))
+                    connection.execute('UPDATE poll SET vote_total = vote_total + 1 WHERE id = 1')
+                    connection.commit()
+                else:
+                    connection.execute('SELECT id, choice, votes FROM choice WHERE poll_id = 1'
+                                       ' ORDER BY id').fetchall()
+                done += 1
+            except sqlite3.OperationalError:
+                connection.rollback()
+                errors += 1
+        connection.close()
+        with lock:
+            counts[kind] += done
+            counts[kind[:-1] + '_errors'] += errors
+
+    threads = ([threading.Thread(target=worker, args=('votes', )) for i in range(writers)] +
+               [threading.Thread(target=worker, args=('reads', )) for i in range(readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        'votes_per_second': counts['votes'] / float(seconds),
+        'reads_per_second': counts['reads'] / float(seconds),
+        'vote_errors': counts['vote_errors'],
+        'read_errors': counts['read_errors'],
+    }
+
+
+def run_shard_benchmark(shard_counts, threads, seconds):
+    """Vote for a single choice from ``threads`` threads for ``seconds``,
+    once per shard count in ``shard_counts`` (0 for an unsharded poll).
+
+    Runs against the configured database, on a scratch poll that is deleted
+    afterwards. Returns votes per second and failed votes per shard count.
+    SQLite locks the whole database for each write, so only backends with
+    row locks show throughput growing with the shard count.
+    """
+    import threading
+    from django.db import DatabaseError, connection
+
+    poll = Poll(question='Shard benchmark', pub_date=timezone.now())
+    poll.save()
+    choice = Choice(poll=poll, choice='Hot choice')
+    choice.save()
+    report = {}
+    try:
+        for shards in shard_counts:
+            poll.counter_shards = shards
+            poll.save()
+            counts = {'votes': 0, 'errors': 0}
+            lock = threading.Lock()
+            stop = threading.Event()
+
+            def worker():
+                done = errors = 0
+                try:
+                    while not stop.is_set():
+                        try:
+                            record_vote(poll.pk, choice.pk)
+                            done += 1
+                        except DatabaseError:
+                            errors += 1
+                finally:
+                    connection.close()
+                with lock:
+                    counts['votes'] += done
+                    counts['errors'] += errors
+
+            workers = [threading.Thread(target=worker) for i in range(threads)]
+            for thread in workers:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in workers:
+                thread.join()
+            compact_vote_shards()
+            report[shards] = {
+                'votes_per_second': counts['votes'] / float(seconds),
+                'errors': counts['errors'],
+            }
+    finally:
+        poll.delete()
+    return report
@@ -0,0 +1,134 @@
+"""Process-local write-behind buffer for votes.
+
+When ``POLLS_VOTE_BUFFER_ENABLED`` is set, votes are counted in memory and
+written out as grouped ``UPDATE`` statements once ``POLLS_VOTE_BUFFER_SIZE``
+votes are pending or the oldest pending vote is
+``POLLS_VOTE_BUFFER_MAX_STALENESS`` seconds old, whichever comes first.
+Pending votes are also flushed at interpreter exit and on ``SIGUSR1`` (see
+the ``flush_votes`` management command). Votes still pending when a process
+is killed outright are lost.
+"""
+import atexit
+import signal
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_connection
+
+FLUSH_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class VoteBuffer(object):
+
+    def __init__(self, max_pending, max_staleness):
+        self.max_pending = max_pending
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._pending = 0
+        self._oldest = None
+        self._timer = None
+
+    def add(self, poll_id, choice_id, count=1):
+        self._add({(int(poll_id), int(choice_id)): count})
+
+    def _add(self, counts):
+        with self._lock:
+            for key, count in counts.items():
+                self._counts[key] += count
+                self._pending += count
+            if self._oldest is None:
+                self._oldest = time.time()
+                self._start_timer()
+            flush_now = self._pending >= self.max_pending
+        if flush_now:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def staleness(self):
+        """Age in seconds of the oldest vote not yet written."""
+        with self._lock:
+            return 0 if self._oldest is None else time.time() - self._oldest
+
+    def flush(self):
+        """Write every pending vote; returns how many votes were written."""
+        with self._lock:
+            counts, pending = self._counts, self._pending
+            self._reset()
+        if not counts:
+            return 0
+        try:
+            self._write(counts)
+        except Exception:
+            # Put the votes back so the next flush retries them
+            with self._lock:
+                for key, count in counts.items():
+                    self._counts[key] += count
+                self._pending += pending
+                if self._oldest is None:
+                    self._oldest = time.time()
+                    self._start_timer()
+            raise
+        return pending
+
+    def _write(self, counts):
+        from polls.votes import apply_vote_counts
+
+        apply_vote_counts(counts)
+
+    def _reset(self):
+        self._counts = defaultdict(int)
+        self._pending = 0
+        self._oldest = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start_timer(self):
+        self._timer = threading.Timer(self.max_staleness, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread's connection would otherwise never be closed
+            close_connection()
+
+
+def get_vote_buffer():
+    """The process's vote buffer, or ``None`` if buffering is disabled."""
+    global _buffer
+    if not settings.POLLS_VOTE_BUFFER_ENABLED:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(settings.POLLS_VOTE_BUFFER_SIZE,
+                                 settings.POLLS_VOTE_BUFFER_MAX_STALENESS)
+            atexit.register(_buffer.flush)
+            _install_flush_signal_handler(_buffer)
+    return _buffer
+
+
+def _install_flush_signal_handler(buffer):
+    if FLUSH_SIGNAL is None:
+        return
+
+    def handler(signum, frame):
+        # Flush on another thread: the interrupted frame may hold the lock
+        threading.Thread(target=buffer._flush_from_timer).start()
+
+    try:
+        signal.signal(FLUSH_SIGNAL, handler)
+    except ValueError:
+        # Only the main thread may install signal handlers
+        pass
@@ -0,0 +1,216 @@
+"""Bulk import of polls with their choices, in the JSON lines and CSV
+shapes written by ``polls.export``.
+
+Input is streamed: JSON lines, one ``{"question", "pub_date", "choices":
+[{"choice", "votes"}]}`` object per poll, or CSV with ``CSV_COLUMNS`` and
+one row per choice, the rows of a poll being consecutive and sharing its
+``poll_id``. Ids in the input only group rows together; polls and choices
+get new ids.
+
+Polls are written ``chunk_size`` at a time, in one transaction per chunk.
+Ids are handed out from the current maximum, so a chunk's choices can point
+at their polls without reading anything back, and the whole chunk is two
+``bulk_create`` calls. Poll ids also stay above every archived poll's.
+Memory use is bounded by the chunk.
+"""
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from polls.cache import invalidate_choices, invalidate_results
+from polls.export import CSV_COLUMNS
+from polls.models import ArchivedPoll, Choice, Poll
+from polls.search import index_polls
+
+
+class InvalidRecord(ValueError):
+    """A record of the input could not be read; ``record`` is its 1-based
+    number."""
+
+    def __init__(self, record, message):
+        super(InvalidRecord, self).__init__('Record %d: %s' % (record, message))
+        self.record = record
+
+
+def _parse_pub_date(value):
+    pub_date = parse_datetime(value or '')
+    if pub_date is None:
+        raise ValueError('pub_date %r is not a date and time' % (value, ))
+    if timezone.is_naive(pub_date):
+        pub_date = timezone.make_aware(pub_date, timezone.get_default_timezone())
+    return pub_date
+
+
+def _parse_votes(value):
+    votes = int(value or 0)
+    if votes < 0:
+        raise ValueError('votes must not be negative')
+    return votes
+
+
+def _poll(question, pub_date, choices):
+    if not question:
+        raise ValueError('question is missing')
+    return {'question': question, 'pub_date': _parse_pub_date(pub_date), 'choices': choices}
+
+
+def iter_jsonl(lines):
+    """Polls read from JSON lines; blank lines are skipped."""
+    record = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        record += 1
+        try:
+            data = json.loads(line)
+            yield _poll(data.get('question'), data.get('pub_date'), [
+                (choice['choice'], _parse_votes(choice.get('votes')))
+                for choice in data.get('choices', [])])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise InvalidRecord(record, e)
+
+
+def iter_csv(lines):
+    """Polls read from CSV rows grouped by consecutive ``poll_id``."""
+    reader = csv.DictReader(lines)
+    missing = set(CSV_COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise InvalidRecord(1, 'missing columns %s' % (', '.join(sorted(missing)), ))
+    record, key, poll = 0, None, None
+    for row in reader:
+        try:
+            if poll is None or row['poll_id'] != key:
+                if poll is not None:
+                    yield poll
+                record += 1
+                key = row['poll_id']
+                poll = _poll(row['question'], row['pub_date'], [])
+            if row['choice']:
+                poll['choices'].append((row['choice'], _parse_votes(row['votes'])))
+        except ValueError as e:
+            raise InvalidRecord(record, e)
+    if poll is not None:
+        yield poll
+
+
+IMPORT_FORMATS = {
+    'jsonl': iter_jsonl,
+    'csv': iter_csv,
+}
+
+
+def _next_id(*models):
+    return max(model.objects.aggregate(pk=Max('pk'))['pk'] or 0 for model in models) + 1
+
+
+def import_chunk(polls, before_commit=None):
+    """Insert a list of parsed polls with their choices; returns the new
+    poll ids.
+
+    ``before_commit`` is called with the first new poll id inside the
+    transaction, before anything is written.
+    """
+    now = timezone.now()
+    with transaction.commit_on_success():
+        # An archived poll's id must never be reused
+        poll_id, choice_id = _next_id(Poll, ArchivedPoll), _next_id(Choice)
+        if before_commit is not None:
+            before_commit(poll_id)
+        poll_objects, choice_objects = [], []
+        for poll in polls:
+            poll_objects.append(Poll(
+                id=poll_id, question=poll['question'], pub_date=poll['pub_date'],
+                vote_total=sum(votes for choice, votes in poll['choices']), changed_at=now))
+            for choice, votes in poll['choices']:
+                choice_objects.append(Choice(id=choice_id, poll_id=poll_id,
+                                             choice=choice, votes=votes))
+                choice_id += 1
+            poll_id += 1
+        Poll.objects.bulk_create(poll_objects)
+        Choice.objects.bulk_create(choice_objects)
+        # Explicit ids leave sequences behind on backends that have them
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Poll, Choice]):
+            cursor.execute(sql)
+    poll_ids = [poll.pk for poll in poll_objects]
+    # bulk_create sends no signals: ids of deleted polls may be reused
+    for pk in poll_ids:
+        invalidate_results(pk)
+        invalidate_choices(pk)
+    index_polls(poll_ids)
+    return poll_ids
+
+
+class Checkpoint(object):
+    """Progress of an import, saved to ``path`` after every chunk.
+
+    Before a chunk is committed, its first poll is saved as pending: if the
+    import dies around the commit, finding that poll tells whether the
+    chunk made it. The poll is looked for by id, question and publication
+    date, since a poll created through the site may have taken the id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records, self.pending = 0, None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.records, self.pending = state['records'], state['pending']
+            if self.pending and Poll.objects.filter(
+                    pk=self.pending['poll_id'], question=self.pending['question'],
+                    pub_date=parse_datetime(self.pending['pub_date'])).exists():
+                self.records = self.pending['records']
+            self.pending = None
+
+    def _save(self):
+        if not self.path:
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'records': self.records, 'pending': self.pending}, f)
+        os.rename(self.path + '.tmp', self.path)
+
+    def begin(self, records, poll_id, poll):
+        """Mark the next ``records`` as pending, their first ``poll`` to be
+        written with id ``poll_id``."""
+        self.pending = {'records': self.records + records, 'poll_id': poll_id,
+                        'question': poll['question'], 'pub_date': poll['pub_date'].isoformat()}
+        self._save()
+
+    def commit(self):
+        self.records, self.pending = self.pending['records'], None
+        self._save()
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def import_polls(polls, chunk_size, checkpoint=None, progress=None):
+    """Import an iterable of parsed polls, skipping those a previous run
+    recorded in ``checkpoint``. ``progress`` is called with the number of
+    records done after every chunk. Returns the number of polls imported
+    by this run."""
+    checkpoint = checkpoint or Checkpoint(None)
+    polls = iter(polls)
+    # Records before the checkpoint are still parsed, just not written
+    for poll in islice(polls, checkpoint.records):
+        pass
+    imported = 0
+    while True:
+        chunk = list(islice(polls, chunk_size))
+        if not chunk:
+            break
+        import_chunk(chunk, lambda poll_id: checkpoint.begin(len(chunk), poll_id, chunk[0]))
+        checkpoint.commit()
+        imported += len(chunk)
+        if progress is not None:
+            progress(checkpoint.records)
+    checkpoint.remove()
+    return imported
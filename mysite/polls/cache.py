@@ -0,0 +1,165 @@
+"""Versioned caches for poll pages.
+
+Two things are cached per poll: the rendered results section, and the
+poll's vote setup: its list of choices used to build and validate the vote
+form, and its number of counter shards. Each has
+a version number per poll stored in the cache, and entries are keyed by
+poll id *and* version, so invalidating one is a single ``incr`` of its
+version: stale entries are never read again and simply expire.
+
+Entries are always filled from the primary database: one read from a
+lagging replica right after an invalidation would otherwise be cached as
+the current version, and served to voters reading their own writes.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from polls.models import Choice, Poll, choice_votes, tally
+from polls.signals import votes_recorded
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _get_cache():
+    return get_cache(settings.POLLS_RENDER_CACHE)
+
+
+def _version_key(kind, poll_id):
+    return 'polls:%s-version:%s' % (kind, poll_id)
+
+
+def _entry_key(kind, poll_id, version):
+    return 'polls:%s:%s:%s' % (kind, poll_id, version)
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def stats():
+    """Hit and miss counts for this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for outcome in _stats:
+            _stats[outcome] = 0
+
+
+def _current_version(cache, kind, poll_id):
+    key = _version_key(kind, poll_id)
+    version = cache.get(key)
+    if version is None:
+        # A random seed rather than 1: if the version key was evicted, a
+        # fragment cached under an old version must not become live again
+        cache.add(key, random.getrandbits(48))
+        version = cache.get(key)
+    return version
+
+
+def _invalidate(kind, poll_id):
+    try:
+        _get_cache().incr(_version_key(kind, poll_id))
+    except ValueError:
+        # No version yet, so nothing cached can be current
+        pass
+
+
+def results_version(poll_id, cache=None):
+    return _current_version(cache or _get_cache(), 'results', poll_id)
+
+
+def invalidate_results(poll_id):
+    _invalidate('results', poll_id)
+
+
+def invalidate_choices(poll_id):
+    _invalidate('choices', poll_id)
+
+
+def results_html(poll):
+    """The rendered results section for ``poll``, from the cache if possible.
+
+    Only the results are cached; the vote form carries a per-user CSRF token
+    and is rendered on every request.
+    """
+    cache = _get_cache()
+    key = _entry_key('results', poll.pk, results_version(poll.pk, cache))
+    html = cache.get(key)
+    if html is not None:
+        _count('hits')
+        return mark_safe(html)
+    _count('misses')
+    results = tally(choice_votes(Choice.objects.using(DEFAULT_DB_ALIAS).filter(poll_id=poll.pk)))
+    html = render_to_string('poll_results.html', {'results': results})
+    cache.set(key, html, settings.POLLS_RENDER_CACHE_TIMEOUT)
+    return html
+
+
+def poll_choices(poll_id):
+    """``(id, text)`` of the poll's choices, from the cache if possible.
+
+    Votes do not invalidate this list, only edits of the choices do.
+    """
+    cache = _get_cache()
+    key = _entry_key('choices', poll_id, _current_version(cache, 'choices', poll_id))
+    choices = cache.get(key)
+    if choices is None:
+        choices = list(Choice.objects.using(DEFAULT_DB_ALIAS).filter(poll_id=poll_id).order_by('pk')
+                       .values_list('pk', 'choice'))
+        cache.set(key, choices, settings.POLLS_RENDER_CACHE_TIMEOUT)
+    return choices
+
+
+def poll_counter_shards(poll_id):
+    """The poll's ``counter_shards``, from the cache if possible; 0 for a
+    missing poll."""
+    cache = _get_cache()
+    key = _entry_key('counter-shards', poll_id, _current_version(cache, 'choices', poll_id))
+    shards = cache.get(key)
+    if shards is None:
+        shards = (Poll.objects.using(DEFAULT_DB_ALIAS).filter(pk=poll_id)
+                  .values_list('counter_shards', flat=True)[:1] or [0])[0]
+        cache.set(key, shards, settings.POLLS_RENDER_CACHE_TIMEOUT)
+    return shards
+
+
+def is_poll_choice(poll_id, choice_id):
+    return any(pk == choice_id for pk, choice in poll_choices(poll_id))
+
+
+@receiver(votes_recorded)
+def _invalidate_voted_polls(sender, counts, **kwargs):
+    for poll_id in set(poll_id for poll_id, choice_id in counts):
+        invalidate_results(poll_id)
+
+
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+def _invalidate_poll(sender, instance, **kwargs):
+    invalidate_results(instance.pk)
+    # Its number of counter shards may have changed; and a new or deleted
+    # poll may share its id with an older one
+    invalidate_choices(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def _invalidate_choice_poll(sender, instance, **kwargs):
+    invalidate_results(instance.poll_id)
+    invalidate_choices(instance.poll_id)
+    if instance._counted_poll_id not in (None, instance.poll_id):
+        # The choice moved to another poll
+        invalidate_results(instance._counted_poll_id)
+        invalidate_choices(instance._counted_poll_id)
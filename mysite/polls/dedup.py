@@ -0,0 +1,282 @@
+"""One vote per voter per poll, tracked with Bloom filters.
+
+Each poll gets a Bloom filter of the voters that have voted on it, sized for
+``POLLS_VOTE_DEDUP_CAPACITY`` voters at ``POLLS_VOTE_DEDUP_ERROR_RATE``
+false positives (about 1.2MB per million voters at 1%). A false positive
+turns an honest first vote away; a voter is never let through twice by the
+same filter.
+
+Filters live in process memory, up to ``POLLS_VOTE_DEDUP_MEMORY`` bytes,
+least recently used first out. When ``POLLS_VOTE_DEDUP_DIR`` is set they
+are written there every ``POLLS_VOTE_DEDUP_PERSIST_SECONDS`` and on
+eviction, by a background thread working from copies, so votes never wait
+on the disk. A write ORs the filter into the file's copy, so the filters
+of all processes on a host converge. Between writes a voter could vote
+once per process.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+_HEADER = struct.Struct('>QII')
+
+logger = logging.getLogger('polls.dedup')
+
+
+class BloomFilter(object):
+
+    def __init__(self, capacity, error_rate):
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.size = max(8, bits + -bits % 8)
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray(self.size // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.sha1(key.encode('UTF-8')).digest()
+        # Double hashing: k positions from two 64-bit halves of one digest
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        """Add ``key``; returns ``False`` if it was (probably) there already."""
+        added = False
+        for p in self._positions(key):
+            if not self.bits[p >> 3] & (1 << (p & 7)):
+                self.bits[p >> 3] |= 1 << (p & 7)
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def merge(self, other):
+        if (other.size, other.hashes) != (self.size, self.hashes):
+            raise ValueError('Cannot merge Bloom filters of different shapes')
+        # One OR of two big integers rather than a Python loop per byte
+        merged = int.from_bytes(self.bits, 'big') | int.from_bytes(other.bits, 'big')
+        self.bits[:] = merged.to_bytes(len(self.bits), 'big')
+        self.count = max(self.count, other.count)
+
+    def copy(self):
+        bloom = BloomFilter.__new__(BloomFilter)
+        bloom.count, bloom.size, bloom.hashes = self.count, self.size, self.hashes
+        bloom.bits = bytearray(self.bits)
+        return bloom
+
+    @property
+    def memory(self):
+        return len(self.bits)
+
+    def to_bytes(self):
+        return _HEADER.pack(self.count, self.size, self.hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        count, size, hashes = _HEADER.unpack_from(data)
+        bloom = cls.__new__(cls)
+        bloom.count, bloom.size, bloom.hashes = count, size, hashes
+        bloom.bits = bytearray(data[_HEADER.size:])
+        if len(bloom.bits) != size // 8:
+            raise ValueError('Truncated Bloom filter')
+        return bloom
+
+
+class VoteDeduplicator(object):
+
+    def __init__(self, capacity, error_rate, memory_budget, directory=None, persist_every=60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.persist_every = persist_every
+        self._lock = threading.Lock()
+        self._filters = OrderedDict()
+        self._dirty = set()
+        # Copies of filters waiting to be written, by poll id
+        self._pending = {}
+        self._writer = None
+        self._persisted_at = time.time()
+        self._checks = self._rejections = 0
+        # (poll_id, voter) of votes being recorded
+        self._claimed = set()
+
+    def claim(self, poll_id, voter):
+        """Reserve ``voter``'s vote on the poll; ``False`` if they already
+        voted, or a vote of theirs is being recorded.
+
+        Every successful claim must be followed by ``release``.
+        """
+        with self._lock:
+            self._checks += 1
+            if (poll_id, voter) in self._claimed or voter in self._filter(poll_id):
+                self._rejections += 1
+                return False
+            self._claimed.add((poll_id, voter))
+            return True
+
+    def release(self, poll_id, voter, voted):
+        """End a claim. If ``voted``, record ``voter`` against the poll;
+        otherwise their vote did not count and they may vote again.
+
+        Filters due to be saved are only copied here; a background thread
+        writes them.
+        """
+        with self._lock:
+            self._claimed.discard((poll_id, voter))
+            if voted and self._filter(poll_id).add(voter):
+                self._dirty.add(poll_id)
+            if self.directory and time.time() - self._persisted_at >= self.persist_every:
+                self._snapshot_dirty()
+            if self._pending and self._writer is None:
+                self._writer = threading.Thread(target=self._write_pending)
+                self._writer.daemon = True
+                self._writer.start()
+
+    def check_and_add(self, poll_id, voter):
+        """Record ``voter`` against the poll; ``False`` if they already voted."""
+        first_vote = self.claim(poll_id, voter)
+        if first_vote:
+            self.release(poll_id, voter, True)
+        return first_vote
+
+    def persist(self):
+        """Write every filter changed since the last save, in this thread."""
+        with self._lock:
+            self._snapshot_dirty()
+        self._write_pending(background=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'polls': len(self._filters),
+                'memory': sum(bloom.memory for bloom in self._filters.values()),
+                'memory_budget': self.memory_budget,
+                'checks': self._checks,
+                'rejections': self._rejections,
+                'rejection_rate': self._rejections / float(self._checks) if self._checks else 0.0,
+            }
+
+    def _filter(self, poll_id):
+        bloom = self._filters.pop(poll_id, None)
+        if bloom is None:
+            if poll_id in self._pending:
+                # Evicted but not written yet; the file is behind
+                bloom = self._pending[poll_id].copy()
+            else:
+                bloom = self._load(poll_id) or BloomFilter(self.capacity, self.error_rate)
+            self._evict(self.memory_budget - bloom.memory)
+        self._filters[poll_id] = bloom
+        return bloom
+
+    def _evict(self, budget):
+        while self._filters and sum(b.memory for b in self._filters.values()) > budget:
+            poll_id, bloom = self._filters.popitem(last=False)
+            if poll_id in self._dirty and self.directory:
+                # Nothing else holds it any more, so it needs no copy
+                self._pending[poll_id] = bloom
+            self._dirty.discard(poll_id)
+
+    def _path(self, poll_id):
+        return os.path.join(self.directory, '%s.bloom' % (poll_id, ))
+
+    def _load(self, poll_id):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(poll_id), 'rb') as f:
+                return BloomFilter.from_bytes(f.read())
+        except (IOError, OSError, ValueError, struct.error):
+            return None
+
+    def _write(self, poll_id, bloom):
+        # Returns the copy found on disk, if it could be merged
+        on_disk = self._load(poll_id)
+        if on_disk is not None:
+            try:
+                bloom.merge(on_disk)
+            except ValueError:
+                # Written with other settings; ours replaces it
+                on_disk = None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bloom.to_bytes())
+        os.rename(tmp_path, self._path(poll_id))
+        return on_disk
+
+    def _snapshot_dirty(self):
+        # Copying a filter is one memcpy; merging and writing it is left to
+        # _write_pending, outside the lock
+        if self.directory:
+            for poll_id in self._dirty:
+                self._pending[poll_id] = self._filters[poll_id].copy()
+        self._dirty.clear()
+        self._persisted_at = time.time()
+
+    def _write_pending(self, background=True):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    if background:
+                        self._writer = None
+                    return
+                poll_id, bloom = next(iter(self._pending.items()))
+            try:
+                on_disk = self._write(poll_id, bloom)
+            except Exception:
+                if not background:
+                    raise
+                logger.exception('Could not save the vote filter of poll %s', poll_id)
+                # The next vote starts another writer to try again
+                with self._lock:
+                    self._writer = None
+                return
+            with self._lock:
+                # Left in place until written, so a reload finds it
+                if self._pending.get(poll_id) is bloom:
+                    del self._pending[poll_id]
+                live = self._filters.get(poll_id)
+                if on_disk is not None and live is not None:
+                    # Pick up the voters other processes have seen
+                    live.merge(on_disk)
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator():
+    """The process's vote deduplicator, or ``None`` if it is disabled."""
+    global _deduplicator
+    if not settings.POLLS_VOTE_DEDUP_ENABLED:
+        return None
+    with _deduplicator_lock:
+        if _deduplicator is None:
+            _deduplicator = VoteDeduplicator(
+                settings.POLLS_VOTE_DEDUP_CAPACITY, settings.POLLS_VOTE_DEDUP_ERROR_RATE,
+                settings.POLLS_VOTE_DEDUP_MEMORY, settings.POLLS_VOTE_DEDUP_DIR,
+                settings.POLLS_VOTE_DEDUP_PERSIST_SECONDS)
+            atexit.register(_deduplicator.persist)
+    return _deduplicator
+
+
+def voter_key(request):
+    """Who is voting: their session if ``POLLS_VOTE_DEDUP_KEY`` is 'session'
+    and they have one, otherwise their IP address."""
+    if settings.POLLS_VOTE_DEDUP_KEY == 'session':
+        session_key = getattr(request, 'session', None) and request.session.session_key
+        if session_key:
+            return 'session:' + session_key
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
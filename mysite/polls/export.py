@@ -0,0 +1,77 @@
+"""Stream every poll with its choices and votes as CSV, JSON or JSON lines.
+
+Polls are read in primary key order, ``chunk_size`` at a time, with one
+query for the chunk's polls and one for their choices, so memory use is
+bounded by the chunk rather than by the size of the tables. CSV and JSON
+lines are the formats ``polls.bulk_import`` reads back.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from polls.models import Choice, Poll, choice_votes
+
+CSV_COLUMNS = ['poll_id', 'question', 'pub_date', 'choice_id', 'choice', 'votes']
+
+
+def iter_results(chunk_size=1000):
+    """Yield a dict per poll, with its choices, in primary key order."""
+    last_id = 0
+    while True:
+        polls = list(Poll.objects.filter(pk__gt=last_id).order_by('pk')
+                     .values_list('pk', 'question', 'pub_date')[:chunk_size])
+        if not polls:
+            return
+        # A range rather than an IN list: no parameter limit, and a straight
+        # walk of the poll_id index
+        choices = defaultdict(list)
+        for row in choice_votes(
+                Choice.objects.filter(poll_id__gt=last_id, poll_id__lte=polls[-1][0]),
+                'poll_id'):
+            choices[row.pop('poll_id')].append(row)
+        for poll_id, question, pub_date in polls:
+            yield {
+                'id': poll_id,
+                'question': question,
+                'pub_date': pub_date.isoformat(),
+                'choices': choices.pop(poll_id, []),
+            }
+        last_id = polls[-1][0]
+
+
+class _Echo(object):
+    """File-like object that hands back what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(chunk_size=1000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for poll in iter_results(chunk_size):
+        poll_columns = [poll['id'], poll['question'], poll['pub_date']]
+        if not poll['choices']:
+            yield writer.writerow(poll_columns + ['', '', ''])
+        for choice in poll['choices']:
+            yield writer.writerow(poll_columns + [choice['id'], choice['choice'], choice['votes']])
+
+
+def iter_json(chunk_size=1000):
+    separator = '['
+    for poll in iter_results(chunk_size):
+        yield separator + json.dumps(poll)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+def iter_jsonl(chunk_size=1000):
+    for poll in iter_results(chunk_size):
+        yield json.dumps(poll) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'json': (iter_json, 'application/json'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
@@ -1,10 +1,15 @@
 from django import forms
+from polls.cache import poll_choices
 
 
 class PollVoteForm(forms.Form):
 
     vote = forms.ChoiceField(widget=forms.RadioSelect())
 
-    def __init__(self, poll):
-        forms.Form.__init__(self)
-        self.fields['vote'].choices = [(c.id, c.choice) for c in poll.choice_set.all()]
+    def __init__(self, poll, *args, **kwargs):
+        forms.Form.__init__(self, *args, **kwargs)
+        # Cached, so neither rendering nor validating a vote costs a query
+        self.fields['vote'].choices = poll_choices(poll.pk)
+
+    def clean_vote(self):
+        return int(self.cleaned_data['vote'])
@@ -0,0 +1,262 @@
+"""Vote counts over time, in minute, hour and day buckets.
+
+Every counted vote is added to its choice's count for the minute it was
+cast in, in the process's ``HistoryBuffer``. The buffer writes its counts
+as grouped upserts of the minute buckets once
+``POLLS_VOTE_HISTORY_BUFFER_SIZE`` votes are pending or the oldest is
+``POLLS_VOTE_HISTORY_MAX_STALENESS`` seconds old, so a vote costs no query
+here. History still pending when a process is killed outright is lost;
+the vote totals are not affected. ``rollup()``, run every few
+minutes by the ``rollup_vote_history`` command, recomputes hour buckets
+from minute buckets and day buckets from hour buckets, then deletes the
+minute and hour buckets older than their retention window. Storage grows
+with the number of choices receiving votes in a window, never with the
+number of votes.
+
+Minute buckets are as recent as the last flush, hour and day buckets for
+the current hour or day as the last rollup.
+"""
+import atexit
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+from polls.buffer import VoteBuffer
+from polls.models import Choice, Poll, VoteBucket
+
+# Keeps ``choice__in`` lists below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+def bucket_start(moment, granularity):
+    """Start of the bucket of width ``granularity`` that ``moment`` falls in."""
+    if timezone.is_aware(moment):
+        moment = moment.astimezone(timezone.utc)
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = (moment - midnight).seconds
+    return midnight + timedelta(seconds=seconds - seconds % granularity)
+
+
+def _retention(granularity):
+    # Seconds a bucket is kept for; day buckets are kept forever
+    return {
+        VoteBucket.MINUTE: settings.POLLS_VOTE_HISTORY_MINUTE_RETENTION,
+        VoteBucket.HOUR: settings.POLLS_VOTE_HISTORY_HOUR_RETENTION,
+    }.get(granularity)
+
+
+def _existing(increments):
+    # The (choice_id, poll_id) keys whose choice and poll still exist;
+    # votes buffered for a choice deleted since are dropped
+    keys = list(increments)
+    polls_by_choice = {}
+    for offset in range(0, len(keys), BATCH_SIZE):
+        polls_by_choice.update(Choice.objects.filter(
+            pk__in=[choice_id for choice_id, poll_id in keys[offset:offset + BATCH_SIZE]])
+            .values_list('pk', 'poll_id'))
+    # Only a choice that moved away from the poll its votes were cast in
+    # needs that poll looked up
+    moved_from = list(set(poll_id for choice_id, poll_id in keys
+                          if polls_by_choice.get(choice_id, poll_id) != poll_id))
+    polls = set(polls_by_choice.values())
+    for offset in range(0, len(moved_from), BATCH_SIZE):
+        polls.update(Poll.objects.filter(pk__in=moved_from[offset:offset + BATCH_SIZE])
+                     .values_list('pk', flat=True))
+    return [key for key in keys if key[0] in polls_by_choice and key[1] in polls]
+
+
+def record_votes(counts, now=None):
+    """Add ``counts`` to the current minute's buckets.
+
+    ``counts`` maps ``(poll_id, choice_id)`` to a number of votes, as sent
+    with ``votes_recorded``. Meant to run inside a transaction: existing
+    buckets are bumped with one ``UPDATE`` per distinct increment and
+    missing ones created with one ``INSERT``, for the choices that still
+    exist.
+    """
+    start = bucket_start(now or timezone.now(), VoteBucket.MINUTE)
+    _record_minute(start, dict(((int(choice_id), int(poll_id)), count)
+                               for (poll_id, choice_id), count in counts.items() if count))
+
+
+def _record_minute(start, increments, retry=True):
+    choice_ids = [choice_id for choice_id, poll_id in increments]
+    buckets = VoteBucket.objects.filter(granularity=VoteBucket.MINUTE, start=start)
+    existing = set()
+    for offset in range(0, len(choice_ids), BATCH_SIZE):
+        # Buckets are unique by choice: one recorded under the poll a
+        # choice has since moved away from still takes its votes
+        existing.update(buckets.filter(choice__in=choice_ids[offset:offset + BATCH_SIZE])
+                        .values_list('choice_id', flat=True))
+
+    ids_by_increment = defaultdict(list)
+    missing = {}
+    for key, count in increments.items():
+        if key[0] in existing:
+            ids_by_increment[count].append(key[0])
+        else:
+            missing[key] = count
+    for count, ids in ids_by_increment.items():
+        for offset in range(0, len(ids), BATCH_SIZE):
+            buckets.filter(choice__in=ids[offset:offset + BATCH_SIZE]).update(
+                votes=F('votes') + count)
+    missing = dict((key, missing[key]) for key in _existing(missing))
+    if not missing:
+        return
+
+    savepoint = transaction.savepoint()
+    try:
+        VoteBucket.objects.bulk_create([
+            VoteBucket(poll_id=poll_id, choice_id=choice_id, granularity=VoteBucket.MINUTE,
+                       start=start, votes=count)
+            for (choice_id, poll_id), count in missing.items()
+        ], batch_size=BATCH_SIZE)
+    except IntegrityError:
+        transaction.savepoint_rollback(savepoint)
+        if not retry:
+            raise
+        # A concurrent vote created some of these buckets first; they are
+        # found and bumped on the second try
+        _record_minute(start, missing, retry=False)
+    else:
+        transaction.savepoint_commit(savepoint)
+
+
+class HistoryBuffer(VoteBuffer):
+    """Votes waiting to be added to the minute buckets, counted by
+    ``(minute, poll_id, choice_id)``; each flush is one transaction."""
+
+    def add(self, counts, now=None):
+        start = bucket_start(now or timezone.now(), VoteBucket.MINUTE)
+        counts = dict(((start, int(poll_id), int(choice_id)), count)
+                      for (poll_id, choice_id), count in counts.items() if count)
+        if counts:
+            self._add(counts)
+
+    def _write(self, counts):
+        minutes = defaultdict(dict)
+        for (start, poll_id, choice_id), count in counts.items():
+            minutes[start][poll_id, choice_id] = count
+        with transaction.commit_on_success():
+            for start in sorted(minutes):
+                record_votes(minutes[start], now=start)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_history_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = HistoryBuffer(settings.POLLS_VOTE_HISTORY_BUFFER_SIZE,
+                                    settings.POLLS_VOTE_HISTORY_MAX_STALENESS)
+            atexit.register(_buffer.flush)
+    return _buffer
+
+
+def add_votes(counts):
+    """Count votes just cast into the current minute's history, unless
+    history is disabled. ``counts`` is as for ``record_votes``."""
+    if settings.POLLS_VOTE_HISTORY_ENABLED:
+        get_history_buffer().add(counts)
+
+
+def _rollup(source, target):
+    # Recompute the target buckets from the newest one (which may have been
+    # partial at the last rollup) onwards; older ones are final
+    buckets = VoteBucket.objects.filter(granularity=target)
+    since = buckets.aggregate(start=Max('start'))['start']
+    if since is None:
+        since = VoteBucket.objects.filter(granularity=source).aggregate(start=Min('start'))['start']
+        if since is None:
+            return 0
+    since = bucket_start(since, target)
+
+    totals = defaultdict(int)
+    rows = (VoteBucket.objects.filter(granularity=source, start__gte=since)
+            .values_list('poll_id', 'choice_id', 'start', 'votes'))
+    for poll_id, choice_id, start, votes in rows.iterator():
+        totals[poll_id, choice_id, bucket_start(start, target)] += votes
+    with transaction.commit_on_success():
+        buckets.filter(start__gte=since).delete()
+        VoteBucket.objects.bulk_create([
+            VoteBucket(poll_id=poll_id, choice_id=choice_id, granularity=target,
+                       start=start, votes=votes)
+            for (poll_id, choice_id, start), votes in totals.items()
+        ], batch_size=BATCH_SIZE)
+    return len(totals)
+
+
+def _prune(granularity, now):
+    # Only buckets already rolled up into the next granularity are deleted
+    cutoff = now - timedelta(seconds=_retention(granularity))
+    next_granularity = {VoteBucket.MINUTE: VoteBucket.HOUR, VoteBucket.HOUR: VoteBucket.DAY}[granularity]
+    rolled_up = (VoteBucket.objects.filter(granularity=next_granularity)
+                 .aggregate(start=Max('start'))['start'])
+    if rolled_up is None:
+        return 0
+    stale = VoteBucket.objects.filter(granularity=granularity,
+                                      start__lt=min(cutoff, rolled_up))
+    count = stale.count()
+    stale.delete()
+    return count
+
+
+def rollup(now=None):
+    """Roll minute buckets into hours and hours into days, then drop
+    buckets past their retention window.
+
+    Returns the number of hour and day buckets written and of minute and
+    hour buckets deleted.
+    """
+    now = now or timezone.now()
+    result = {
+        'hours': _rollup(VoteBucket.MINUTE, VoteBucket.HOUR),
+        'days': _rollup(VoteBucket.HOUR, VoteBucket.DAY),
+    }
+    result['pruned_minutes'] = _prune(VoteBucket.MINUTE, now)
+    result['pruned_hours'] = _prune(VoteBucket.HOUR, now)
+    return result
+
+
+def choose_granularity(since, until, now=None):
+    """The finest granularity still kept for ``since`` that covers
+    ``since`` to ``until`` in at most ``POLLS_VOTE_HISTORY_MAX_POINTS``
+    buckets."""
+    now = now or timezone.now()
+    seconds = (until - since).total_seconds()
+    for granularity in (VoteBucket.MINUTE, VoteBucket.HOUR):
+        retention = _retention(granularity)
+        if since < now - timedelta(seconds=retention):
+            continue
+        if seconds / granularity <= settings.POLLS_VOTE_HISTORY_MAX_POINTS:
+            return granularity
+    return VoteBucket.DAY
+
+
+def vote_history(poll_id, since, until=None, granularity=None):
+    """Votes per choice of a poll over time, read from one granularity.
+
+    Returns ``{'granularity': seconds, 'buckets': [{'start': datetime,
+    'votes': {choice_id: votes}}]}`` with buckets in time order; buckets
+    without votes are left out.
+    """
+    until = until or timezone.now()
+    if granularity is None:
+        granularity = choose_granularity(since, until)
+    rows = (VoteBucket.objects
+            .filter(poll=poll_id, granularity=granularity,
+                    start__gte=bucket_start(since, granularity), start__lt=until)
+            .order_by('start', 'choice').values_list('start', 'choice_id', 'votes'))
+    buckets = []
+    for start, choice_id, votes in rows:
+        if not buckets or buckets[-1]['start'] != start:
+            buckets.append({'start': start, 'votes': {}})
+        buckets[-1]['votes'][choice_id] = votes
+    return {'granularity': granularity, 'buckets': buckets}
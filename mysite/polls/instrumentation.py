@@ -0,0 +1,131 @@
+"""Record the SQL a block of code runs, whatever the value of DEBUG."""
+from time import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.util import CursorWrapper
+
+
+class RecordingCursorWrapper(object):
+    """Times statements and counts the rows fetched through a cursor."""
+
+    def __init__(self, cursor, recorder, connection):
+        self.cursor = cursor
+        self.recorder = recorder
+        self.connection = connection
+        self.query = None
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self._fetched(1)
+            yield row
+
+    def _fetched(self, rows):
+        if self.query is not None:
+            self.query['rows'] += rows
+        self.recorder.rows += rows
+
+    def execute(self, sql, params=()):
+        start = time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.query = self.recorder.record(self.connection, self.cursor, sql, params,
+                                              time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.query = self.recorder.record(self.connection, self.cursor, sql, None,
+                                              time() - start)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self._fetched(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+
+class QueryRecorder(object):
+    """Context manager collecting every statement run on some connections.
+
+    ``using`` is a database alias, a list of them, or ``None`` for every
+    configured database. Each entry of ``queries`` is a dict with the
+    ``sql``, the alias it was run ``using``, its ``time`` in seconds and the
+    number of ``rows`` fetched from its result. Recording is per thread,
+    like the connections themselves, and does not stop
+    ``connection.queries`` from being filled in when DEBUG is on.
+    """
+
+    def __init__(self, using='default'):
+        if using is None:
+            using = list(connections)
+        elif isinstance(using, str):
+            using = [using]
+        self.connections = [connections[alias] for alias in using]
+        self.queries = []
+        self.rows = 0
+
+    def __enter__(self):
+        self._saved = {}
+        for connection in self.connections:
+            self._saved[connection.alias] = dict(
+                (attr, connection.__dict__[attr])
+                for attr in ('make_debug_cursor', 'use_debug_cursor')
+                if attr in connection.__dict__)
+            connection.make_debug_cursor = self._recording_cursor_factory(connection)
+            connection.use_debug_cursor = True
+        return self
+
+    def _recording_cursor_factory(self, connection):
+        make_debug_cursor = connection.make_debug_cursor
+        was_debug = connection.use_debug_cursor is True or (
+            connection.use_debug_cursor is None and settings.DEBUG)
+
+        def make_recording_cursor(cursor):
+            inner = make_debug_cursor(cursor) if was_debug else CursorWrapper(cursor, connection)
+            return RecordingCursorWrapper(inner, self, connection)
+        return make_recording_cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection in self.connections:
+            saved = self._saved[connection.alias]
+            for attr in ('make_debug_cursor', 'use_debug_cursor'):
+                if attr in saved:
+                    setattr(connection, attr, saved[attr])
+                else:
+                    connection.__dict__.pop(attr, None)
+
+    def record(self, connection, cursor, sql, params, duration):
+        if params is not None:
+            sql = connection.ops.last_executed_query(cursor, sql, params)
+        query = {'sql': sql, 'using': connection.alias, 'time': duration, 'rows': 0}
+        self.queries.append(query)
+        return query
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query['time'] for query in self.queries)
+
+    def slowest(self, n):
+        return sorted(self.queries, key=lambda query: query['time'], reverse=True)[:n]
+
@@ -0,0 +1,101 @@
+"""In-process fan-out of poll results to live subscribers.
+
+However many clients are watching a poll, each process checks that poll's
+change marker at most once per ``POLLS_LIVE_INTERVAL`` seconds, and only
+recomputes its results when the marker has moved. Every subscriber is then
+served from that one shared snapshot. The revision of the poll's change
+marker numbers the snapshots, so clients can resume against any process.
+"""
+import threading
+import time
+
+from django.conf import settings
+from polls.models import Poll, change_marker
+
+
+class _PollState(object):
+
+    def __init__(self):
+        self.revision = None
+        self.results = None
+        self.checked_at = 0
+        self.refreshing = False
+        self.subscribers = 0
+
+
+class ResultsHub(object):
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._polls = {}
+
+    @property
+    def interval(self):
+        return settings.POLLS_LIVE_INTERVAL if self._interval is None else self._interval
+
+    def subscribe(self, poll_id):
+        with self._cond:
+            self._polls.setdefault(poll_id, _PollState()).subscribers += 1
+
+    def unsubscribe(self, poll_id):
+        with self._cond:
+            state = self._polls[poll_id]
+            state.subscribers -= 1
+            if not state.subscribers:
+                del self._polls[poll_id]
+
+    def wait(self, poll_id, since, timeout):
+        """Return ``(revision, results)`` once the revision passes ``since``.
+
+        Gives up after ``timeout`` seconds and returns the current snapshot.
+        ``results`` is ``None`` if the poll does not exist. The caller must
+        be subscribed to the poll.
+        """
+        deadline = time.time() + timeout
+        while True:
+            revision, results = self._refresh(poll_id)
+            remaining = deadline - time.time()
+            if results is None or since is None or revision > since or remaining <= 0:
+                return revision, results
+            with self._cond:
+                self._cond.wait(min(remaining, self.interval))
+
+    def _refresh(self, poll_id):
+        with self._cond:
+            state = self._polls[poll_id]
+            if state.refreshing or time.time() - state.checked_at < self.interval:
+                return state.revision, state.results
+            state.refreshing = True
+        revision, results = state.revision, state.results
+        try:
+            marker = change_marker(poll_id)
+            if marker is None:
+                revision, results = None, None
+            elif marker[0] != state.revision:
+                revision, results = marker[0], Poll(pk=poll_id).results()
+        finally:
+            with self._cond:
+                changed = revision != state.revision
+                state.revision, state.results = revision, results
+                state.checked_at = time.time()
+                state.refreshing = False
+                if changed:
+                    self._cond.notify_all()
+        return revision, results
+
+
+hub = ResultsHub()
+
+
+def results_delta(previous, current):
+    """The parts of ``current`` results that differ from ``previous``."""
+    if previous is None:
+        return current
+    old_choices = dict((choice['id'], choice) for choice in previous['choices'])
+    return {
+        'total_votes': current['total_votes'],
+        'choices': [choice for choice in current['choices']
+                    if old_choices.get(choice['id']) != choice],
+        'removed': sorted(set(old_choices) - set(choice['id'] for choice in current['choices'])),
+    }
@@ -0,0 +1,30 @@
+from datetime import timedelta
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from polls.archive import BATCH_SIZE, archive_polls
+
+
+class Command(BaseCommand):
+
+    help = ('Move polls published before a cutoff out of the live tables into the '
+            'archive, where their results stay readable.')
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', default=settings.POLLS_ARCHIVE_AFTER_DAYS,
+                    help='Archive polls published more than this many days ago.'),
+        make_option('--chunk-size', type='int', default=BATCH_SIZE,
+                    help='Polls archived per transaction (at most %d).' % (BATCH_SIZE, )),
+    )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('--days must not be negative and --chunk-size must be positive')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        def progress(archived):
+            self.stdout.write('%d polls archived' % (archived, ))
+
+        archived = archive_polls(cutoff, options['chunk_size'], progress)
+        self.stdout.write('Archived %d polls published before %s' % (archived, cutoff.isoformat()))
@@ -0,0 +1,57 @@
+import json
+import subprocess
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from polls.benchmark import run_read_benchmark, seed
+
+
+class Command(BaseCommand):
+
+    help = ('Benchmark the home and poll detail views against a throwaway test '
+            'database filled with synthetic polls, and write the results as JSON.')
+    option_list = BaseCommand.option_list + (
+        make_option('--polls', type='int', default=1000),
+        make_option('--choices', type='int', default=5, help='Choices per poll.'),
+        make_option('--votes', type='int', default=100, help='Votes per poll.'),
+        make_option('--requests', type='int', default=200, help='Requests per view.'),
+        make_option('--cold-cache', action='store_true', default=False,
+                    help='Clear the render cache before every request.'),
+        make_option('--output', help='Write the JSON report here instead of stdout.'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+        try:
+            poll_ids = seed(options['polls'], options['choices'], options['votes'])
+            results = run_read_benchmark(poll_ids, options['requests'], options['cold_cache'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+            teardown_test_environment()
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'commit': _current_commit(),
+            'parameters': dict((name, options[name]) for name in
+                               ('polls', 'choices', 'votes', 'requests', 'cold_cache')),
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+
+def _current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
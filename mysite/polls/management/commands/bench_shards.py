@@ -0,0 +1,26 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from polls.benchmark import run_shard_benchmark
+
+
+class Command(BaseCommand):
+
+    help = ('Measure vote throughput on one hot choice with different numbers of '
+            'counter shards, against the configured database. Throughput only '
+            'grows with the shard count on databases with row-level locks.')
+    option_list = BaseCommand.option_list + (
+        make_option('--shards', default='0,1,2,4,8,16',
+                    help='Comma-separated shard counts to try (0: unsharded).'),
+        make_option('--threads', type='int', default=8, help='Concurrent voting threads.'),
+        make_option('--seconds', type='float', default=5, help='Duration of each run.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            shard_counts = [int(shards) for shards in options['shards'].split(',')]
+        except ValueError:
+            raise CommandError('--shards must be a comma-separated list of numbers')
+        report = run_shard_benchmark(shard_counts, options['threads'], options['seconds'])
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
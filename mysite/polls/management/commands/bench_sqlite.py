@@ -0,0 +1,34 @@
+import json
+import os
+import shutil
+import tempfile
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from polls.benchmark import run_sqlite_benchmark
+from polls.sqlite import PROFILES
+
+
+class Command(BaseCommand):
+
+    help = ('Compare vote-write and result-read throughput on a scratch SQLite '
+            'file with SQLite defaults and with each connection profile.')
+    option_list = BaseCommand.option_list + (
+        make_option('--writers', type='int', default=4, help='Concurrent voting threads.'),
+        make_option('--readers', type='int', default=4, help='Concurrent reading threads.'),
+        make_option('--seconds', type='float', default=5, help='Duration of each run.'),
+        make_option('--choices', type='int', default=10),
+    )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        report = {}
+        try:
+            for name, pragmas in [('defaults', ())] + sorted(PROFILES.items()):
+                report[name] = run_sqlite_benchmark(
+                    os.path.join(directory, '%s.sqlite' % (name, )), pragmas,
+                    options['writers'], options['readers'], options['seconds'],
+                    options['choices'])
+        finally:
+            shutil.rmtree(directory)
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from polls.votes import compact_vote_shards
+
+
+class Command(BaseCommand):
+
+    help = ("Move votes held in counter shards into the choices' and polls' totals. "
+            'Run it every few seconds to minutes while any poll has counter shards.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Moved %d votes out of counter shards' % (compact_vote_shards(), ))
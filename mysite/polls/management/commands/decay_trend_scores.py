@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from polls.trending import decay_trend_scores
+
+
+class Command(BaseCommand):
+
+    help = ('Decay the trending scores of all polls. Run it every --interval '
+            'seconds, e.g. from cron.')
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='float', default=300,
+                    help='Seconds since the previous run (default 300).'),
+    )
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+        decayed = decay_trend_scores(options['interval'])
+        self.stdout.write('Decayed the trend scores of %d polls' % (decayed, ))
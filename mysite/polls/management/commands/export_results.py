@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from polls.export import EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+
+    help = ('Write every poll with its choices and vote counts as CSV, JSON or JSON lines. '
+            'import_polls reads CSV and JSON lines back.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='csv', help='csv (default), json or jsonl.'),
+        make_option('--output', help='Write here instead of stdout.'),
+        make_option('--chunk-size', type='int', default=settings.POLLS_EXPORT_CHUNK_SIZE,
+                    help='Polls read per query.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            rows = EXPORT_FORMATS[options['format']][0]
+        except KeyError:
+            raise CommandError('Unknown format %r' % (options['format'], ))
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                for chunk in rows(options['chunk_size']):
+                    f.write(chunk)
+        else:
+            for chunk in rows(options['chunk_size']):
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,34 @@
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from polls.buffer import FLUSH_SIGNAL, get_vote_buffer
+
+
+class Command(BaseCommand):
+
+    help = ('Force buffered votes to be written. Without --pid, flushes the '
+            "buffer of this process; with --pid, signals running servers' "
+            'processes to flush theirs.')
+    option_list = BaseCommand.option_list + (
+        make_option('--pid', action='append', type='int', dest='pids', default=[],
+                    help='Process id of a server process to flush (repeatable).'),
+    )
+
+    def handle(self, *args, **options):
+        if options['pids']:
+            if FLUSH_SIGNAL is None:
+                raise CommandError('Signalling other processes is not supported on this platform')
+            for pid in options['pids']:
+                try:
+                    os.kill(pid, FLUSH_SIGNAL)
+                except OSError as e:
+                    raise CommandError('Could not signal process %d: %s' % (pid, e))
+            self.stdout.write('Asked %d process(es) to flush their votes' % (len(options['pids']), ))
+            return
+
+        buffer = get_vote_buffer()
+        if buffer is None:
+            self.stdout.write('Vote buffering is disabled')
+            return
+        self.stdout.write('Flushed %d vote(s)' % (buffer.flush(), ))
@@ -0,0 +1,60 @@
+import os
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from polls.bulk_import import IMPORT_FORMATS, Checkpoint, InvalidRecord, import_polls
+
+
+class Command(BaseCommand):
+
+    args = '<path>'
+    help = ('Import polls with their choices from JSON lines or CSV, as written by '
+            'export_results --format jsonl or csv. An interrupted import resumes where it '
+            'stopped when run again with the same checkpoint file.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', help='jsonl or csv (default: from the file extension).'),
+        make_option('--chunk-size', type='int', default=settings.POLLS_IMPORT_CHUNK_SIZE,
+                    help='Polls written per transaction.'),
+        make_option('--checkpoint',
+                    help='Progress file (default: <path>.checkpoint). Removed once done.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the path of the file to import')
+        path = args[0]
+        format = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if format == 'json':
+            # A single array could not be read a chunk at a time
+            raise CommandError('JSON arrays are not imported; export JSON lines with '
+                               'export_results --format jsonl')
+        try:
+            parse = IMPORT_FORMATS[format]
+        except KeyError:
+            raise CommandError('Unknown format %r; use --format jsonl or csv' % (format, ))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        checkpoint = Checkpoint(options['checkpoint'] or path + '.checkpoint')
+        resumed = checkpoint.records
+        if resumed:
+            self.stdout.write('Resuming after %d polls' % (resumed, ))
+        started = time.time()
+
+        def progress(records):
+            self.stdout.write('%d polls done (%.0f/s)' % (
+                records, (records - resumed) / max(time.time() - started, 1e-6)))
+
+        try:
+            f = open(path, newline='')
+        except IOError as e:
+            raise CommandError(e)
+        with f:
+            try:
+                imported = import_polls(parse(f), options['chunk_size'], checkpoint, progress)
+            except InvalidRecord as e:
+                raise CommandError('%s. Polls before its chunk were imported; fix the record '
+                                   'and run the command again to resume.' % (e, ))
+        self.stdout.write('Imported %d polls' % (imported, ))
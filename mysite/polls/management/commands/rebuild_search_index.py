@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from polls.models import Poll
+from polls.search import index_polls
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the search index entries of every poll.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help='Number of polls indexed per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, indexed = 0, 0
+        while True:
+            poll_ids = list(Poll.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', flat=True)[:batch_size])
+            if not poll_ids:
+                break
+            index_polls(poll_ids)
+            indexed += len(poll_ids)
+            last_id = poll_ids[-1]
+        self.stdout.write('Indexed %d polls' % (indexed, ))
@@ -0,0 +1,27 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from polls.models import Poll
+from polls.votes import rebuild_vote_totals
+
+
+class Command(BaseCommand):
+
+    help = "Recompute every poll's stored vote total from its choices."
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of polls updated per statement.'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, rebuilt = 0, 0
+        while True:
+            poll_ids = list(Poll.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', flat=True)[:batch_size])
+            if not poll_ids:
+                break
+            rebuild_vote_totals(poll_ids)
+            rebuilt += len(poll_ids)
+            last_id = poll_ids[-1]
+        self.stdout.write('Rebuilt vote totals for %d polls' % (rebuilt, ))
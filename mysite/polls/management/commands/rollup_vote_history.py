@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from polls.history import rollup
+
+
+class Command(BaseCommand):
+
+    help = ('Roll minute vote history up into hours and days, and delete '
+            'buckets past their retention window. Run every few minutes.')
+
+    def handle(self, *args, **options):
+        result = rollup()
+        self.stdout.write('Wrote %(hours)d hour and %(days)d day buckets, deleted '
+                          '%(pruned_minutes)d minute and %(pruned_hours)d hour buckets' % result)
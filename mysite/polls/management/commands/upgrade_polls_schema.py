@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from polls.upgrade import upgrade_schema, upgrade_statements
+
+
+class Command(BaseCommand):
+
+    help = ('Add the columns and indexes the polls tables gained since the database was '
+            'created, then rebuild the vote totals and the search index. Run syncdb first.')
+    option_list = BaseCommand.option_list + (
+        make_option('--print', action='store_true', dest='print_only', default=False,
+                    help='Print the SQL instead of running it.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            if options['print_only']:
+                for sql in upgrade_statements():
+                    self.stdout.write(sql if sql.endswith(';') else sql + ';')
+                return
+            statements = upgrade_schema()
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('Ran %d schema statements' % (len(statements), ))
+        if statements:
+            # Existing polls start with no stored totals and no index entries
+            call_command('rebuild_vote_totals', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
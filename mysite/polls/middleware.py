@@ -0,0 +1,75 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+from polls import routers
+from polls.instrumentation import QueryRecorder
+
+logger = logging.getLogger('polls.sql')
+
+
+class QueryInstrumentationMiddleware(object):
+    """Report the SQL cost of each request, even with DEBUG off.
+
+    A ``POLLS_SQL_SAMPLE_RATE`` fraction of requests is recorded. Those get
+    ``X-SQL-Queries``, ``X-SQL-Time-Ms`` and ``X-SQL-Rows`` response headers,
+    and if they ran at least ``POLLS_SQL_LOG_MIN_QUERIES`` statements or spent
+    at least ``POLLS_SQL_LOG_MIN_TIME_MS`` in the database, a JSON log line on
+    the ``polls.sql`` logger listing their slowest statements.
+    """
+
+    def process_request(self, request):
+        if random.random() < settings.POLLS_SQL_SAMPLE_RATE:
+            # Every database, so reads routed to the replica count too
+            request._query_recorder = QueryRecorder(using=None).__enter__()
+
+    def process_response(self, request, response):
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is None:
+            return response
+        recorder.__exit__(None, None, None)
+        del request._query_recorder
+
+        time_ms = recorder.total_time * 1000
+        response['X-SQL-Queries'] = str(recorder.count)
+        response['X-SQL-Time-Ms'] = '%.1f' % (time_ms, )
+        response['X-SQL-Rows'] = str(recorder.rows)
+
+        if (recorder.count >= settings.POLLS_SQL_LOG_MIN_QUERIES or
+                time_ms >= settings.POLLS_SQL_LOG_MIN_TIME_MS):
+            stats = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'time_ms': round(time_ms, 1),
+                'rows': recorder.rows,
+                'slowest': [
+                    {'sql': query['sql'], 'using': query['using'],
+                     'time_ms': round(query['time'] * 1000, 1), 'rows': query['rows']}
+                    for query in recorder.slowest(settings.POLLS_SQL_LOG_SLOWEST)
+                ],
+            }
+            logger.info(json.dumps(stats, sort_keys=True), extra={'sql_stats': stats})
+        return response
+
+
+class ReplicaRoutingMiddleware(object):
+    """Let safe requests read polls from the replica.
+
+    After a request writes to the primary, the client gets a cookie that
+    keeps its reads on the primary for ``POLLS_REPLICA_STICKY_SECONDS``, so
+    a voter sees their own vote even while the replica lags.
+    """
+
+    def process_request(self, request):
+        cookie = settings.POLLS_REPLICA_STICKY_COOKIE
+        routers.use_replica(request.method in ('GET', 'HEAD') and cookie not in request.COOKIES)
+
+    def process_response(self, request, response):
+        if routers.wrote_to_primary() and settings.POLLS_REPLICA_STICKY_SECONDS:
+            response.set_cookie(settings.POLLS_REPLICA_STICKY_COOKIE, '1',
+                                max_age=settings.POLLS_REPLICA_STICKY_SECONDS, httponly=True)
+        routers.use_replica(False)
+        return response
@@ -1,4 +1,77 @@
-from django.db import models
+import json
+from contextlib import contextmanager
+
+from django.db import models, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+
+def _percentage(votes, total):
+    try:
+        return round(100 * votes / total, 2)
+    except ZeroDivisionError:
+        return round(0, 2)
+
+
+def tally(choices):
+    """Results from ``{'id', 'choice', 'votes'}`` dicts: adds each choice's
+    percentage of the votes, and the total."""
+    total_votes = sum(choice['votes'] for choice in choices)
+    for choice in choices:
+        choice['percentage'] = _percentage(choice['votes'], total_votes)
+    return {'choices': choices, 'total_votes': total_votes}
+
+
+def choice_votes(choices, *fields):
+    """``id``, ``choice`` and ``votes`` (plus ``fields``) of each choice, in
+    id order, counting the votes still held in its counter shards; one
+    query."""
+    rows = list(choices.annotate(pending=Sum('vote_shards__votes')).order_by('pk')
+                .values('id', 'choice', 'votes', 'pending', *fields))
+    for row in rows:
+        row['votes'] += row.pop('pending') or 0
+    return rows
+
+
+@contextmanager
+def joined_transaction():
+    """Run the block in the caller's transaction if one is managed, else in
+    its own ``commit_on_success``.
+
+    A nested ``commit_on_success`` would commit the caller's transaction
+    on exit, and it could then no longer be rolled back as a whole.
+    """
+    if transaction.is_managed():
+        yield
+    else:
+        with transaction.commit_on_success():
+            yield
+
+
+def with_change_marker(revisions=1, **updates):
+    """``updates`` for ``Poll.objects.update()``, plus a change marker bump
+    of ``revisions``."""
+    updates.update(revision=F('revision') + revisions, changed_at=timezone.now())
+    return updates
+
+
+def change_marker(poll_id):
+    """The poll's ``(revision, changed_at)``, or ``None`` if there is no such
+    poll; one query.
+
+    Votes still held in counter shards move the marker without touching
+    the poll row: each one counts towards the revision until compaction
+    moves it into ``Poll.revision``, and the latest shard write towards
+    ``changed_at``.
+    """
+    markers = list(Poll.objects.filter(pk=poll_id)
+                   .annotate(pending=Sum('choicevoteshard__votes'),
+                             shard_changed_at=Max('choicevoteshard__changed_at'))
+                   .values_list('revision', 'changed_at', 'pending', 'shard_changed_at')[:1])
+    if not markers:
+        return None
+    revision, changed_at, pending, shard_changed_at = markers[0]
+    return revision + (pending or 0), max(changed_at, shard_changed_at or changed_at)
 
 
 # Create your models here.
@@ -6,12 +79,71 @@ class Poll(models.Model):
 
     question = models.CharField(max_length=200)
     pub_date = models.DateTimeField('Date published')
+    # Denormalized sum of choice_set's votes, kept up to date in the same
+    # transaction as every vote; see polls.votes.rebuild_vote_totals
+    vote_total = models.IntegerField(default=0)
+    # Change marker for conditional GETs, moved on by every vote and every
+    # edit of the poll or its choices; see change_marker for sharded votes
+    revision = models.IntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    # Exponentially decayed vote count: every vote adds 1 and
+    # polls.trending.decay_trend_scores halves it every half-life
+    trend_score = models.FloatField(default=0)
+    # Spread the votes of each choice over this many ChoiceVoteShard rows,
+    # for polls too busy for every vote to lock the same choice; 0 to count
+    # straight into Choice.votes
+    counter_shards = models.PositiveSmallIntegerField(default=0)
+
+    # Only ever changed relative to their current value, by UPDATE ... SET
+    # field = field + n (or * n for the decay of trend_score)
+    COUNTER_FIELDS = ('vote_total', 'revision', 'trend_score')
+
+    class Meta:
+        # Keyset pagination on the home page seeks and walks the first; the
+        # trending and most voted lists read the top of the others
+        index_together = [('pub_date', 'id'), ('trend_score', 'id'), ('vote_total', 'id')]
 
     def __str__(self):
         return self.question
 
+    def save(self, *args, **kwargs):
+        self.changed_at = timezone.now()
+        if not (self._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields')):
+            # Writing back this instance's copy of the counters could undo
+            # votes counted since it was loaded
+            kwargs['update_fields'] = [field.name for field in self._meta.local_fields
+                                       if not field.primary_key and
+                                       field.name not in self.COUNTER_FIELDS]
+        super(Poll, self).save(*args, **kwargs)
+
     def total_votes(self):
-        return sum(c.votes for c in self.choice_set.all())
+        return self.vote_total
+
+    def results(self):
+        """Vote counts and percentages for every choice, from a single query.
+
+        Totals are summed from the fetched rows rather than read from
+        ``vote_total`` so the percentages always add up within one result,
+        and include votes not yet compacted out of counter shards.
+        """
+        return tally(choice_votes(self.choice_set.all()))
+
+
+class ChoiceQuerySet(models.query.QuerySet):
+
+    def delete(self):
+        # One Choice.delete per choice, so that their polls' vote totals and
+        # change markers follow, e.g. for the admin's delete action
+        with joined_transaction():
+            for choice in self:
+                choice.delete()
+    delete.alters_data = True
+
+
+class ChoiceManager(models.Manager):
+
+    def get_query_set(self):
+        return ChoiceQuerySet(self.model, using=self._db)
 
 
 class Choice(models.Model):
@@ -20,10 +152,157 @@ class Choice(models.Model):
     choice = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
 
+    objects = ChoiceManager()
+
+    def __init__(self, *args, **kwargs):
+        super(Choice, self).__init__(*args, **kwargs)
+        self._remember_counted_votes()
+
+    def _remember_counted_votes(self):
+        # What this row currently contributes to its poll's vote_total
+        if self.pk is None:
+            self._counted_poll_id, self._counted_votes = None, 0
+        else:
+            self._counted_poll_id, self._counted_votes = self.poll_id, self.votes
+
+    def _touch_poll(self, poll_id, delta, revisions=1):
+        Poll.objects.filter(pk=poll_id).update(
+            **with_change_marker(revisions, vote_total=F('vote_total') + delta))
+        # Keep an already loaded poll in step, so poll.total_votes() is right
+        # without having to fetch it again
+        cached_poll = getattr(self, Choice.poll.cache_name, None)
+        if cached_poll is not None and cached_poll.pk == poll_id:
+            cached_poll.vote_total += delta
+
+    def _lock_counted_votes(self):
+        # Re-read what the row contributes now, votes counted since this
+        # instance was loaded included
+        rows = list(Choice.objects.select_for_update().filter(pk=self.pk)
+                    .values_list('poll_id', 'votes')[:1])
+        if rows:
+            self._counted_poll_id, self._counted_votes = rows[0]
+
+    def save(self, *args, **kwargs):
+        with joined_transaction():
+            if not (self._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields')):
+                votes_changed = self.votes != self._counted_votes
+                if votes_changed or self.poll_id != self._counted_poll_id:
+                    self._lock_counted_votes()
+                if not votes_changed:
+                    # Writing back this instance's copy of the counter could
+                    # undo votes counted since it was loaded
+                    kwargs['update_fields'] = [field.name for field in self._meta.local_fields
+                                               if not field.primary_key and field.name != 'votes']
+                    self.votes = self._counted_votes
+            super(Choice, self).save(*args, **kwargs)
+            if self._counted_poll_id == self.poll_id:
+                self._touch_poll(self.poll_id, self.votes - self._counted_votes)
+            else:
+                if self._counted_poll_id is not None:
+                    self._touch_poll(self._counted_poll_id, -self._counted_votes)
+                self._touch_poll(self.poll_id, self.votes)
+        self._remember_counted_votes()
+
+    def delete(self, *args, **kwargs):
+        with joined_transaction():
+            self._lock_counted_votes()
+            # Its shards go with it, so their votes are added to the poll's
+            # revision to keep the change marker from going back
+            pending = self.vote_shards.aggregate(votes=Sum('votes'))['votes'] or 0
+            self._touch_poll(self._counted_poll_id, -self._counted_votes, 1 + pending)
+            super(Choice, self).delete(*args, **kwargs)
+        self._remember_counted_votes()
+
     def percentage(self):
-        total_votes_on_poll = sum(c.votes for c in self.poll.choice_set.all())
-        try:
-            return round(100 * self.votes / total_votes_on_poll, 2)
-        except ZeroDivisionError:
-            return round(0, 2)
+        return _percentage(self.votes, self.poll.vote_total)
+
+
+class ChoiceVoteShard(models.Model):
+    """One of a choice's counters on a sharded poll.
+
+    Votes land on a random shard, and ``polls.votes.compact_vote_shards``
+    periodically moves them into ``Choice.votes`` and the poll's totals.
+    """
+
+    poll = models.ForeignKey(Poll)
+    choice = models.ForeignKey(Choice, related_name='vote_shards')
+    shard = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+    # Time of the last vote, for the poll's change marker
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [('choice', 'shard')]
+
+    def __str__(self):
+        return 'shard %s of choice %s' % (self.shard, self.choice_id)
+
+
+class VoteBucket(models.Model):
+    """Votes a choice got within one minute, hour or day (UTC).
+
+    Written by the vote path and rolled up by ``polls.history``; the poll
+    is the one the votes were cast in.
+    """
+
+    MINUTE, HOUR, DAY = 60, 60 * 60, 24 * 60 * 60
+    GRANULARITIES = ((MINUTE, 'minute'), (HOUR, 'hour'), (DAY, 'day'))
+
+    poll = models.ForeignKey(Poll)
+    choice = models.ForeignKey(Choice)
+    # Bucket width in seconds
+    granularity = models.PositiveIntegerField(choices=GRANULARITIES)
+    start = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('choice', 'granularity', 'start')]
+        index_together = [('poll', 'granularity', 'start'), ('granularity', 'start')]
+
+    def __str__(self):
+        return '%s votes for choice %s at %s' % (self.votes, self.choice_id, self.start)
+
+
+class SearchTerm(models.Model):
+    """One entry of the search index: a word used in a poll's question or
+    choices, weighted by how often and where. Maintained by ``polls.search``.
+    """
+
+    term = models.CharField(max_length=64)
+    poll = models.ForeignKey(Poll)
+    weight = models.IntegerField()
+
+    class Meta:
+        # Looks up a word in a set of polls
+        unique_together = [('term', 'poll')]
+        # Single word searches read the best matches straight off this
+        # index. It deliberately leaves out poll, so that it does not cover
+        # the lookups above and tempt SQLite into using it for them.
+        index_together = [('term', 'weight')]
+
+    def __str__(self):
+        return '%s in poll %s' % (self.term, self.poll_id)
+
+
+class ArchivedPoll(models.Model):
+    """A poll moved out of the live tables by ``polls.archive``, with its
+    final results in one row. Keeps the poll's id."""
+
+    id = models.IntegerField(primary_key=True)
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField('Date published')
+    archived_at = models.DateTimeField(default=timezone.now)
+    # JSON of the poll's results(), as they stood when it was archived
+    results_json = models.TextField()
+
+    def __str__(self):
+        return self.question
+
+    def results(self):
+        return json.loads(self.results_json)
+
 
+# Connect the cache invalidation, search index and SQLite connection receivers
+import polls.cache
+import polls.search
+import polls.sqlite
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(pub_date, pk):
+    """Opaque cursor pointing just after the poll with this ``(pub_date, pk)``."""
+    delta = pub_date - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+    return '%d-%d' % (microseconds, pk)
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``.
+
+    Raises ``ValueError`` (or ``OverflowError`` for absurd timestamps) when
+    the cursor is garbage.
+    """
+    microseconds, pk = cursor.rsplit('-', 1)
+    return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+
+
+def keyset_page(queryset, cursor, per_page):
+    """Return one page of ``queryset`` in ``(pub_date, id)`` order.
+
+    Instead of an ``OFFSET``, the page starts strictly after the row the
+    cursor points at, which the ``(pub_date, id)`` index can seek to directly
+    however deep the page is. Returns the page's objects and the cursor for
+    the next page, or ``None`` on the last page.
+    """
+    queryset = queryset.order_by('pub_date', 'id')
+    if cursor:
+        pub_date, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk))
+    # One extra row tells us whether there is a next page
+    objects = list(queryset[:per_page + 1])
+    if len(objects) <= per_page:
+        return objects, None
+    objects = objects[:per_page]
+    return objects, encode_cursor(objects[-1].pub_date, objects[-1].pk)
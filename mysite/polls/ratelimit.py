@@ -0,0 +1,108 @@
+"""Token-bucket rate limiting of votes, shared by all processes on a host.
+
+Buckets live in a memory-mapped file of fixed-size slots, so every worker
+process on the host sees the same counts. A client's key hashes to a slot,
+which is guarded by a byte-range lock on that slot alone. When two keys
+hash to the same slot, the newcomer takes it over with a full bucket,
+which can only ever let a client through early, never block one wrongly.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are still shared between threads
+    fcntl = None
+
+_SLOT = struct.Struct('=Qdd')  # key hash, tokens, last update
+
+
+class TokenBucketStore(object):
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * _SLOT.size
+        if os.fstat(self._fd).st_size != size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def take(self, key, rate, burst):
+        """Take a token from ``key``'s bucket.
+
+        The bucket holds up to ``burst`` tokens and refills at ``rate`` per
+        second. Returns 0 if a token was taken, otherwise the number of
+        seconds until one will be available.
+        """
+        digest = int.from_bytes(hashlib.md5(key.encode('UTF-8')).digest()[:8], 'big')
+        offset = (digest % self.slots) * _SLOT.size
+        now = time.time()
+        # POSIX record locks are per process, hence the thread lock as well
+        with self._thread_lock:
+            if fcntl:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, _SLOT.size, offset)
+            try:
+                stored, tokens, updated = _SLOT.unpack_from(self._map, offset)
+                if stored != digest:
+                    tokens = burst
+                else:
+                    tokens = min(burst, tokens + max(0, now - updated) * rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0
+                else:
+                    wait = (1 - tokens) / rate
+                _SLOT.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                if fcntl:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, _SLOT.size, offset)
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TokenBucketStore(settings.POLLS_VOTE_RATE_LIMIT_FILE,
+                                      settings.POLLS_VOTE_RATE_LIMIT_SLOTS)
+    return _store
+
+
+def _client(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def rate_limit_votes(view):
+    """Answer POSTs over ``POLLS_VOTE_RATE_LIMITS`` with a 429 before the view
+    runs. Each limit is ``(scope, tokens per second, burst)``, the scope
+    being 'client' (all of a client's votes) or 'client-poll' (a client's
+    votes on one poll)."""
+    @wraps(view)
+    def wrapper(request, poll_id, *args, **kwargs):
+        if request.method == 'POST' and settings.POLLS_VOTE_RATE_LIMITS:
+            store = get_store()
+            for scope, rate, burst in settings.POLLS_VOTE_RATE_LIMITS:
+                key = _client(request)
+                if scope == 'client-poll':
+                    key = '%s|%s' % (key, poll_id)
+                wait = store.take('%s:%s' % (scope, key), rate, burst)
+                if wait:
+                    response = HttpResponse('Too many votes, slow down', status=429)
+                    response['Retry-After'] = str(int(math.ceil(wait)))
+                    return response
+        return view(request, poll_id, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,48 @@
+"""Send polls reads to a replica database while keeping writes on primary.
+
+Reads only go to the replica while a request has opted in through
+``use_replica()`` (``ReplicaRoutingMiddleware`` does so for GET and HEAD
+requests). The first write in a request sends all its later reads back to
+the primary, so a request always sees its own writes. Everything outside a
+request, e.g. management commands, stays on the primary.
+"""
+import threading
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+def use_replica(enabled=True):
+    _state.use_replica = enabled
+    _state.wrote = False
+
+
+def wrote_to_primary():
+    return getattr(_state, 'wrote', False)
+
+
+def _replica_alias():
+    alias = settings.POLLS_REPLICA_DATABASE
+    return alias if alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'polls' and getattr(_state, 'use_replica', False):
+            return _replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == 'polls':
+            _state.use_replica = False
+            _state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        replica = _replica_alias()
+        if set([obj1._state.db, obj2._state.db]) <= set([None, 'default', replica]):
+            return True
+        return None
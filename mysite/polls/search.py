@@ -0,0 +1,194 @@
+"""Search over poll questions and choices, through an inverted index.
+
+``SearchTerm`` holds one row per distinct word per poll, weighted by its
+occurrences: ``QUESTION_WEIGHT`` per use in the question and 1 per use in a
+choice. The rows of a poll are rewritten whenever the poll or one of its
+choices is saved or deleted, in the same transaction; ``deferred_indexing()``
+rewrites them once for a whole batch of edits. Votes are counted with
+``UPDATE`` and do not touch the index.
+
+A one-word search reads the best matches in order from the ``(term,
+weight)`` index, so it costs the same at any number of polls. With several
+words, every poll must contain all of them: the best ``MAX_CANDIDATES``
+matches of the rarest word are looked up for the others through the
+``(term, poll)`` index, which bounds the work however common the words
+are. The commonest English words are not indexed at all.
+"""
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from polls.models import Choice, Poll, SearchTerm, joined_transaction
+
+QUESTION_WEIGHT = 3
+MAX_QUERY_TERMS = 8
+# Polls considered for a search of several words
+MAX_CANDIDATES = 1000
+STOP_WORDS = frozenset((
+    'a an and are as at be by for from has have in is it its of on or that '
+    'the to was were will with'
+).split())
+# Keeps ``poll__in`` lists below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+# Polls to reindex at the end of deferred_indexing(), and polls being
+# deleted, per thread
+_deferred = threading.local()
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(text):
+    """The indexed words of ``text``, lower-cased, in order of use."""
+    max_length = SearchTerm._meta.get_field('term').max_length
+    return [word[:max_length] for word in _word_re.findall(text.lower())
+            if word not in STOP_WORDS]
+
+
+def _poll_terms(question, choices):
+    weights = Counter()
+    for term in terms(question):
+        weights[term] += QUESTION_WEIGHT
+    for choice in choices:
+        weights.update(terms(choice))
+    return weights
+
+
+def _write_index(batch):
+    questions = dict(Poll.objects.filter(pk__in=batch).values_list('pk', 'question'))
+    choices = dict((poll_id, []) for poll_id in questions)
+    for poll_id, choice in Choice.objects.filter(poll__in=batch).values_list('poll_id', 'choice'):
+        choices[poll_id].append(choice)
+    SearchTerm.objects.filter(poll__in=batch).delete()
+    SearchTerm.objects.bulk_create([
+        SearchTerm(term=term, poll_id=poll_id, weight=weight)
+        for poll_id, question in questions.items()
+        for term, weight in _poll_terms(question, choices[poll_id]).items()
+    ], batch_size=BATCH_SIZE)
+
+
+def index_polls(poll_ids):
+    """Rewrite the index entries of the given polls; deleted polls just
+    lose theirs.
+
+    Inside a managed transaction the entries are written as part of it: a
+    nested ``commit_on_success`` would commit the caller's transaction
+    early. Otherwise each batch of polls is rewritten in a transaction of
+    its own.
+    """
+    poll_ids = list(set(poll_ids))
+    for start in range(0, len(poll_ids), BATCH_SIZE):
+        batch = poll_ids[start:start + BATCH_SIZE]
+        with joined_transaction():
+            _write_index(batch)
+
+
+@contextmanager
+def deferred_indexing():
+    """Reindex the polls saved or deleted within the block once, at its end,
+    rather than on every save of the poll and each of its choices."""
+    outermost = not hasattr(_deferred, 'poll_ids')
+    if outermost:
+        _deferred.poll_ids = set()
+    try:
+        yield
+        if outermost:
+            index_polls(_deferred.poll_ids)
+    finally:
+        if outermost:
+            del _deferred.poll_ids
+
+
+def _deleting_polls():
+    if not hasattr(_deferred, 'deleting'):
+        _deferred.deleting = set()
+    return _deferred.deleting
+
+
+def _index_later(poll_ids):
+    if hasattr(_deferred, 'poll_ids'):
+        _deferred.poll_ids.update(poll_ids)
+    else:
+        index_polls(poll_ids)
+
+
+def search(query, page, per_page):
+    """One page (counted from 1) of the polls matching every word of
+    ``query``, best match first.
+
+    Returns the page's polls and whether there is a next page.
+    """
+    words = []
+    for term in terms(query):
+        if term not in words:
+            words.append(term)
+    words = words[:MAX_QUERY_TERMS]
+    if not words:
+        return [], False
+
+    # One extra row tells us whether there is a next page
+    start, stop = (page - 1) * per_page, page * per_page + 1
+    if len(words) == 1:
+        poll_ids = list(SearchTerm.objects.filter(term=words[0]).order_by('-weight', '-id')
+                        .values_list('poll', flat=True)[start:stop])
+    else:
+        poll_ids = _match_all(words)[start:stop]
+    polls = Poll.objects.in_bulk(poll_ids[:per_page])
+    return [polls[pk] for pk in poll_ids[:per_page] if pk in polls], len(poll_ids) > per_page
+
+
+def _match_all(words):
+    # Start from the best postings of the rarest word, then look the other
+    # words up in just those polls, so common words cost no more than rare
+    # ones. Counting stops at MAX_CANDIDATES: beyond that, only the rarest
+    # word's MAX_CANDIDATES best matches are considered.
+    postings = SearchTerm.objects.all()
+    sizes = dict((word, postings.filter(term=word)[:MAX_CANDIDATES].count()) for word in words)
+    words.sort(key=sizes.get)
+    if not sizes[words[0]]:
+        return []
+    scores = dict(postings.filter(term=words[0]).order_by('-weight', '-id')
+                  .values_list('poll', 'weight')[:MAX_CANDIDATES])
+    for word in words[1:]:
+        if not scores:
+            break
+        candidates = list(scores)
+        found = {}
+        for offset in range(0, len(candidates), BATCH_SIZE):
+            found.update(postings.filter(term=word, poll__in=candidates[offset:offset + BATCH_SIZE])
+                         .values_list('poll', 'weight'))
+        scores = dict((poll_id, scores[poll_id] + weight) for poll_id, weight in found.items())
+    return sorted(scores, key=lambda poll_id: (-scores[poll_id], -poll_id))
+
+
+@receiver(post_save, sender=Poll)
+def _index_poll(sender, instance, **kwargs):
+    _index_later([instance.pk])
+
+
+@receiver(pre_delete, sender=Poll)
+def _poll_deleting(sender, instance, **kwargs):
+    # Its entries go with it by cascade: the deletes of its choices, which
+    # come first, need not reindex it
+    _deleting_polls().add(instance.pk)
+
+
+@receiver(post_delete, sender=Poll)
+def _poll_deleted(sender, instance, **kwargs):
+    _deleting_polls().discard(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def _index_choice_poll(sender, instance, **kwargs):
+    poll_ids = [instance.poll_id]
+    if instance._counted_poll_id not in (None, instance.poll_id):
+        # The choice moved to another poll
+        poll_ids.append(instance._counted_poll_id)
+    deleting = _deleting_polls()
+    poll_ids = [poll_id for poll_id in poll_ids if poll_id not in deleting]
+    if poll_ids:
+        _index_later(poll_ids)
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent once votes have been committed. ``counts`` maps
+# ``(poll_id, choice_id)`` to the number of votes added.
+votes_recorded = Signal(providing_args=['counts'])
@@ -1,3 +1,22 @@
+from polls.tests.test_admin import *
+from polls.tests.test_archive import *
+from polls.tests.test_benchmark import *
+from polls.tests.test_buffer import *
+from polls.tests.test_bulk_import import *
+from polls.tests.test_cache import *
+from polls.tests.test_dedup import *
+from polls.tests.test_export import *
 from polls.tests.test_forms import *
+from polls.tests.test_history import *
+from polls.tests.test_live import *
+from polls.tests.test_middleware import *
 from polls.tests.test_models import *
-from polls.tests.test_views import *
\ No newline at end of file
+from polls.tests.test_query_budgets import *
+from polls.tests.test_ratelimit import *
+from polls.tests.test_routers import *
+from polls.tests.test_search import *
+from polls.tests.test_sqlite import *
+from polls.tests.test_trending import *
+from polls.tests.test_upgrade import *
+from polls.tests.test_views import *
+from polls.tests.test_votes import *
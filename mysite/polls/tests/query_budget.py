@@ -0,0 +1,25 @@
+"""Assertions on the SQL cost of a block of code."""
+from contextlib import contextmanager
+
+from polls.instrumentation import QueryRecorder
+
+
+class QueryBudgetMixin(object):
+    """For ``TestCase`` subclasses: ``assertQueryBudget`` fails when the code
+    in its block runs more statements or fetches more rows than allowed,
+    listing every statement with the rows it returned."""
+
+    @contextmanager
+    def assertQueryBudget(self, queries=None, rows=None, using='default', msg=None):
+        with QueryRecorder(using) as recorder:
+            yield recorder
+        overruns = []
+        if queries is not None and recorder.count > queries:
+            overruns.append('%d queries over a budget of %d' % (recorder.count, queries))
+        if rows is not None and recorder.rows > rows:
+            overruns.append('%d rows fetched over a budget of %d' % (recorder.rows, rows))
+        if overruns:
+            lines = ['%s%s:' % (msg + ': ' if msg else '', ', '.join(overruns))]
+            lines.extend('%3d. [%d rows] %s' % (i, query['rows'], query['sql'])
+                         for i, query in enumerate(recorder.queries, 1))
+            self.fail('\n'.join(lines))
@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll
+
+
+class PollAdminTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'adm1n')
+        self.client.login(username='admin', password='adm1n')
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        for i in range(3):
+            Choice(poll=self.poll, choice='choice %d' % (i, ), votes=i).save()
+
+    def get_change_page(self):
+        return self.client.get(reverse('admin:polls_poll_change', args=[self.poll.id]))
+
+    def count_changelist_queries(self):
+        # connection.queries is reset when the request starts
+        response = self.client.get(reverse('admin:polls_poll_changelist'), {'o': '-3'})
+        self.assertEqual(response.status_code, 200)
+        return len(connection.queries)
+
+    @override_settings(DEBUG=True)
+    def test_changelist_queries_do_not_grow_with_polls(self):
+        few = self.count_changelist_queries()
+        for i in range(30):
+            Poll(question='poll %d' % (i, ), pub_date=timezone.now(), vote_total=i).save()
+        self.assertEqual(self.count_changelist_queries(), few)
+
+    def test_changelist_shows_vote_totals(self):
+        response = self.client.get(reverse('admin:polls_poll_changelist'))
+        self.assertContains(response, '<td>3</td>', html=True)
+
+    def test_small_polls_edit_choices_inline(self):
+        response = self.get_change_page()
+        self.assertEqual(len(response.context['inline_admin_formsets']), 1)
+        self.assertContains(response, 'Edit the 3 choices of this poll')
+
+    @override_settings(POLLS_ADMIN_INLINE_CHOICES=2)
+    def test_large_polls_link_to_the_choice_changelist(self):
+        response = self.get_change_page()
+        self.assertEqual(response.context['inline_admin_formsets'], [])
+        url = '%s?poll__id__exact=%d' % (reverse('admin:polls_choice_changelist'), self.poll.id)
+        self.assertContains(response, url)
+
+        # Saving the poll leaves its choices alone
+        response = self.client.post(
+            reverse('admin:polls_poll_change', args=[self.poll.id]),
+            {'question': 'Edited', 'pub_date_0': '2013-09-01', 'pub_date_1': '12:00:00',
+             'counter_shards': '0'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Choice.objects.filter(poll=self.poll).count(), 3)
+
+    def test_choice_changelist_filters_by_poll(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        Choice(poll=other_poll, choice='PM').save()
+
+        response = self.client.get(reverse('admin:polls_choice_changelist'),
+                                   {'poll__id__exact': self.poll.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_choice_votes_are_read_only(self):
+        choice = Choice.objects.get(poll=self.poll, choice='choice 2')
+        Choice.objects.filter(pk=choice.id).update(votes=5)
+        response = self.client.post(
+            reverse('admin:polls_choice_change', args=[choice.id]),
+            {'poll': self.poll.id, 'choice': 'Edited', 'votes': '0'})
+
+        self.assertEqual(response.status_code, 302)
+        choice = Choice.objects.get(pk=choice.id)
+        self.assertEqual((choice.choice, choice.votes), ('Edited', 5))
+        self.assertEqual(self.get_change_page().context['inline_admin_formsets'][0]
+                         .readonly_fields, ['votes'])
+
+    def test_deleting_selected_choices_keeps_the_vote_total(self):
+        choice = Choice.objects.get(poll=self.poll, choice='choice 2')
+        response = self.client.post(reverse('admin:polls_choice_changelist'), {
+            'action': 'delete_selected', '_selected_action': [choice.id], 'post': 'yes'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Choice.objects.filter(pk=choice.id).exists())
+        poll = Poll.objects.get(pk=self.poll.id)
+        self.assertEqual(poll.vote_total, 1)
+        self.assertEqual(poll.results()['total_votes'], 1)
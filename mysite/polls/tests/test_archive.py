@@ -0,0 +1,109 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from polls.archive import archive_chunk, archive_polls
+from polls.history import record_votes
+from polls.models import ArchivedPoll, Choice, ChoiceVoteShard, Poll, SearchTerm, VoteBucket
+from polls.votes import record_vote
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.old_polls = []
+        for i in range(3):
+            poll = Poll(question='old poll %d' % (i, ), pub_date=now - timedelta(days=400 + i))
+            poll.save()
+            Choice(poll=poll, choice='yes', votes=3).save()
+            Choice(poll=poll, choice='no', votes=1).save()
+            self.old_polls.append(poll)
+        self.new_poll = Poll(question='new poll', pub_date=now)
+        self.new_poll.save()
+        self.cutoff = now - timedelta(days=365)
+
+    def test_old_polls_move_to_the_archive(self):
+        choice = self.old_polls[0].choice_set.all()[0]
+        record_votes({(self.old_polls[0].id, choice.id): 1})
+
+        self.assertEqual(archive_polls(self.cutoff), 3)
+
+        self.assertEqual(list(Poll.objects.all()), [self.new_poll])
+        self.assertFalse(Choice.objects.exists())
+        self.assertFalse(VoteBucket.objects.exists())
+        self.assertFalse(SearchTerm.objects.exclude(poll=self.new_poll).exists())
+        archived = ArchivedPoll.objects.get(pk=self.old_polls[0].id)
+        self.assertEqual(archived.question, 'old poll 0')
+        self.assertEqual(archived.pub_date, self.old_polls[0].pub_date)
+        results = archived.results()
+        self.assertEqual(results['total_votes'], 4)
+        self.assertEqual([(c['choice'], c['votes'], c['percentage']) for c in results['choices']],
+                         [('yes', 3, 75.0), ('no', 1, 25.0)])
+
+    def test_votes_still_in_counter_shards_are_archived(self):
+        poll = self.old_polls[0]
+        poll.counter_shards = 2
+        poll.save()
+        record_vote(poll.id, poll.choice_set.all()[0].id)
+        archive_polls(self.cutoff)
+
+        self.assertEqual(ArchivedPoll.objects.get(pk=poll.id).results()['total_votes'], 5)
+        self.assertFalse(ChoiceVoteShard.objects.exists())
+
+    def test_chunks_take_the_oldest_polls_first(self):
+        self.assertEqual(archive_chunk(self.cutoff, 2), [self.old_polls[2].id, self.old_polls[1].id])
+        self.assertEqual(archive_chunk(self.cutoff, 2), [self.old_polls[0].id])
+        self.assertEqual(archive_chunk(self.cutoff, 2), [])
+
+    def test_chunk_is_a_constant_number_of_queries(self):
+        # Newest id, polls, choices, INSERT, five DELETEs
+        with self.assertNumQueries(9):
+            archive_chunk(self.cutoff)
+
+    def test_the_newest_poll_is_never_archived(self):
+        self.assertEqual(archive_polls(timezone.now() + timedelta(days=1)), 3)
+        self.assertEqual(list(Poll.objects.all()), [self.new_poll])
+
+    def test_archived_poll_page_shows_results_without_a_form(self):
+        poll_id = self.old_polls[0].id
+        # Warm the caches, which must not be served for the archived poll
+        self.client.get('/poll/%d/' % (poll_id, ))
+        archive_polls(self.cutoff)
+
+        response = self.client.get('/poll/%d/' % (poll_id, ))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['form'])
+        content = response.content.decode('UTF-8')
+        self.assertIn('old poll 0', content)
+        self.assertIn('75 %: yes', content)
+        self.assertIn('This poll is closed', content)
+
+        response = self.client.post('/poll/%d/' % (poll_id, ), data={'vote': '1'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/poll/%d/' % (poll_id + 100, )).status_code, 404)
+
+    def test_archived_poll_results_json(self):
+        poll_id = self.old_polls[0].id
+        archive_polls(self.cutoff)
+
+        response = self.client.get('/poll/%d/results.json' % (poll_id, ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('UTF-8'))['total_votes'], 4)
+        response = self.client.get('/poll/%d/results.json' % (poll_id, ),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_votes_for_archived_choices_are_rejected(self):
+        choice = self.old_polls[0].choice_set.all()[0]
+        archive_polls(self.cutoff)
+        self.assertFalse(record_vote(self.old_polls[0].id, choice.id))
+
+    def test_command_archives_by_age(self):
+        out = StringIO()
+        call_command('archive_polls', days=402, stdout=out)
+        self.assertEqual(ArchivedPoll.objects.count(), 1)
+        self.assertIn('Archived 1 polls', out.getvalue())
@@ -0,0 +1,73 @@
+import random
+
+from django.test import TestCase
+from mock import patch
+from polls.benchmark import percentile, run_read_benchmark, run_shard_benchmark, seed
+from polls.instrumentation import QueryRecorder
+from polls.models import Choice, Poll
+
+
+class QueryRecorderTest(TestCase):
+
+    def test_records_statements_and_rows_without_debug(self):
+        seed(3, 2, 10, rng=random.Random(0))
+
+        with QueryRecorder() as recorder:
+            list(Choice.objects.all())
+            Poll.objects.count()
+
+        self.assertEqual(recorder.count, 2)
+        self.assertEqual([q['rows'] for q in recorder.queries], [6, 1])
+        self.assertEqual(recorder.rows, 7)
+        self.assertIn('polls_choice', recorder.queries[0]['sql'])
+        self.assertEqual(len(recorder.slowest(1)), 1)
+
+    def test_stops_recording_on_exit(self):
+        with QueryRecorder() as recorder:
+            Poll.objects.count()
+        Poll.objects.count()
+        self.assertEqual(recorder.count, 1)
+
+
+class ReadBenchmarkTest(TestCase):
+
+    def test_seed_spreads_votes_over_choices(self):
+        poll_ids = seed(4, 3, 25, rng=random.Random(0))
+
+        self.assertEqual(len(poll_ids), 4)
+        self.assertEqual(Choice.objects.count(), 12)
+        for poll in Poll.objects.all():
+            self.assertEqual(poll.vote_total, 25)
+
+    def test_benchmark_reports_latency_percentiles_and_costs(self):
+        poll_ids = seed(5, 3, 10, rng=random.Random(0))
+
+        results = run_read_benchmark(poll_ids, requests=4, rng=random.Random(0))
+
+        for view in ('home', 'poll'):
+            self.assertEqual(results[view]['requests'], 4)
+            self.assertEqual(results[view]['statuses'], [200])
+            self.assertEqual(sorted(results[view]['latency_ms']), ['p50', 'p95', 'p99'])
+            self.assertTrue(results[view]['queries_per_request'] >= 1)
+
+    def test_percentile_is_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 0.5), 50)
+        self.assertEqual(percentile(samples, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+
+
+class ShardBenchmarkTest(TestCase):
+
+    # Worker threads get their own connections, which cannot see the test
+    # database, so the votes themselves are left out
+    @patch('polls.benchmark.record_vote')
+    def test_reports_throughput_per_shard_count_and_cleans_up(self, record_vote):
+        report = run_shard_benchmark([0, 4], threads=2, seconds=0.05)
+
+        self.assertEqual(sorted(report), [0, 4])
+        self.assertTrue(report[4]['votes_per_second'] > 0)
+        self.assertEqual(report[4]['errors'], 0)
+        self.assertTrue(record_vote.called)
+        self.assertFalse(Poll.objects.exists())
@@ -0,0 +1,95 @@
+import threading
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls import buffer
+from polls.buffer import VoteBuffer
+from polls.models import Choice, Poll
+from polls.votes import apply_vote_counts, record_vote
+
+
+class ApplyVoteCountsTest(TestCase):
+
+    def test_counts_are_applied_as_grouped_updates(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        poll2 = Poll(question='time', pub_date=timezone.now())
+        poll2.save()
+        choice1 = Choice(poll=poll1, choice='42')
+        choice1.save()
+        choice2 = Choice(poll=poll1, choice='41')
+        choice2.save()
+        choice3 = Choice(poll=poll2, choice='PM')
+        choice3.save()
+
+        # Two choices share an increment, so 2 choice UPDATEs + 2 poll UPDATEs
+        with self.assertNumQueries(4):
+            apply_vote_counts({
+                (poll1.id, choice1.id): 3,
+                (poll1.id, choice2.id): 3,
+                (poll2.id, choice3.id): 5,
+            })
+
+        self.assertEqual([c.votes for c in Choice.objects.order_by('pk')], [3, 3, 5])
+        self.assertEqual(Poll.objects.get(pk=poll1.id).vote_total, 6)
+        self.assertEqual(Poll.objects.get(pk=poll2.id).vote_total, 5)
+
+
+class VoteBufferTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+
+    def test_votes_are_written_once_the_buffer_is_full(self):
+        vote_buffer = VoteBuffer(max_pending=3, max_staleness=60)
+        vote_buffer.add(self.poll.id, self.choice.id)
+        vote_buffer.add(self.poll.id, self.choice.id)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 0)
+        self.assertEqual(vote_buffer.pending(), 2)
+
+        vote_buffer.add(self.poll.id, self.choice.id)
+
+        self.assertEqual(vote_buffer.pending(), 0)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 3)
+        self.assertEqual(Poll.objects.get(pk=self.poll.id).vote_total, 3)
+
+    def test_votes_are_written_once_they_get_stale(self):
+        flushed = threading.Event()
+        vote_buffer = VoteBuffer(max_pending=100, max_staleness=0.01)
+        with patch('polls.votes.apply_vote_counts', side_effect=lambda counts: flushed.set()) as apply:
+            vote_buffer.add(self.poll.id, self.choice.id)
+            self.assertTrue(flushed.wait(5))
+        apply.assert_called_once_with({(self.poll.id, self.choice.id): 1})
+
+    def test_failed_flush_keeps_the_votes(self):
+        vote_buffer = VoteBuffer(max_pending=100, max_staleness=60)
+        vote_buffer.add(self.poll.id, self.choice.id)
+        with patch('polls.votes.apply_vote_counts', side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, vote_buffer.flush)
+        self.assertEqual(vote_buffer.pending(), 1)
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 1)
+
+    @override_settings(POLLS_VOTE_BUFFER_ENABLED=True)
+    def test_buffered_view_vote_is_written_on_flush(self):
+        self.addCleanup(setattr, buffer, '_buffer', None)
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 0)
+
+        buffer.get_vote_buffer().flush()
+
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 1)
+
+    @override_settings(POLLS_VOTE_BUFFER_ENABLED=True)
+    def test_buffered_vote_is_still_scoped_to_the_poll(self):
+        self.addCleanup(setattr, buffer, '_buffer', None)
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        self.assertFalse(record_vote(other_poll.id, self.choice.id))
+        self.assertEqual(buffer.get_vote_buffer().pending(), 0)
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+from mock import patch
+from polls import bulk_import
+from polls.bulk_import import InvalidRecord, iter_csv, iter_jsonl
+from polls.export import iter_csv as export_csv, iter_jsonl as export_jsonl
+from polls.models import ArchivedPoll, Choice, Poll
+from polls.search import search
+
+
+def jsonl(count, start=0):
+    return ''.join(json.dumps({
+        'question': 'poll %d' % (i, ),
+        'pub_date': '2013-09-01T12:00:00+00:00',
+        'choices': [{'choice': 'yes', 'votes': i}, {'choice': 'no', 'votes': 1}],
+    }) + '\n' for i in range(start, start + count))
+
+
+class ParseTest(TestCase):
+
+    def test_jsonl(self):
+        polls = list(iter_jsonl(StringIO(jsonl(2) + '\n')))
+        self.assertEqual([poll['question'] for poll in polls], ['poll 0', 'poll 1'])
+        self.assertEqual(polls[1]['choices'], [('yes', 1), ('no', 1)])
+        self.assertTrue(timezone.is_aware(polls[0]['pub_date']))
+
+    def test_csv_rows_are_grouped_by_poll(self):
+        rows = StringIO(
+            'poll_id,question,pub_date,choice_id,choice,votes\n'
+            '7,Lunch?,2013-09-01 12:00:00,1,Pizza,3\n'
+            '7,Lunch?,2013-09-01 12:00:00,2,Salad,\n'
+            '9,"Empty, for now",2013-09-02 12:00:00,,,\n')
+        polls = list(iter_csv(rows))
+        self.assertEqual([(poll['question'], poll['choices']) for poll in polls], [
+            ('Lunch?', [('Pizza', 3), ('Salad', 0)]),
+            ('Empty, for now', []),
+        ])
+
+    def test_bad_records_are_reported_by_number(self):
+        lines = StringIO(jsonl(1) + '{"question": "when", "pub_date": "soon"}\n')
+        with self.assertRaises(InvalidRecord) as cm:
+            list(iter_jsonl(lines))
+        self.assertEqual(cm.exception.record, 2)
+        with self.assertRaises(InvalidRecord):
+            list(iter_csv(StringIO('question,pub_date\n')))
+
+
+class ImportPollsCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def import_polls(self, path, **options):
+        out = StringIO()
+        call_command('import_polls', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_imports_polls_and_choices_in_chunks(self):
+        existing = Poll(question='already here', pub_date=timezone.now())
+        existing.save()
+        path = self.write('polls.jsonl', jsonl(5))
+
+        with patch('polls.bulk_import.import_chunk', wraps=bulk_import.import_chunk) as chunk:
+            output = self.import_polls(path, chunk_size=2)
+
+        self.assertEqual(chunk.call_count, 3)
+        self.assertIn('2 polls done', output)
+        self.assertIn('Imported 5 polls', output)
+        polls = list(Poll.objects.exclude(pk=existing.pk).order_by('pk'))
+        self.assertEqual([poll.question for poll in polls], ['poll %d' % (i, ) for i in range(5)])
+        self.assertEqual([poll.vote_total for poll in polls], [1, 2, 3, 4, 5])
+        self.assertEqual([c.votes for c in Choice.objects.filter(poll=polls[3]).order_by('pk')],
+                         [3, 1])
+        # Imported polls are searchable
+        self.assertEqual(search('poll 4', 1, 10)[0], [polls[4]])
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_chunk_is_a_constant_number_of_queries(self):
+        polls = list(iter_jsonl(StringIO(jsonl(100))))
+        # Three id lookups and two INSERTs (batched to SQLite's parameter
+        # limit), then the search index
+        with patch('polls.bulk_import.index_polls'):
+            with self.assertNumQueries(5):
+                bulk_import.import_chunk(polls[:10])
+
+    def test_never_reuses_archived_poll_ids(self):
+        ArchivedPoll.objects.create(id=50, question='archived', pub_date=timezone.now(),
+                                    results_json='{}')
+        poll_ids = bulk_import.import_chunk(list(iter_jsonl(StringIO(jsonl(2)))))
+        self.assertEqual(poll_ids, [51, 52])
+
+    def assert_round_trips(self, name, export):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        Choice(poll=poll, choice='42', votes=3).save()
+        path = self.write(name, ''.join(export()))
+        self.import_polls(path)
+
+        copy = Poll.objects.exclude(pk=poll.pk).get()
+        self.assertEqual((copy.question, copy.pub_date, copy.vote_total),
+                         (poll.question, poll.pub_date, 3))
+        self.assertEqual(list(copy.choice_set.values_list('choice', 'votes')), [('42', 3)])
+
+    def test_round_trips_a_csv_export(self):
+        self.assert_round_trips('export.csv', export_csv)
+
+    def test_round_trips_a_json_lines_export(self):
+        self.assert_round_trips('export.jsonl', export_jsonl)
+
+    def test_points_json_arrays_to_json_lines(self):
+        with self.assertRaisesRegexp(CommandError, '--format jsonl'):
+            self.import_polls(self.write('export.json', '[]'))
+
+    def test_resumes_after_a_bad_record(self):
+        path = self.write('polls.jsonl', jsonl(3) + 'not json\n' + jsonl(2, start=3))
+        with self.assertRaises(CommandError):
+            self.import_polls(path, chunk_size=2)
+        # The first chunk made it; the second failed while being read
+        self.assertEqual(Poll.objects.count(), 2)
+
+        self.write('polls.jsonl', jsonl(5))
+        output = self.import_polls(path, chunk_size=2)
+        self.assertIn('Resuming after 2 polls', output)
+        self.assertEqual(list(Poll.objects.order_by('pk').values_list('question', flat=True)),
+                         ['poll %d' % (i, ) for i in range(5)])
+
+    def test_resume_notices_a_chunk_committed_before_a_crash(self):
+        path = self.write('polls.jsonl', jsonl(4))
+        checkpoint = bulk_import.Checkpoint(path + '.checkpoint')
+        chunk = list(iter_jsonl(StringIO(jsonl(2))))
+        bulk_import.import_chunk(chunk, lambda poll_id: checkpoint.begin(2, poll_id, chunk[0]))
+        # ...and the process died before checkpoint.commit()
+
+        self.assertIn('Resuming after 2 polls', self.import_polls(path))
+        self.assertEqual(Poll.objects.count(), 4)
+
+    def test_resume_is_not_fooled_by_a_poll_that_took_the_chunks_id(self):
+        path = self.write('polls.jsonl', jsonl(4))
+        checkpoint = bulk_import.Checkpoint(path + '.checkpoint')
+        chunk = list(iter_jsonl(StringIO(jsonl(2))))
+        # A poll created through the site between the id lookup and the
+        # INSERT makes the chunk fail
+        with self.assertRaises(IntegrityError):
+            bulk_import.import_chunk(chunk, lambda poll_id: (
+                checkpoint.begin(2, poll_id, chunk[0]),
+                Poll.objects.create(id=poll_id, question='from the site', pub_date=timezone.now())))
+
+        self.assertNotIn('Resuming', self.import_polls(path))
+        self.assertEqual(list(Poll.objects.order_by('pk').values_list('question', flat=True)),
+                         ['from the site'] + ['poll %d' % (i, ) for i in range(4)])
+
+    def test_rejects_unknown_formats(self):
+        with self.assertRaises(CommandError):
+            self.import_polls(self.write('polls.xml', ''))
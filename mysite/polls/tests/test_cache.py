@@ -0,0 +1,97 @@
+import shutil
+import tempfile
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls import cache
+from polls.models import Choice, Poll
+from polls.votes import record_vote
+
+
+class ResultsCacheTestMixin(object):
+
+    def setUp(self):
+        get_cache('default').clear()
+        cache.reset_stats()
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice.save()
+
+    def get_poll_page(self):
+        return self.client.get('/poll/%d/' % (self.poll.id, )).content.decode('UTF-8')
+
+    def test_second_view_is_served_from_the_cache(self):
+        self.get_poll_page()
+        with self.assertNumQueries(1):
+            # Only the poll itself is loaded
+            content = self.get_poll_page()
+        self.assertIn('No-one has voted on this poll yet', content)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_vote_invalidates_cached_results(self):
+        self.get_poll_page()
+        record_vote(self.poll.id, self.choice.id)
+
+        content = self.get_poll_page()
+
+        self.assertIn('100 %: 42', content)
+        self.assertIn('1 vote', content)
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2})
+
+    def test_editing_a_choice_invalidates_cached_results(self):
+        self.get_poll_page()
+        self.choice.choice = 'forty-two'
+        self.choice.save()
+
+        self.assertIn('forty-two', self.get_poll_page())
+
+    def test_choice_list_survives_votes_but_not_choice_edits(self):
+        self.assertEqual(cache.poll_choices(self.poll.id), [(self.choice.id, '42')])
+        record_vote(self.poll.id, self.choice.id)
+        with self.assertNumQueries(0):
+            cache.poll_choices(self.poll.id)
+
+        new_choice = Choice(poll=self.poll, choice='43')
+        new_choice.save()
+        self.assertEqual(cache.poll_choices(self.poll.id),
+                         [(self.choice.id, '42'), (new_choice.id, '43')])
+
+    def test_moving_a_choice_invalidates_both_polls(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        cache.poll_choices(self.poll.id)
+        cache.poll_choices(other_poll.id)
+
+        self.choice.poll = other_poll
+        self.choice.save()
+
+        self.assertEqual(cache.poll_choices(self.poll.id), [])
+        self.assertEqual(cache.poll_choices(other_poll.id), [(self.choice.id, '42')])
+
+    def test_vote_form_is_not_cached(self):
+        self.get_poll_page()
+        self.assertNotIn('csrfmiddlewaretoken', cache.results_html(self.poll))
+        self.assertIn('csrfmiddlewaretoken', self.get_poll_page())
+
+
+class LocMemResultsCacheTest(ResultsCacheTestMixin, TestCase):
+    pass
+
+
+class FileBasedResultsCacheTest(ResultsCacheTestMixin, TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': self.cache_dir,
+        }})
+        self.settings_override.enable()
+        super(FileBasedResultsCacheTest, self).setUp()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir)
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls import dedup
+from polls.dedup import BloomFilter, VoteDeduplicator
+from polls.models import Choice, Poll
+
+
+class BloomFilterTest(TestCase):
+
+    def test_added_keys_are_always_found(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('voter %d' % (i, ))
+        for i in range(1000):
+            self.assertIn('voter %d' % (i, ), bloom)
+            self.assertFalse(bloom.add('voter %d' % (i, )))
+
+    def test_false_positive_rate_is_near_the_configured_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add('voter %d' % (i, ))
+        false_positives = sum(1 for i in range(10000) if 'stranger %d' % (i, ) in bloom)
+        self.assertTrue(false_positives < 200, false_positives)
+
+    def test_memory_is_about_ten_bits_per_voter_at_one_percent(self):
+        memory = BloomFilter(1000000, 0.01).memory
+        self.assertTrue(1100000 < memory < 1300000, memory)
+
+    def test_merge_is_the_union_of_both_filters(self):
+        bloom, other = BloomFilter(1000, 0.01), BloomFilter(1000, 0.01)
+        bloom.add('alice')
+        other.add('bob')
+        bloom.merge(other)
+        self.assertIn('alice', bloom)
+        self.assertIn('bob', bloom)
+        self.assertRaises(ValueError, bloom.merge, BloomFilter(10, 0.01))
+
+    def test_round_trips_through_bytes(self):
+        bloom = BloomFilter(100, 0.01)
+        bloom.add('voter')
+        copy = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertIn('voter', copy)
+        self.assertEqual(copy.count, 1)
+
+
+class VoteDeduplicatorTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def wait_for_writer(self, deduplicator):
+        writer = deduplicator._writer
+        if writer is not None:
+            writer.join(5)
+
+    def test_second_vote_by_the_same_voter_is_rejected(self):
+        deduplicator = VoteDeduplicator(1000, 0.01, 10 ** 6)
+        self.assertTrue(deduplicator.check_and_add(1, 'ip:10.0.0.1'))
+        self.assertTrue(deduplicator.check_and_add(2, 'ip:10.0.0.1'))
+        self.assertFalse(deduplicator.check_and_add(1, 'ip:10.0.0.1'))
+
+        stats = deduplicator.stats()
+        self.assertEqual((stats['checks'], stats['rejections']), (3, 1))
+        self.assertAlmostEqual(stats['rejection_rate'], 1 / 3.0)
+
+    def test_memory_budget_evicts_least_recently_used_filters(self):
+        filter_size = BloomFilter(1000, 0.01).memory
+        deduplicator = VoteDeduplicator(1000, 0.01, 2 * filter_size, self.directory)
+        for poll_id in (1, 2, 3):
+            deduplicator.check_and_add(poll_id, 'voter')
+
+        stats = deduplicator.stats()
+        self.assertEqual(stats['polls'], 2)
+        self.assertTrue(stats['memory'] <= stats['memory_budget'])
+        # Poll 1 was evicted to disk, and still remembers its voter
+        self.assertFalse(deduplicator.check_and_add(1, 'voter'))
+        self.wait_for_writer(deduplicator)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '1.bloom')))
+
+    def test_votes_do_not_wait_for_filters_to_be_written(self):
+        deduplicator = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory, persist_every=0)
+        release = threading.Event()
+        write = deduplicator._write
+
+        def slow_write(poll_id, bloom):
+            release.wait(5)
+            return write(poll_id, bloom)
+
+        with patch.object(deduplicator, '_write', side_effect=slow_write):
+            self.assertTrue(deduplicator.check_and_add(1, 'alice'))
+            self.assertTrue(deduplicator.check_and_add(1, 'bob'))
+            self.assertFalse(os.path.exists(os.path.join(self.directory, '1.bloom')))
+            writer = deduplicator._writer
+            release.set()
+            writer.join(5)
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '1.bloom')))
+        process2 = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory)
+        self.assertFalse(process2.check_and_add(1, 'alice'))
+
+    def test_failed_write_is_retried_by_a_new_writer(self):
+        deduplicator = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory, persist_every=0)
+        with patch.object(deduplicator, '_write', side_effect=OSError):
+            with patch('polls.dedup.logger') as logger:
+                deduplicator.check_and_add(1, 'alice')
+                self.wait_for_writer(deduplicator)
+        self.assertTrue(logger.exception.called)
+        self.assertIsNone(deduplicator._writer)
+
+        deduplicator.check_and_add(1, 'bob')
+        self.wait_for_writer(deduplicator)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '1.bloom')))
+
+    def test_a_claimed_vote_counts_only_once_released_as_voted(self):
+        deduplicator = VoteDeduplicator(1000, 0.01, 10 ** 6)
+        self.assertTrue(deduplicator.claim(1, 'alice'))
+        # A second request while the first is being recorded
+        self.assertFalse(deduplicator.claim(1, 'alice'))
+        deduplicator.release(1, 'alice', False)
+
+        self.assertTrue(deduplicator.claim(1, 'alice'))
+        deduplicator.release(1, 'alice', True)
+        self.assertFalse(deduplicator.claim(1, 'alice'))
+
+    def test_persisted_filters_are_merged_across_processes(self):
+        process1 = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory)
+        process2 = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory)
+        process1.check_and_add(1, 'alice')
+        process2.check_and_add(1, 'bob')
+        process1.persist()
+        process2.persist()
+
+        process3 = VoteDeduplicator(1000, 0.01, 10 ** 6, self.directory)
+        self.assertFalse(process3.check_and_add(1, 'alice'))
+        self.assertFalse(process3.check_and_add(1, 'bob'))
+
+
+@override_settings(POLLS_VOTE_DEDUP_ENABLED=True, POLLS_VOTE_DEDUP_DIR=None)
+class DeduplicatedVotingViewTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, dedup, '_deduplicator', None)
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+
+    def vote(self, **extra):
+        return self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)},
+                                **extra)
+
+    def test_one_vote_per_ip(self):
+        self.assertEqual(self.vote().status_code, 302)
+        self.assertEqual(self.vote().status_code, 403)
+        self.assertEqual(self.vote(REMOTE_ADDR='10.0.0.2').status_code, 302)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 2)
+
+    def test_invalid_votes_do_not_use_up_the_voters_vote(self):
+        self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': '999'})
+        self.assertEqual(self.vote().status_code, 302)
+
+    def test_votes_that_were_not_counted_do_not_use_up_the_voters_vote(self):
+        with patch('polls.views.record_vote', return_value=False):
+            self.assertEqual(self.vote().status_code, 400)
+        self.assertEqual(self.vote().status_code, 302)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 1)
@@ -0,0 +1,100 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.export import iter_results
+from polls.models import Choice, ChoiceVoteShard, Poll
+
+
+@override_settings(POLLS_EXPORT_API_KEYS={'backup-key': 'backup'})
+class ExportResultsTest(TestCase):
+
+    def setUp(self):
+        self.poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll1.save()
+        Choice(poll=self.poll1, choice='42', votes=3).save()
+        Choice(poll=self.poll1, choice='The "Ultimate" Answer', votes=1).save()
+        self.poll2 = Poll(question='Nobody answers', pub_date=timezone.now())
+        self.poll2.save()
+        self.poll3 = Poll(question='time', pub_date=timezone.now())
+        self.poll3.save()
+        Choice(poll=self.poll3, choice='PM', votes=2).save()
+
+    def get_export(self, format, key='backup-key'):
+        return self.client.get('/export/results.%s' % (format, ),
+                               HTTP_AUTHORIZATION='Token %s' % (key, ))
+
+    def test_export_requires_an_api_key(self):
+        for key in ('', 'wrong-key'):
+            response = self.get_export('csv', key)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def test_staff_users_can_export(self):
+        User.objects.create_user('editor', 'editor@example.com', 'ed1tor')
+        self.client.login(username='editor', password='ed1tor')
+        self.assertEqual(self.get_export('csv', '').status_code, 401)
+
+        User.objects.filter(username='editor').update(is_staff=True)
+        self.assertEqual(self.get_export('csv', '').status_code, 200)
+
+    def test_results_are_read_in_chunks_of_polls(self):
+        # Two queries per chunk of two polls, plus the empty chunk at the end
+        with self.assertNumQueries(5):
+            results = list(iter_results(chunk_size=2))
+
+        self.assertEqual([poll['question'] for poll in results],
+                         ['6 times 7', 'Nobody answers', 'time'])
+        self.assertEqual([c['votes'] for c in results[0]['choices']], [3, 1])
+        self.assertEqual(results[1]['choices'], [])
+        self.assertEqual([c['choice'] for c in results[2]['choices']], ['PM'])
+
+    def test_votes_held_in_counter_shards_are_exported(self):
+        choice = Choice.objects.get(choice='PM')
+        ChoiceVoteShard(poll=self.poll3, choice=choice, shard=0, votes=5).save()
+
+        results = list(iter_results())
+        self.assertEqual(results[2]['choices'][0]['votes'], 7)
+
+    def test_csv_export_streams_a_row_per_choice(self):
+        response = self.get_export('csv')
+
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode('UTF-8')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ['poll_id', 'question', 'pub_date', 'choice_id', 'choice', 'votes'])
+        self.assertEqual([(row[1], row[4], row[5]) for row in rows[1:]], [
+            ('6 times 7', '42', '3'),
+            ('6 times 7', 'The "Ultimate" Answer', '1'),
+            ('Nobody answers', '', ''),
+            ('time', 'PM', '2'),
+        ])
+
+    def test_json_export_is_a_list_of_polls(self):
+        response = self.get_export('json')
+
+        polls = json.loads(b''.join(response.streaming_content).decode('UTF-8'))
+        self.assertEqual([poll['id'] for poll in polls], [self.poll1.id, self.poll2.id, self.poll3.id])
+
+    def test_json_export_of_no_polls_is_an_empty_list(self):
+        Poll.objects.all().delete()
+        response = self.get_export('json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content).decode('UTF-8')), [])
+
+    def test_json_lines_export_has_a_line_per_poll(self):
+        response = self.get_export('jsonl')
+        lines = b''.join(response.streaming_content).decode('UTF-8').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [self.poll1.id, self.poll2.id, self.poll3.id])
+
+    def test_management_command_writes_the_export(self):
+        out = StringIO()
+        call_command('export_results', format='json', chunk_size=1, stdout=out)
+        self.assertEqual(len(json.loads(out.getvalue())), 3)
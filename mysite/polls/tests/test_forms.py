@@ -51,3 +51,34 @@ class PollsVoteFormTest(TestCase):
         content = response.content.decode('UTF-8').replace('&#39;', "'")
         self.assertIn(choice1.choice, content)
         self.assertIn(choice2.choice, content)
+
+    def test_form_validates_votes_against_the_polls_choices(self):
+        poll1 = Poll(question='time', pub_date=timezone.now())
+        poll1.save()
+        choice1 = Choice(poll=poll1, choice='PM', votes=0)
+        choice1.save()
+        poll2 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll2.save()
+        choice2 = Choice(poll=poll2, choice='42', votes=0)
+        choice2.save()
+        PollVoteForm(poll=poll1)
+
+        with self.assertNumQueries(0):
+            form = PollVoteForm(poll=poll1, data={'vote': str(choice1.id)})
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['vote'], choice1.id)
+
+        self.assertFalse(PollVoteForm(poll=poll1, data={'vote': str(choice2.id)}).is_valid())
+        self.assertFalse(PollVoteForm(poll=poll1, data={'vote': 'x'}).is_valid())
+        self.assertFalse(PollVoteForm(poll=poll1, data={}).is_valid())
+
+    def test_invalid_vote_is_rejected_without_touching_the_database(self):
+        poll1 = Poll(question='time', pub_date=timezone.now())
+        poll1.save()
+        Choice(poll=poll1, choice='PM', votes=0).save()
+        self.client.get('/poll/%d/' % (poll1.id, ))
+
+        # Just the lookup telling the unknown choice apart from an unknown poll
+        with self.assertNumQueries(1):
+            response = self.client.post('/poll/%d/' % (poll1.id, ), data={'vote': '999'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls import history
+from polls.cache import invalidate_choices
+from polls.history import (
+    bucket_start, choose_granularity, get_history_buffer, record_votes, rollup, vote_history)
+from polls.models import Choice, Poll, VoteBucket
+from polls.votes import apply_vote_counts, compact_vote_shards, record_vote
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@override_settings(POLLS_VOTE_HISTORY_ENABLED=True, POLLS_VOTE_HISTORY_MAX_STALENESS=60)
+class VoteHistoryTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self.discard_history_buffer)
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42')
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='41')
+        self.choice2.save()
+
+    def discard_history_buffer(self):
+        if history._buffer is not None:
+            history._buffer._reset()
+            history._buffer = None
+
+    def buckets(self, granularity):
+        return list(VoteBucket.objects.filter(granularity=granularity)
+                    .order_by('start', 'choice').values_list('start', 'choice_id', 'votes'))
+
+    def test_bucket_start_truncates_in_utc(self):
+        moment = utc(2013, 9, 1, 17, 42, 31, 5)
+        self.assertEqual(bucket_start(moment, VoteBucket.MINUTE), utc(2013, 9, 1, 17, 42))
+        self.assertEqual(bucket_start(moment, VoteBucket.HOUR), utc(2013, 9, 1, 17))
+        self.assertEqual(bucket_start(moment, VoteBucket.DAY), utc(2013, 9, 1))
+        local = moment.astimezone(timezone.get_default_timezone())
+        self.assertEqual(bucket_start(local, VoteBucket.DAY), utc(2013, 9, 1))
+
+    def test_votes_are_counted_into_the_current_minute(self):
+        with patch('polls.history.timezone.now', return_value=utc(2013, 9, 1, 17, 42, 5)):
+            record_vote(self.poll.id, self.choice1.id)
+            record_vote(self.poll.id, self.choice1.id)
+        with patch('polls.history.timezone.now', return_value=utc(2013, 9, 1, 17, 43, 5)):
+            record_vote(self.poll.id, self.choice1.id)
+        self.assertFalse(VoteBucket.objects.exists())
+
+        # Both minutes in one flush: a lookup, a check of the new buckets'
+        # choices and an INSERT each
+        with self.assertNumQueries(6):
+            self.assertEqual(get_history_buffer().flush(), 3)
+        self.assertEqual(self.buckets(VoteBucket.MINUTE), [
+            (utc(2013, 9, 1, 17, 42), self.choice1.id, 2),
+            (utc(2013, 9, 1, 17, 43), self.choice1.id, 1),
+        ])
+
+    def test_batches_are_written_as_one_upsert(self):
+        now = utc(2013, 9, 1, 17, 42, 5)
+        record_votes({(self.poll.id, self.choice1.id): 2}, now=now)
+        # A lookup, an UPDATE for the existing bucket, and a check of the
+        # choice and an INSERT for the new one
+        with self.assertNumQueries(4):
+            record_votes({(self.poll.id, self.choice1.id): 3,
+                          (self.poll.id, self.choice2.id): 4}, now=now)
+        self.assertEqual(self.buckets(VoteBucket.MINUTE), [
+            (utc(2013, 9, 1, 17, 42), self.choice1.id, 5),
+            (utc(2013, 9, 1, 17, 42), self.choice2.id, 4),
+        ])
+
+    def test_sharded_votes_are_counted_when_cast(self):
+        Poll.objects.filter(pk=self.poll.id).update(counter_shards=2)
+        invalidate_choices(self.poll.id)
+        with patch('polls.history.timezone.now', return_value=utc(2013, 9, 1, 17, 42, 5)):
+            record_vote(self.poll.id, self.choice1.id)
+        get_history_buffer().flush()
+        compact_vote_shards()
+
+        self.assertEqual(self.buckets(VoteBucket.MINUTE), [
+            (utc(2013, 9, 1, 17, 42), self.choice1.id, 1),
+        ])
+
+    def test_moved_choice_adds_to_its_existing_bucket(self):
+        now = utc(2013, 9, 1, 17, 42, 5)
+        record_votes({(self.poll.id, self.choice1.id): 2}, now=now)
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        record_votes({(other_poll.id, self.choice1.id): 3}, now=now)
+        self.assertEqual(self.buckets(VoteBucket.MINUTE), [
+            (utc(2013, 9, 1, 17, 42), self.choice1.id, 5),
+        ])
+
+    def test_votes_for_choices_deleted_before_the_flush_are_dropped(self):
+        with patch('polls.history.timezone.now', return_value=utc(2013, 9, 1, 17, 42, 5)):
+            record_vote(self.poll.id, self.choice1.id)
+            record_vote(self.poll.id, self.choice2.id)
+        self.choice2.delete()
+
+        self.assertEqual(get_history_buffer().flush(), 2)
+        self.assertEqual(self.buckets(VoteBucket.MINUTE), [
+            (utc(2013, 9, 1, 17, 42), self.choice1.id, 1),
+        ])
+
+    def test_a_failing_insert_is_retried_once(self):
+        with patch.object(VoteBucket.objects, 'bulk_create', side_effect=IntegrityError) as insert:
+            with self.assertRaises(IntegrityError):
+                record_votes({(self.poll.id, self.choice1.id): 1})
+        self.assertEqual(insert.call_count, 2)
+
+    def test_rejected_votes_are_not_recorded(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        record_vote(other_poll.id, self.choice1.id)
+        self.assertEqual(get_history_buffer().flush(), 0)
+        self.assertFalse(VoteBucket.objects.exists())
+
+    def test_history_can_be_turned_off(self):
+        with self.settings(POLLS_VOTE_HISTORY_ENABLED=False):
+            record_vote(self.poll.id, self.choice1.id)
+            apply_vote_counts({(self.poll.id, self.choice2.id): 3})
+        self.assertIsNone(history._buffer)
+
+    def test_rollup_sums_minutes_into_hours_and_days(self):
+        record_votes({(self.poll.id, self.choice1.id): 1}, now=utc(2013, 9, 1, 17, 1))
+        record_votes({(self.poll.id, self.choice1.id): 2}, now=utc(2013, 9, 1, 17, 59))
+        record_votes({(self.poll.id, self.choice2.id): 4}, now=utc(2013, 9, 1, 18, 30))
+        rollup(now=utc(2013, 9, 1, 18, 31))
+
+        self.assertEqual(self.buckets(VoteBucket.HOUR), [
+            (utc(2013, 9, 1, 17), self.choice1.id, 3),
+            (utc(2013, 9, 1, 18), self.choice2.id, 4),
+        ])
+        self.assertEqual(self.buckets(VoteBucket.DAY), [
+            (utc(2013, 9, 1), self.choice1.id, 3),
+            (utc(2013, 9, 1), self.choice2.id, 4),
+        ])
+
+    def test_rollup_recomputes_the_partial_bucket(self):
+        record_votes({(self.poll.id, self.choice1.id): 1}, now=utc(2013, 9, 1, 17, 1))
+        rollup(now=utc(2013, 9, 1, 17, 2))
+        record_votes({(self.poll.id, self.choice1.id): 2}, now=utc(2013, 9, 1, 17, 30))
+        rollup(now=utc(2013, 9, 1, 17, 31))
+
+        self.assertEqual(self.buckets(VoteBucket.HOUR), [(utc(2013, 9, 1, 17), self.choice1.id, 3)])
+        self.assertEqual(self.buckets(VoteBucket.DAY), [(utc(2013, 9, 1), self.choice1.id, 3)])
+
+    def test_rollup_drops_rolled_up_buckets_past_retention(self):
+        with self.settings(POLLS_VOTE_HISTORY_MINUTE_RETENTION=60 * 60,
+                           POLLS_VOTE_HISTORY_HOUR_RETENTION=24 * 60 * 60):
+            record_votes({(self.poll.id, self.choice1.id): 1}, now=utc(2013, 9, 1, 10))
+            record_votes({(self.poll.id, self.choice1.id): 1}, now=utc(2013, 9, 2, 10))
+            record_votes({(self.poll.id, self.choice1.id): 1}, now=utc(2013, 9, 2, 10, 30))
+            result = rollup(now=utc(2013, 9, 2, 10, 31))
+
+        self.assertEqual(result['pruned_minutes'], 1)
+        self.assertEqual(result['pruned_hours'], 1)
+        self.assertEqual([start for start, choice_id, votes in self.buckets(VoteBucket.MINUTE)],
+                         [utc(2013, 9, 2, 10), utc(2013, 9, 2, 10, 30)])
+        self.assertEqual(self.buckets(VoteBucket.HOUR), [(utc(2013, 9, 2, 10), self.choice1.id, 2)])
+        self.assertEqual(self.buckets(VoteBucket.DAY), [
+            (utc(2013, 9, 1), self.choice1.id, 1),
+            (utc(2013, 9, 2), self.choice1.id, 2),
+        ])
+
+    def test_granularity_follows_range_and_retention(self):
+        now = utc(2013, 9, 10, 12)
+        with self.settings(POLLS_VOTE_HISTORY_MAX_POINTS=500):
+            self.assertEqual(choose_granularity(now - timedelta(hours=2), now, now=now),
+                             VoteBucket.MINUTE)
+            # 2 days of minutes is more than 500 points
+            self.assertEqual(choose_granularity(now - timedelta(days=2), now, now=now),
+                             VoteBucket.HOUR)
+            self.assertEqual(choose_granularity(now - timedelta(days=30), now, now=now),
+                             VoteBucket.DAY)
+        with self.settings(POLLS_VOTE_HISTORY_MINUTE_RETENTION=60 * 60):
+            self.assertEqual(choose_granularity(now - timedelta(hours=2), now, now=now),
+                             VoteBucket.HOUR)
+
+    def test_history_reads_one_granularity(self):
+        record_votes({(self.poll.id, self.choice1.id): 1,
+                      (self.poll.id, self.choice2.id): 2}, now=utc(2013, 9, 1, 17, 1))
+        record_votes({(self.poll.id, self.choice1.id): 3}, now=utc(2013, 9, 1, 18, 1))
+        rollup(now=utc(2013, 9, 1, 18, 2))
+
+        with self.assertNumQueries(1):
+            history = vote_history(self.poll.id, utc(2013, 9, 1, 17, 30), utc(2013, 9, 1, 19),
+                                   granularity=VoteBucket.HOUR)
+        self.assertEqual(history, {'granularity': VoteBucket.HOUR, 'buckets': [
+            {'start': utc(2013, 9, 1, 17), 'votes': {self.choice1.id: 1, self.choice2.id: 2}},
+            {'start': utc(2013, 9, 1, 18), 'votes': {self.choice1.id: 3}},
+        ]})
+        minutes = vote_history(self.poll.id, utc(2013, 9, 1, 17, 30), utc(2013, 9, 1, 19),
+                               granularity=VoteBucket.MINUTE)
+        self.assertEqual(minutes['buckets'], [
+            {'start': utc(2013, 9, 1, 18, 1), 'votes': {self.choice1.id: 3}},
+        ])
+
+    def test_command_reports_rollup(self):
+        record_votes({(self.poll.id, self.choice1.id): 1})
+        out = StringIO()
+        call_command('rollup_vote_history', stdout=out)
+        self.assertIn('Wrote 1 hour and 1 day buckets', out.getvalue())
@@ -0,0 +1,104 @@
+import json
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.cache import invalidate_choices
+from polls.live import ResultsHub, results_delta
+from polls.models import Choice, Poll
+from polls.votes import record_vote
+
+
+class ResultsHubTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=1)
+        self.choice.save()
+        self.hub = ResultsHub(interval=60)
+        self.hub.subscribe(self.poll.id)
+        self.addCleanup(self.hub.unsubscribe, self.poll.id)
+
+    def test_subscribers_share_one_computation_per_interval(self):
+        # The change marker and the results, once for all subscribers
+        with self.assertNumQueries(2):
+            for subscriber in range(100):
+                revision, results = self.hub.wait(self.poll.id, None, 0)
+        self.assertEqual(results['total_votes'], 1)
+
+    def test_results_are_recomputed_only_when_the_poll_changed(self):
+        hub = ResultsHub(interval=0)
+        hub.subscribe(self.poll.id)
+        revision, results = hub.wait(self.poll.id, None, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(hub.wait(self.poll.id, revision, 0), (revision, results))
+
+        record_vote(self.poll.id, self.choice.id)
+        new_revision, new_results = hub.wait(self.poll.id, revision, 0)
+        self.assertTrue(new_revision > revision)
+        self.assertEqual(new_results['total_votes'], 2)
+
+    def test_sharded_votes_reach_subscribers_before_compaction(self):
+        Poll.objects.filter(pk=self.poll.id).update(counter_shards=4)
+        invalidate_choices(self.poll.id)
+        hub = ResultsHub(interval=0)
+        hub.subscribe(self.poll.id)
+        revision, results = hub.wait(self.poll.id, None, 0)
+
+        record_vote(self.poll.id, self.choice.id)
+        new_revision, new_results = hub.wait(self.poll.id, revision, 0)
+        self.assertTrue(new_revision > revision)
+        self.assertEqual(new_results['total_votes'], 2)
+
+    def test_unknown_poll_has_no_results(self):
+        self.hub.subscribe(999)
+        self.assertEqual(self.hub.wait(999, None, 0), (None, None))
+        self.hub.unsubscribe(999)
+
+    def test_delta_only_carries_changed_choices(self):
+        previous = {'total_votes': 3, 'choices': [{'id': 1, 'votes': 1}, {'id': 2, 'votes': 2},
+                                                  {'id': 3, 'votes': 0}]}
+        current = {'total_votes': 4, 'choices': [{'id': 1, 'votes': 1}, {'id': 2, 'votes': 3}]}
+        self.assertEqual(results_delta(previous, current),
+                         {'total_votes': 4, 'choices': [{'id': 2, 'votes': 3}], 'removed': [3]})
+        self.assertEqual(results_delta(None, current), current)
+
+
+@override_settings(POLLS_LIVE_INTERVAL=0, POLLS_LIVE_LONG_POLL_SECONDS=0)
+class LiveResultsViewTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=1)
+        self.choice.save()
+
+    @override_settings(POLLS_LIVE_STREAM_SECONDS=0)
+    def test_event_stream_starts_with_the_full_results(self):
+        response = self.client.get('/poll/%d/live/' % (self.poll.id, ))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode('UTF-8')
+        event, id_line, data_line = content.strip().split('\n')
+        self.assertEqual(event, 'event: results')
+        self.assertEqual(id_line, 'id: %d' % (Poll.objects.get(pk=self.poll.id).revision, ))
+        self.assertEqual(json.loads(data_line[len('data: '):])['total_votes'], 1)
+
+    def test_event_stream_of_unknown_poll_is_not_found(self):
+        self.assertEqual(self.client.get('/poll/999/live/').status_code, 404)
+
+    def test_long_poll_returns_results_newer_than_since(self):
+        url = '/poll/%d/live/wait/' % (self.poll.id, )
+        first = json.loads(self.client.get(url).content.decode('UTF-8'))
+        record_vote(self.poll.id, self.choice.id)
+
+        second = json.loads(self.client.get(url, {'since': first['revision']}).content.decode('UTF-8'))
+
+        self.assertTrue(second['revision'] > first['revision'])
+        self.assertEqual(second['total_votes'], 2)
+
+    def test_long_poll_rejects_garbage_revision(self):
+        url = '/poll/%d/live/wait/' % (self.poll.id, )
+        self.assertEqual(self.client.get(url, {'since': 'soon'}).status_code, 400)
@@ -0,0 +1,59 @@
+import json
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls.models import Choice, Poll
+from polls.tests.test_routers import ReplicaDatabaseTestMixin
+
+
+class QueryInstrumentationMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        Choice(poll=self.poll, choice='42', votes=1).save()
+
+    @override_settings(DEBUG=False)
+    def test_sql_cost_is_reported_in_headers_without_debug(self):
+        response = self.client.get('/')
+
+        self.assertEqual(response['X-SQL-Queries'], '1')
+        self.assertEqual(response['X-SQL-Rows'], '1')
+        self.assertIn('X-SQL-Time-Ms', response)
+
+    @override_settings(POLLS_SQL_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        response = self.client.get('/')
+        self.assertNotIn('X-SQL-Queries', response)
+
+    @override_settings(POLLS_SQL_LOG_MIN_QUERIES=1, POLLS_SQL_LOG_SLOWEST=2)
+    def test_requests_over_threshold_are_logged_with_slowest_statements(self):
+        with patch('polls.middleware.logger') as logger:
+            self.client.get('/poll/%d/' % (self.poll.id, ))
+
+        self.assertEqual(logger.info.call_count, 1)
+        stats = json.loads(logger.info.call_args[0][0])
+        self.assertEqual(stats['path'], '/poll/%d/' % (self.poll.id, ))
+        self.assertEqual(stats['status'], 200)
+        self.assertTrue(stats['queries'] >= 2)
+        self.assertEqual(len(stats['slowest']), 2)
+        self.assertIn('sql', stats['slowest'][0])
+
+    def test_requests_under_threshold_are_not_logged(self):
+        with patch('polls.middleware.logger') as logger:
+            self.client.get('/')
+        self.assertFalse(logger.info.called)
+
+
+class ReplicaQueryInstrumentationTest(ReplicaDatabaseTestMixin, TestCase):
+
+    @override_settings(POLLS_SQL_LOG_MIN_QUERIES=1)
+    def test_reads_routed_to_the_replica_are_recorded(self):
+        with patch('polls.middleware.logger') as logger:
+            response = self.client.get('/')
+
+        self.assertEqual(response['X-SQL-Queries'], '1')
+        stats = json.loads(logger.info.call_args[0][0])
+        self.assertEqual(stats['slowest'][0]['using'], 'replica')
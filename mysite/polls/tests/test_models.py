@@ -1,4 +1,5 @@
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from polls.models import Choice, Poll
 
@@ -51,6 +52,39 @@ class PollModelTest(TestCase):
 
         self.assertEqual(poll1.total_votes(), 1022)
 
+    def test_poll_results_come_from_one_query(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        choice1 = Choice(poll=poll1, choice='42', votes=1)
+        choice1.save()
+        choice2 = Choice(poll=poll1, choice='The Ultimate Answer', votes=3)
+        choice2.save()
+
+        with self.assertNumQueries(1):
+            results = poll1.results()
+
+        self.assertEqual(results['total_votes'], 4)
+        self.assertEqual(
+            [(c['id'], c['choice'], c['votes'], c['percentage']) for c in results['choices']],
+            [(choice1.id, '42', 1, 25.0), (choice2.id, 'The Ultimate Answer', 3, 75.0)],
+        )
+
+    def test_saving_a_stale_poll_keeps_votes_counted_since_it_was_loaded(self):
+        poll = Poll(question="where", pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='here')
+        choice.save()
+
+        stale_poll = Poll.objects.get(pk=poll.id)
+        Choice.objects.filter(pk=choice.id).update(votes=1)
+        Poll.objects.filter(pk=poll.id).update(vote_total=1)
+        stale_poll.question = 'where exactly'
+        stale_poll.save()
+
+        poll_from_db = Poll.objects.get(pk=poll.id)
+        self.assertEqual(poll_from_db.question, 'where exactly')
+        self.assertEqual(poll_from_db.vote_total, 1)
+
 
 class ChoiceModelTest(TestCase):
 
@@ -81,3 +115,96 @@ class ChoiceModelTest(TestCase):
     def test_choice_defaults(self):
         choice = Choice()
         self.assertEqual(choice.votes, 0)
+
+    def test_poll_vote_total_follows_choice_changes(self):
+        poll1 = Poll(question="where", pub_date=timezone.now())
+        poll1.save()
+        choice1 = Choice(poll=poll1, choice='here', votes=5)
+        choice1.save()
+        choice2 = Choice(poll=poll1, choice='there', votes=2)
+        choice2.save()
+
+        self.assertEqual(Poll.objects.get(pk=poll1.id).vote_total, 7)
+
+        choice1.delete()
+        self.assertEqual(Poll.objects.get(pk=poll1.id).vote_total, 2)
+
+        poll2 = Poll(question="when", pub_date=timezone.now())
+        poll2.save()
+        choice2.poll = poll2
+        choice2.save()
+        self.assertEqual(Poll.objects.get(pk=poll1.id).vote_total, 0)
+        self.assertEqual(Poll.objects.get(pk=poll2.id).vote_total, 2)
+
+    def test_saving_a_stale_choice_keeps_votes_counted_since_it_was_loaded(self):
+        poll = Poll(question="where", pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='here', votes=1000000)
+        choice.save()
+
+        stale_choice = Choice.objects.get(pk=choice.id)
+        Choice.objects.filter(pk=choice.id).update(votes=1000003)
+        Poll.objects.filter(pk=poll.id).update(vote_total=1000003)
+        stale_choice.choice = 'right here'
+        stale_choice.save()
+
+        choice_from_db = Choice.objects.get(pk=choice.id)
+        self.assertEqual(choice_from_db.choice, 'right here')
+        self.assertEqual(choice_from_db.votes, 1000003)
+        self.assertEqual(Poll.objects.get(pk=poll.id).vote_total, 1000003)
+
+    def test_explicit_vote_count_on_a_stale_choice_keeps_the_poll_total_right(self):
+        poll = Poll(question="where", pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='here', votes=10)
+        choice.save()
+        Choice(poll=poll, choice='there', votes=5).save()
+
+        stale_choice = Choice.objects.get(pk=choice.id)
+        Choice.objects.filter(pk=choice.id).update(votes=13)
+        Poll.objects.filter(pk=poll.id).update(vote_total=18)
+        stale_choice.votes = 0
+        stale_choice.save()
+        self.assertEqual(Choice.objects.get(pk=choice.id).votes, 0)
+        self.assertEqual(Poll.objects.get(pk=poll.id).vote_total, 5)
+
+        Choice.objects.filter(pk=choice.id).update(votes=2)
+        Poll.objects.filter(pk=poll.id).update(vote_total=7)
+        stale_choice.delete()
+        self.assertEqual(Poll.objects.get(pk=poll.id).vote_total, 5)
+
+    def test_total_votes_does_not_load_choices(self):
+        poll1 = Poll(question="where", pub_date=timezone.now())
+        poll1.save()
+        Choice(poll=poll1, choice='here', votes=3).save()
+
+        poll_from_db = Poll.objects.get(pk=poll1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(poll_from_db.total_votes(), 3)
+
+
+class ChoiceTransactionTest(TransactionTestCase):
+
+    def test_saving_a_choice_leaves_the_callers_transaction_open(self):
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.commit_on_success():
+                poll = Poll(question="What's up?", pub_date=timezone.now())
+                poll.save()
+                Choice(poll=poll, choice='Not much').save()
+                1 / 0
+
+        self.assertFalse(Poll.objects.exists())
+        self.assertFalse(Choice.objects.exists())
+
+    def test_deleting_a_choice_leaves_the_callers_transaction_open(self):
+        poll = Poll(question="What's up?", pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='Not much', votes=2)
+        choice.save()
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.commit_on_success():
+                Choice.objects.get(pk=choice.pk).delete()
+                1 / 0
+
+        self.assertTrue(Choice.objects.filter(pk=choice.pk).exists())
+        self.assertEqual(Poll.objects.get(pk=poll.pk).vote_total, 2)
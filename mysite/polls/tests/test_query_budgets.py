@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+from polls.models import Choice, Poll
+from polls.tests.query_budget import QueryBudgetMixin
+
+CHOICE_COUNTS = (1, 10, 100, 1000)
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+
+    def test_overruns_fail_listing_the_statements(self):
+        Poll(question='6 times 7', pub_date=timezone.now()).save()
+        with self.assertRaises(AssertionError) as cm:
+            with self.assertQueryBudget(queries=1, rows=0, msg='listing'):
+                list(Poll.objects.all())
+                Poll.objects.count()
+        message = str(cm.exception)
+        self.assertIn('listing: 2 queries over a budget of 1, 2 rows fetched over a budget of 0',
+                      message)
+        self.assertIn('[1 rows] SELECT', message)
+        self.assertIn('COUNT(*)', message)
+
+    def test_within_budget_passes(self):
+        with self.assertQueryBudget(queries=1, rows=0) as recorder:
+            list(Poll.objects.all())
+        self.assertEqual(recorder.count, 1)
+
+
+class PageQueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Rendering cost of the pages for polls with more and more choices."""
+
+    def make_poll(self, choices):
+        poll = Poll(question='%d choices' % (choices, ), pub_date=timezone.now())
+        poll.save()
+        Choice.objects.bulk_create([Choice(poll=poll, choice='choice %d' % (i, ), votes=i)
+                                    for i in range(choices)])
+        Poll.objects.filter(pk=poll.pk).update(vote_total=sum(range(choices)))
+        return poll
+
+    def test_home(self):
+        for choices in CHOICE_COUNTS:
+            self.make_poll(choices)
+            # The page of polls plus the row telling whether there is a next
+            with self.assertQueryBudget(queries=1, rows=settings.POLLS_PER_PAGE + 1,
+                                        msg='home with %d choices' % (choices, )):
+                self.assertEqual(self.client.get('/').status_code, 200)
+
+    def test_poll(self):
+        for choices in CHOICE_COUNTS:
+            poll = self.make_poll(choices)
+            url = '/poll/%d/' % (poll.id, )
+            # Cold caches: the poll, its results and its choices for the
+            # form, each in one query; the page lists every choice twice
+            with self.assertQueryBudget(queries=3, rows=1 + 2 * choices,
+                                        msg='poll with %d choices, cold' % (choices, )):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            with self.assertQueryBudget(queries=1, rows=1,
+                                        msg='poll with %d choices, warm' % (choices, )):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_poll_results_json(self):
+        for choices in CHOICE_COUNTS:
+            poll = self.make_poll(choices)
+            # The change marker, the poll and its results
+            with self.assertQueryBudget(queries=3, rows=2 + choices,
+                                        msg='results with %d choices' % (choices, )):
+                self.client.get('/poll/%d/results.json' % (poll.id, ))
+
+    def test_choice_percentages_with_the_poll_joined(self):
+        for choices in CHOICE_COUNTS:
+            poll = self.make_poll(choices)
+            with self.assertQueryBudget(queries=1, rows=choices,
+                                        msg='percentages of %d choices' % (choices, )):
+                for choice in Choice.objects.filter(poll=poll).select_related('poll'):
+                    choice.percentage()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls import ratelimit
+from polls.models import Choice, Poll
+from polls.ratelimit import TokenBucketStore
+
+
+class TokenBucketStoreTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'buckets')
+
+    def test_burst_then_refill_at_rate(self):
+        store = TokenBucketStore(self.path, 64)
+        with patch('polls.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual([store.take('client', 0.5, 2) for i in range(2)], [0, 0])
+            self.assertEqual(store.take('client', 0.5, 2), 2.0)
+        with patch('polls.ratelimit.time.time', return_value=1002.0):
+            self.assertEqual(store.take('client', 0.5, 2), 0)
+            self.assertTrue(store.take('client', 0.5, 2) > 0)
+
+    def test_buckets_are_separate_per_key(self):
+        store = TokenBucketStore(self.path, 64)
+        store.take('alice', 0.001, 1)
+        self.assertTrue(store.take('alice', 0.001, 1) > 0)
+        self.assertEqual(store.take('bob', 0.001, 1), 0)
+
+    def test_buckets_are_shared_through_the_file(self):
+        # Two stores on one file stand in for two worker processes
+        TokenBucketStore(self.path, 64).take('client', 0.001, 1)
+        self.assertTrue(TokenBucketStore(self.path, 64).take('client', 0.001, 1) > 0)
+
+
+class RateLimitedVotingTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(setattr, ratelimit, '_store', None)
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+
+    def vote(self):
+        return self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+
+    def test_votes_over_the_limit_get_429_without_touching_the_database(self):
+        with self.settings(POLLS_VOTE_RATE_LIMITS=(('client-poll', 0.01, 2), ),
+                           POLLS_VOTE_RATE_LIMIT_FILE=os.path.join(self.directory, 'buckets')):
+            self.assertEqual(self.vote().status_code, 302)
+            self.assertEqual(self.vote().status_code, 302)
+            with self.assertNumQueries(0):
+                response = self.vote()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '100')
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 2)
+
+    @override_settings(POLLS_VOTE_RATE_LIMITS=(('client', 0.01, 1), ))
+    def test_page_views_are_not_limited(self):
+        with self.settings(POLLS_VOTE_RATE_LIMIT_FILE=os.path.join(self.directory, 'buckets')):
+            for i in range(3):
+                self.assertEqual(self.client.get('/poll/%d/' % (self.poll.id, )).status_code, 200)
@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls import routers
+from polls.models import Choice, Poll
+from polls.routers import PrimaryReplicaRouter
+
+
+class ReplicaDatabaseTestMixin(object):
+    """Adds a second SQLite file as the 'replica' database for one test."""
+
+    def setUp(self):
+        fd, self.replica_file = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        settings.DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': self.replica_file,
+        }
+        call_command('syncdb', database='replica', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        connections['replica'].close()
+        del settings.DATABASES['replica']
+        delattr(connections._connections, 'replica')
+        os.remove(self.replica_file)
+        routers.use_replica(False)
+
+
+class PrimaryReplicaRouterTest(ReplicaDatabaseTestMixin, TestCase):
+
+    def test_reads_use_the_replica_only_when_enabled(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Poll), None)
+
+        routers.use_replica()
+        self.assertEqual(router.db_for_read(Poll), 'replica')
+        self.assertEqual(router.db_for_read(Choice), 'replica')
+
+    def test_other_apps_are_left_alone(self):
+        from django.contrib.auth.models import User
+        routers.use_replica()
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(User), None)
+
+    def test_a_write_sends_later_reads_to_the_primary(self):
+        router = PrimaryReplicaRouter()
+        routers.use_replica()
+        self.assertEqual(router.db_for_write(Choice), None)
+        self.assertEqual(router.db_for_read(Poll), None)
+        self.assertTrue(routers.wrote_to_primary())
+
+    def test_no_replica_configured_means_primary(self):
+        routers.use_replica()
+        with override_settings(POLLS_REPLICA_DATABASE='elsewhere'):
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(Poll), None)
+
+
+class ReplicaRoutingMiddlewareTest(ReplicaDatabaseTestMixin, TestCase):
+
+    def setUp(self):
+        super(ReplicaRoutingMiddlewareTest, self).setUp()
+        self.poll = Poll(question='on the primary', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+        Poll(question='on the replica', pub_date=timezone.now()).save(using='replica')
+
+    def test_home_page_reads_from_the_replica(self):
+        content = self.client.get('/').content.decode('UTF-8')
+        self.assertIn('on the replica', content)
+        self.assertNotIn('on the primary', content)
+
+    def test_voter_sticks_to_the_primary(self):
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+        self.assertEqual(response.cookies[settings.POLLS_REPLICA_STICKY_COOKIE]['max-age'],
+                         settings.POLLS_REPLICA_STICKY_SECONDS)
+
+        content = self.client.get('/').content.decode('UTF-8')
+        self.assertIn('on the primary', content)
+
+    @override_settings(POLLS_REPLICA_STICKY_SECONDS=0)
+    def test_stickiness_can_be_turned_off(self):
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+        self.assertNotIn(settings.POLLS_REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertIn('on the replica', self.client.get('/').content.decode('UTF-8'))
+
+    def lag_replica(self):
+        # The replica has the poll and its first choice, but none of the
+        # votes or later choices
+        Poll(id=self.poll.id, question='on the replica', pub_date=self.poll.pub_date).save(
+            using='replica')
+        Choice.objects.db_manager('replica').bulk_create([
+            Choice(id=self.choice.id, poll_id=self.poll.id, choice='42')])
+
+    def test_results_read_from_the_replica_are_not_cached(self):
+        self.lag_replica()
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+        self.assertEqual(response.status_code, 302)
+
+        # Another visitor renders the results first, reading the replica
+        Client().get('/poll/%d/' % (self.poll.id, ))
+        content = self.client.get('/poll/%d/' % (self.poll.id, )).content.decode('UTF-8')
+        self.assertIn('1 vote', content)
+        self.assertNotIn('No-one has voted', content)
+
+    def test_choices_read_from_the_replica_are_not_cached(self):
+        self.lag_replica()
+        choice = Choice(poll=self.poll, choice='43')
+        choice.save()
+
+        Client().get('/poll/%d/' % (self.poll.id, ))
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(choice.id)})
+        self.assertEqual(response.status_code, 302)
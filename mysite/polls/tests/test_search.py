@@ -0,0 +1,173 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch
+from polls.models import Choice, Poll, SearchTerm
+from polls import search as search_module
+from polls.search import deferred_indexing, search, terms
+from polls.votes import record_vote
+
+
+class SearchIndexTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='Favourite colour of the sky?', pub_date=timezone.now())
+        self.poll.save()
+
+    def index(self, poll):
+        return dict(SearchTerm.objects.filter(poll=poll).values_list('term', 'weight'))
+
+    def test_terms_are_lower_cased_words_without_stop_words(self):
+        self.assertEqual(terms('What is the Answer, to LIFE?'), ['what', 'answer', 'life'])
+
+    def test_question_and_choices_are_indexed_with_weights(self):
+        Choice(poll=self.poll, choice='Blue').save()
+        Choice(poll=self.poll, choice='Sky blue').save()
+        self.assertEqual(self.index(self.poll),
+                         {'favourite': 3, 'colour': 3, 'sky': 4, 'blue': 2})
+
+    def test_index_follows_edits_and_deletes(self):
+        choice = Choice(poll=self.poll, choice='Blue')
+        choice.save()
+        choice.choice = 'Grey'
+        choice.save()
+        self.assertNotIn('blue', self.index(self.poll))
+        self.assertIn('grey', self.index(self.poll))
+
+        self.poll.question = 'Weather'
+        self.poll.save()
+        self.assertEqual(self.index(self.poll), {'weather': 3, 'grey': 1})
+
+        choice.delete()
+        self.assertEqual(self.index(self.poll), {'weather': 3})
+        self.poll.delete()
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_moved_choice_is_reindexed_in_both_polls(self):
+        other_poll = Poll(question='Weather', pub_date=timezone.now())
+        other_poll.save()
+        choice = Choice(poll=self.poll, choice='Grey')
+        choice.save()
+        choice.poll = other_poll
+        choice.save()
+        self.assertNotIn('grey', self.index(self.poll))
+        self.assertIn('grey', self.index(other_poll))
+
+    def test_votes_do_not_touch_the_index(self):
+        choice = Choice(poll=self.poll, choice='Blue')
+        choice.save()
+        SearchTerm.objects.all().delete()
+        record_vote(self.poll.id, choice.id)
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_deferred_indexing_reindexes_each_poll_once(self):
+        with patch('polls.search.index_polls', wraps=search_module.index_polls) as index_polls:
+            with deferred_indexing():
+                self.poll.question = 'Weather'
+                self.poll.save()
+                for choice in ('Grey', 'Blue', 'Sky blue'):
+                    Choice(poll=self.poll, choice=choice).save()
+                self.assertFalse(index_polls.called)
+        index_polls.assert_called_once_with(set([self.poll.id]))
+        self.assertEqual(self.index(self.poll), {'weather': 3, 'grey': 1, 'blue': 2, 'sky': 1})
+
+    def test_deleting_a_poll_does_not_reindex_it_per_choice(self):
+        for choice in ('Grey', 'Blue'):
+            Choice(poll=self.poll, choice=choice).save()
+        with patch('polls.search.index_polls') as index_polls:
+            self.poll.delete()
+        self.assertFalse(index_polls.called)
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_command_rebuilds_the_index(self):
+        SearchTerm.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(self.index(self.poll), {'favourite': 3, 'colour': 3, 'sky': 3})
+        self.assertIn('Indexed 1 polls', out.getvalue())
+
+
+class SearchIndexTransactionTest(TransactionTestCase):
+
+    def test_index_is_written_in_the_transaction_of_the_choice(self):
+        poll = Poll(question='Favourite colour of the sky?', pub_date=timezone.now())
+        poll.save()
+        with patch.object(Choice, '_touch_poll', side_effect=DatabaseError):
+            self.assertRaises(DatabaseError, Choice(poll=poll, choice='Blue').save)
+
+        self.assertFalse(Choice.objects.exists())
+        self.assertEqual(Poll.objects.get(pk=poll.id).vote_total, 0)
+        self.assertNotIn('blue', SearchTerm.objects.values_list('term', flat=True))
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.polls = []
+        for question, choices in [
+            ('Best pizza topping?', ['Cheese', 'Pineapple']),
+            ('Cheese or chocolate?', ['Cheese', 'Chocolate']),
+            ('Favourite pizza place', ['Home made', 'Takeaway']),
+        ]:
+            poll = Poll(question=question, pub_date=timezone.now())
+            poll.save()
+            for choice in choices:
+                Choice(poll=poll, choice=choice).save()
+            self.polls.append(poll)
+
+    def test_single_word_is_ranked_by_weight(self):
+        polls, has_next = search('cheese', 1, 10)
+        self.assertEqual(polls, [self.polls[1], self.polls[0]])
+        self.assertFalse(has_next)
+
+    def test_every_word_must_match(self):
+        self.assertEqual(search('pizza cheese', 1, 10)[0], [self.polls[0]])
+        self.assertEqual(search('PIZZA', 1, 10)[0], [self.polls[2], self.polls[0]])
+        self.assertEqual(search('pizza sushi', 1, 10)[0], [])
+
+    def test_results_are_paged(self):
+        self.assertEqual(search('pizza', 1, 1), ([self.polls[2]], True))
+        self.assertEqual(search('pizza', 2, 1), ([self.polls[0]], False))
+        self.assertEqual(search('pizza cheese pineapple', 1, 1), ([self.polls[0]], False))
+
+    def test_empty_queries_match_nothing_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(search('the', 1, 10), ([], False))
+
+    def test_single_word_search_is_two_queries(self):
+        # The matching poll ids, then the polls
+        with self.assertNumQueries(2):
+            search('pizza', 1, 10)
+
+    def test_several_words_start_from_the_rarest(self):
+        # A capped count per word, the rarest word's polls, a lookup of the
+        # other word in those polls, then the polls
+        with self.assertNumQueries(5):
+            self.assertEqual(search('pizza cheese', 1, 10)[0], [self.polls[0]])
+        with self.assertNumQueries(2):
+            self.assertEqual(search('pizza sushi', 1, 10)[0], [])
+
+    @patch('polls.search.MAX_CANDIDATES', 1)
+    def test_candidates_are_the_best_matches_of_the_rarest_word(self):
+        poll = Poll(question='Cheese pizza, cheese pizza', pub_date=timezone.now())
+        poll.save()
+        self.assertEqual(search('pizza cheese', 1, 10)[0], [poll])
+
+    @override_settings(POLLS_PER_PAGE=1)
+    def test_search_page(self):
+        response = self.client.get('/search/', {'q': 'cheese'})
+        self.assertTemplateUsed(response, 'search.html')
+        self.assertEqual(response.context['polls'], [self.polls[1]])
+        self.assertIn('?q=cheese&amp;page=2', response.content.decode('UTF-8'))
+        response = self.client.get('/search/', {'q': 'cheese', 'page': '2'})
+        self.assertEqual(response.context['polls'], [self.polls[0]])
+        self.assertIsNone(response.context['next_page'])
+
+    def test_search_page_rejects_bad_pages(self):
+        self.assertEqual(self.client.get('/search/', {'q': 'a', 'page': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/search/', {'q': 'a', 'page': '0'}).status_code, 404)
+        self.assertEqual(self.client.get('/search/', {'q': 'a', 'page': '1000'}).status_code, 404)
@@ -0,0 +1,47 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from polls.benchmark import run_sqlite_benchmark
+from polls.models import Poll
+from polls.sqlite import PROFILES, apply_pragmas
+
+
+class SQLiteProfileTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_profile_is_applied_to_django_connections(self):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA synchronous')
+        self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        cursor.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_high_concurrency_profile_switches_files_to_wal(self):
+        db = sqlite3.connect(os.path.join(self.directory, 'wal.sqlite'))
+        apply_pragmas(db, PROFILES['high-concurrency'])
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        db.close()
+
+    def test_benchmark_reports_throughput(self):
+        report = run_sqlite_benchmark(os.path.join(self.directory, 'bench.sqlite'),
+                                      PROFILES['high-concurrency'], writers=2, readers=2,
+                                      seconds=0.1, choices=3)
+        self.assertTrue(report['votes_per_second'] > 0)
+        self.assertTrue(report['reads_per_second'] > 0)
+        self.assertEqual(report['vote_errors'], 0)
+
+
+class PollIdTest(TestCase):
+
+    def test_ids_of_deleted_polls_are_not_handed_out_again(self):
+        poll_id = Poll.objects.create(question='archived soon', pub_date=timezone.now()).pk
+        Poll.objects.filter(pk=poll_id).delete()
+        self.assertTrue(Poll.objects.create(question='new', pub_date=timezone.now()).pk > poll_id)
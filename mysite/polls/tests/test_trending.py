@@ -0,0 +1,68 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll
+from polls.trending import decay_trend_scores, top_polls
+from polls.votes import apply_vote_counts, record_vote
+
+
+@override_settings(POLLS_TRENDING_HALF_LIFE=3600, POLLS_TRENDING_MIN_SCORE=0.5)
+class TrendingTest(TestCase):
+
+    def setUp(self):
+        self.polls, self.choices = [], []
+        for i in range(3):
+            poll = Poll(question='poll %d' % (i, ), pub_date=timezone.now())
+            poll.save()
+            choice = Choice(poll=poll, choice='choice %d' % (i, ))
+            choice.save()
+            self.polls.append(poll)
+            self.choices.append(choice)
+
+    def scores(self):
+        return list(Poll.objects.order_by('pk').values_list('trend_score', flat=True))
+
+    def test_votes_raise_trend_score(self):
+        record_vote(self.polls[0].id, self.choices[0].id)
+        apply_vote_counts({(self.polls[1].id, self.choices[1].id): 4,
+                           (self.polls[0].id, self.choices[0].id): 2})
+        self.assertEqual(self.scores(), [3, 4, 0])
+
+    def test_editing_a_poll_keeps_its_score(self):
+        stale = Poll.objects.get(pk=self.polls[0].id)
+        record_vote(self.polls[0].id, self.choices[0].id)
+        stale.question = 'edited'
+        stale.save()
+        self.assertEqual(self.scores()[0], 1)
+
+    def test_decay_halves_scores_every_half_life(self):
+        apply_vote_counts({(self.polls[0].id, self.choices[0].id): 8,
+                           (self.polls[1].id, self.choices[1].id): 1})
+        self.assertEqual(decay_trend_scores(3600), 2)
+        self.assertEqual(self.scores(), [4, 0.5, 0])
+        # 0.25 is below the minimum, so it drops to 0 and is left alone after
+        self.assertEqual(decay_trend_scores(3600), 2)
+        self.assertEqual(self.scores(), [2, 0, 0])
+        self.assertEqual(decay_trend_scores(3600), 1)
+
+    def test_recent_votes_outrank_older_ones(self):
+        apply_vote_counts({(self.polls[0].id, self.choices[0].id): 10})
+        decay_trend_scores(3 * 3600)
+        apply_vote_counts({(self.polls[1].id, self.choices[1].id): 2})
+
+        self.assertEqual(top_polls('trending', 2), [self.polls[1], self.polls[0]])
+        self.assertEqual(top_polls('top', 2), [self.polls[0], self.polls[1]])
+
+    def test_top_polls_is_one_query(self):
+        with self.assertNumQueries(1):
+            top_polls('trending', 10)
+
+    def test_command_decays_scores(self):
+        apply_vote_counts({(self.polls[0].id, self.choices[0].id): 4})
+        out = StringIO()
+        call_command('decay_trend_scores', interval=7200, stdout=out)
+        self.assertEqual(self.scores()[0], 1)
+        self.assertIn('Decayed the trend scores of 1 polls', out.getvalue())
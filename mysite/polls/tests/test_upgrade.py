@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase
+from polls.models import Choice, Poll
+from polls.upgrade import upgrade_schema, upgrade_statements
+
+# The polls tables as the first version of the app created them
+OLD_SCHEMA = '''
+CREATE TABLE "polls_poll" (
+    "id" integer NOT NULL PRIMARY KEY,
+    "question" varchar(200) NOT NULL,
+    "pub_date" datetime NOT NULL
+);
+CREATE TABLE "polls_choice" (
+    "id" integer NOT NULL PRIMARY KEY,
+    "poll_id" integer NOT NULL REFERENCES "polls_poll" ("id"),
+    "choice" varchar(200) NOT NULL,
+    "votes" integer NOT NULL
+);
+CREATE INDEX "polls_choice_70f78e6b" ON "polls_choice" ("poll_id");
+INSERT INTO "polls_poll" VALUES (1, '6 times 7', '2013-09-01 12:00:00');
+INSERT INTO "polls_choice" VALUES (1, 1, '42', 3);
+INSERT INTO "polls_choice" VALUES (2, 1, '41', 1);
+'''
+
+
+class UpgradeSchemaTest(TestCase):
+
+    def setUp(self):
+        fd, self.database_file = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        db = sqlite3.connect(self.database_file)
+        db.executescript(OLD_SCHEMA)
+        db.close()
+        settings.DATABASES['old'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': self.database_file,
+        }
+        call_command('syncdb', database='old', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        connections['old'].close()
+        del settings.DATABASES['old']
+        delattr(connections._connections, 'old')
+        os.remove(self.database_file)
+
+    def test_missing_columns_and_indexes_are_added(self):
+        statements = upgrade_schema('old')
+        self.assertTrue(any('ADD COLUMN "vote_total"' in sql for sql in statements))
+        self.assertTrue(any('("pub_date", "id")' in sql for sql in statements))
+        self.assertEqual(upgrade_statements('old'), [])
+
+        poll = Poll.objects.using('old').get()
+        self.assertEqual((poll.question, poll.vote_total, poll.revision, poll.counter_shards),
+                         ('6 times 7', 0, 0, 0))
+        self.assertEqual(poll.results()['total_votes'], 4)
+        self.assertEqual(Choice.objects.using('old').filter(poll=poll).count(), 2)
+
+    def test_an_up_to_date_database_is_left_alone(self):
+        out = StringIO()
+        call_command('upgrade_polls_schema', stdout=out)
+        self.assertEqual(out.getvalue(), 'Ran 0 schema statements\n')
@@ -1,5 +1,10 @@
+import json
+from datetime import timedelta
+
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.utils import timezone
 from polls.models import Choice, Poll
 
@@ -47,6 +52,48 @@ class HomePageViewTest(TestCase):
         poll2_url = reverse('polls.views.poll', args=[poll2.id, ])
         self.assertIn(poll2_url, content)
 
+    @override_settings(POLLS_PER_PAGE=2)
+    def test_root_url_pages_through_polls_with_a_cursor(self):
+        now = timezone.now()
+        # Two polls share a pub_date, so the cursor has to break ties on id
+        polls = [Poll(question='poll %d' % (i, ), pub_date=now + timedelta(minutes=i // 2))
+                 for i in range(5)]
+        for poll in polls:
+            poll.save()
+
+        seen = []
+        url = '/'
+        while True:
+            response = self.client.get(url)
+            seen.extend(response.context['polls'])
+            next_cursor = response.context['next_cursor']
+            if next_cursor is None:
+                break
+            self.assertIn('?after=%s' % (next_cursor, ), response.content.decode('UTF-8'))
+            url = '/?after=%s' % (next_cursor, )
+
+        self.assertEqual(seen, polls)
+
+    def test_root_url_rejects_garbage_cursor(self):
+        response = self.client.get('/?after=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_root_url_lists_most_voted_and_trending_polls(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now(), vote_total=5, trend_score=1)
+        poll1.save()
+        poll2 = Poll(question='life, the universe and everything', pub_date=timezone.now(),
+                     vote_total=2, trend_score=2)
+        poll2.save()
+
+        response = self.client.get('/?sort=top')
+        self.assertEqual(list(response.context['polls']), [poll1, poll2])
+        self.assertIsNone(response.context['next_cursor'])
+        response = self.client.get('/?sort=trending')
+        self.assertEqual(list(response.context['polls']), [poll2, poll1])
+
+    def test_root_url_rejects_unknown_ordering(self):
+        self.assertEqual(self.client.get('/?sort=random').status_code, 400)
+
 
 class SinglePollViewTest(TestCase):
 
@@ -157,3 +204,194 @@ class SinglePollViewTest(TestCase):
         content = response.content.decode('UTF-8')
         self.assertIn('1 vote', content)
         self.assertNotIn('1 votes', content)
+
+    def test_vote_for_choice_of_another_poll_is_rejected(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        poll2 = Poll(question='time', pub_date=timezone.now())
+        poll2.save()
+        choice = Choice(poll=poll2, choice='PM', votes=0)
+        choice.save()
+
+        response = self.client.post('/poll/%d/' % (poll1.id, ), data={'vote': str(choice.id)})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Choice.objects.get(pk=choice.id).votes, 0)
+
+    def test_vote_on_unknown_poll_is_not_found(self):
+        response = self.client.post('/poll/999/', data={'vote': '1'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_vote_is_a_bad_request(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+
+        response = self.client.post('/poll/%d/' % (poll1.id, ), data={'vote': 'forty-two'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/poll/%d/' % (poll1.id, ), data={})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_number_of_choices(self):
+        def queries_to_render(number_of_choices):
+            poll = Poll(question='count me', pub_date=timezone.now())
+            poll.save()
+            for i in range(number_of_choices):
+                Choice(poll=poll, choice=str(i), votes=i).save()
+            connection.use_debug_cursor = True
+            try:
+                # connection.queries is reset when each request starts
+                self.client.get('/poll/%d/' % (poll.id, ))
+                return len(connection.queries)
+            finally:
+                connection.use_debug_cursor = None
+
+        self.assertEqual(queries_to_render(2), queries_to_render(50))
+
+
+@override_settings(POLLS_BULK_VOTES_API_KEYS={'kiosk-key': 'kiosk'})
+class BulkVotesViewTest(TestCase):
+
+    def setUp(self):
+        self.poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll1.save()
+        self.poll2 = Poll(question='time', pub_date=timezone.now())
+        self.poll2.save()
+        self.choice1 = Choice(poll=self.poll1, choice='42')
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll2, choice='PM')
+        self.choice2.save()
+
+    def post_votes(self, entries, key='kiosk-key'):
+        return self.client.post(reverse('polls.views.bulk_votes'), data=json.dumps(entries),
+                                content_type='application/json',
+                                HTTP_AUTHORIZATION='Token %s' % (key, ))
+
+    def test_requests_without_a_valid_api_key_are_refused(self):
+        entries = [{'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 1}]
+        self.assertEqual(self.post_votes(entries, key='wrong').status_code, 401)
+        response = self.client.post(reverse('polls.views.bulk_votes'), data=json.dumps(entries),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(Choice.objects.get(pk=self.choice1.id).votes, 0)
+
+    @override_settings(POLLS_BULK_VOTES_API_KEYS={})
+    def test_endpoint_is_disabled_without_api_keys(self):
+        entries = [{'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 1}]
+        self.assertEqual(self.post_votes(entries).status_code, 401)
+
+    @override_settings(POLLS_BULK_VOTES_MAX_COUNT=100)
+    def test_oversized_counts_and_ids_are_entry_errors(self):
+        response = self.post_votes([
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 101},
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 10 ** 20},
+            {'poll_id': self.poll1.id, 'choice_id': 10 ** 20, 'count': 1},
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 100},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content.decode('UTF-8'))
+        self.assertEqual([r['status'] for r in body['results']], ['error', 'error', 'error', 'ok'])
+        self.assertEqual(Choice.objects.get(pk=self.choice1.id).votes, 100)
+
+    @override_settings(POLLS_BULK_VOTES_MAX_REQUEST_VOTES=25)
+    def test_entries_past_the_request_vote_limit_are_skipped(self):
+        entries = [{'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 10}] * 3
+        entries.append({'poll_id': self.poll2.id, 'choice_id': self.choice2.id, 'count': 5})
+        body = json.loads(self.post_votes(entries).content.decode('UTF-8'))
+
+        self.assertEqual(body['accepted'], 25)
+        self.assertEqual([r['status'] for r in body['results']], ['ok', 'ok', 'error', 'ok'])
+        self.assertEqual(Choice.objects.get(pk=self.choice1.id).votes, 20)
+
+    def test_valid_votes_are_applied_and_invalid_ones_reported(self):
+        response = self.post_votes([
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 10},
+            {'poll_id': self.poll2.id, 'choice_id': self.choice2.id, 'count': 2},
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 5},
+            {'poll_id': self.poll1.id, 'choice_id': self.choice2.id, 'count': 1},
+            {'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 0},
+            'nonsense',
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content.decode('UTF-8'))
+        self.assertEqual(body['accepted'], 17)
+        self.assertEqual(body['rejected'], 3)
+        self.assertEqual([r['status'] for r in body['results']],
+                         ['ok', 'ok', 'ok', 'error', 'error', 'error'])
+        self.assertEqual(Choice.objects.get(pk=self.choice1.id).votes, 15)
+        self.assertEqual(Choice.objects.get(pk=self.choice2.id).votes, 2)
+        self.assertEqual(Poll.objects.get(pk=self.poll1.id).vote_total, 15)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        entries = [{'poll_id': self.poll1.id, 'choice_id': self.choice1.id, 'count': 1}] * 1000
+        # One lookup, one choice UPDATE and one poll UPDATE
+        with self.assertNumQueries(3):
+            self.post_votes(entries)
+        self.assertEqual(Choice.objects.get(pk=self.choice1.id).votes, 1000)
+
+    def test_body_must_be_a_json_list(self):
+        self.assertEqual(self.post_votes({'poll_id': 1}).status_code, 400)
+        response = self.client.post(reverse('polls.views.bulk_votes'), data='{',
+                                    content_type='application/json',
+                                    HTTP_AUTHORIZATION='Token kiosk-key')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_post_is_allowed(self):
+        self.assertEqual(self.client.get(reverse('polls.views.bulk_votes')).status_code, 405)
+
+
+class PollResultsApiTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=1)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=3)
+        self.choice2.save()
+        self.url = reverse('polls.views.poll_results', args=[self.poll.id, ])
+
+    def test_results_are_returned_as_json(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        body = json.loads(response.content.decode('UTF-8'))
+        self.assertEqual(body['question'], '6 times 7')
+        self.assertEqual(body['total_votes'], 4)
+        self.assertEqual([(c['choice'], c['votes'], c['percentage']) for c in body['choices']],
+                         [('42', 1, 25.0), ('The Ultimate Answer', 3, 75.0)])
+
+    def test_unchanged_poll_is_not_modified_after_one_query(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_supports_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_vote_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice1.id)})
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content.decode('UTF-8'))['total_votes'], 5)
+
+    def test_editing_a_choice_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.choice2.choice = 'Forty-two'
+        self.choice2.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unknown_poll_is_not_found(self):
+        url = reverse('polls.views.poll_results', args=[999, ])
+        self.assertEqual(self.client.get(url).status_code, 404)
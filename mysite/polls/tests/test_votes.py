@@ -0,0 +1,216 @@
+import os
+import tempfile
+import threading
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from mock import patch
+from polls.cache import invalidate_choices, poll_counter_shards
+from polls.models import Choice, ChoiceVoteShard, Poll, change_marker
+from polls.votes import compact_vote_shards, record_vote
+
+
+class RecordVoteTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice.save()
+
+    def test_vote_is_an_update_of_the_choice_and_the_poll_total(self):
+        # Once the poll's shard count is cached
+        poll_counter_shards(self.poll.id)
+        with self.assertNumQueries(2):
+            self.assertTrue(record_vote(self.poll.id, self.choice.id))
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 1)
+
+    def test_votes_do_not_overwrite_each_other(self):
+        # Two requests that loaded the choice before either voted used to
+        # both write back votes=1
+        stale1 = Choice.objects.get(pk=self.choice.id)
+        stale2 = Choice.objects.get(pk=self.choice.id)
+        record_vote(stale1.poll_id, stale1.id)
+        record_vote(stale2.poll_id, stale2.id)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 2)
+
+    def test_vote_is_scoped_to_the_poll(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+
+        self.assertFalse(record_vote(other_poll.id, self.choice.id))
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 0)
+
+    def test_vote_updates_poll_total(self):
+        record_vote(self.poll.id, self.choice.id)
+        record_vote(self.poll.id, self.choice.id)
+        self.assertEqual(Poll.objects.get(pk=self.poll.id).vote_total, 2)
+
+    def test_rejected_vote_leaves_poll_total_alone(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        record_vote(other_poll.id, self.choice.id)
+        self.assertEqual(Poll.objects.get(pk=other_poll.id).vote_total, 0)
+
+
+class ConcurrentVotesTest(TransactionTestCase):
+    """Many threads voting at once, each on its own connection to a SQLite
+    file; the in-memory test database cannot be shared between threads."""
+
+    WRITERS, VOTES_EACH = 20, 20
+
+    def setUp(self):
+        fd, self.database_file = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        settings.DATABASES['votes'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': self.database_file,
+        }
+        call_command('syncdb', database='votes', interactive=False, verbosity=0)
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save(using='votes')
+        Choice.objects.db_manager('votes').bulk_create([Choice(poll=self.poll, choice='42')])
+        self.choice = Choice.objects.using('votes').get()
+        invalidate_choices(self.poll.id)
+
+    def tearDown(self):
+        connections['votes'].close()
+        del settings.DATABASES['votes']
+        delattr(connections._connections, 'votes')
+        os.remove(self.database_file)
+
+    def vote(self, start, errors):
+        # record_vote works on the default database: make it this thread's
+        # connection to the file
+        connections._connections.default = connections['votes']
+        try:
+            start.wait()
+            for i in range(self.VOTES_EACH):
+                if not record_vote(self.poll.id, self.choice.id):
+                    errors.append('vote %d was rejected' % (i, ))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections['votes'].close()
+            del connections._connections.default
+
+    def test_concurrent_votes_are_all_counted(self):
+        start, errors = threading.Barrier(self.WRITERS), []
+        threads = [threading.Thread(target=self.vote, args=(start, errors))
+                   for i in range(self.WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = self.WRITERS * self.VOTES_EACH
+        self.assertEqual(Choice.objects.using('votes').get().votes, expected)
+        self.assertEqual(Poll.objects.using('votes').get().vote_total, expected)
+
+
+class RebuildVoteTotalsTest(TestCase):
+
+    def test_rebuild_recomputes_totals_from_choices(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        Choice(poll=poll, choice='42', votes=4).save()
+        Choice(poll=poll, choice='41', votes=1).save()
+        empty_poll = Poll(question='time', pub_date=timezone.now(), vote_total=9)
+        empty_poll.save()
+        Poll.objects.filter(pk=poll.id).update(vote_total=0)
+
+        call_command('rebuild_vote_totals', stdout=StringIO())
+
+        self.assertEqual(Poll.objects.get(pk=poll.id).vote_total, 5)
+        self.assertEqual(Poll.objects.get(pk=empty_poll.id).vote_total, 0)
+
+
+class ShardedVoteTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now(), counter_shards=4)
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+        poll_counter_shards(self.poll.id)
+
+    def test_votes_land_on_shards_and_are_summed_on_read(self):
+        with patch('polls.votes.random.randrange', side_effect=[0, 3, 3]):
+            for i in range(3):
+                self.assertTrue(record_vote(self.poll.id, self.choice.id))
+
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 0)
+        self.assertEqual(Poll.objects.get(pk=self.poll.id).vote_total, 0)
+        self.assertEqual(list(ChoiceVoteShard.objects.order_by('shard')
+                              .values_list('shard', 'votes')), [(0, 1), (3, 2)])
+        self.assertEqual(self.poll.results()['total_votes'], 3)
+
+    def test_vote_on_an_existing_shard_is_one_update(self):
+        with patch('polls.votes.random.randrange', return_value=1):
+            record_vote(self.poll.id, self.choice.id)
+            with self.assertNumQueries(1):
+                record_vote(self.poll.id, self.choice.id)
+
+    def test_sharded_vote_is_scoped_to_the_poll(self):
+        other_poll = Poll(question='time', pub_date=timezone.now(), counter_shards=4)
+        other_poll.save()
+        self.assertFalse(record_vote(other_poll.id, self.choice.id))
+        self.assertFalse(ChoiceVoteShard.objects.exists())
+
+    def test_shard_count_changes_take_effect(self):
+        self.poll.counter_shards = 0
+        self.poll.save()
+        record_vote(self.poll.id, self.choice.id)
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 1)
+        self.assertFalse(ChoiceVoteShard.objects.exists())
+
+    def test_compaction_moves_shard_votes_into_the_totals(self):
+        for i in range(5):
+            record_vote(self.poll.id, self.choice.id)
+        revision = Poll.objects.get(pk=self.poll.id).revision
+
+        out = StringIO()
+        call_command('compact_vote_shards', stdout=out)
+
+        self.assertIn('Moved 5 votes', out.getvalue())
+        self.assertEqual(Choice.objects.get(pk=self.choice.id).votes, 5)
+        poll = Poll.objects.get(pk=self.poll.id)
+        self.assertEqual((poll.vote_total, poll.trend_score), (5, 5))
+        self.assertTrue(poll.revision > revision)
+        self.assertEqual(sum(ChoiceVoteShard.objects.values_list('votes', flat=True)), 0)
+        self.assertEqual(poll.results()['total_votes'], 5)
+        self.assertEqual(compact_vote_shards(), 0)
+
+    def test_sharded_votes_move_the_change_marker_and_compaction_keeps_it(self):
+        revision, changed_at = change_marker(self.poll.id)
+        etag = self.client.get('/poll/%d/results.json' % (self.poll.id, ))['ETag']
+        for i in range(5):
+            record_vote(self.poll.id, self.choice.id)
+
+        marker = change_marker(self.poll.id)
+        self.assertEqual(marker[0], revision + 5)
+        self.assertTrue(marker[1] >= changed_at)
+        response = self.client.get('/poll/%d/results.json' % (self.poll.id, ),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        compact_vote_shards()
+        self.assertEqual(change_marker(self.poll.id)[0], revision + 5)
+
+    def test_deleting_a_choice_with_shard_votes_does_not_move_the_marker_back(self):
+        for i in range(5):
+            record_vote(self.poll.id, self.choice.id)
+        revision = change_marker(self.poll.id)[0]
+        Choice.objects.get(pk=self.choice.id).delete()
+        self.assertTrue(change_marker(self.poll.id)[0] > revision)
+
+    def test_votes_through_the_view(self):
+        response = self.client.post('/poll/%d/' % (self.poll.id, ), data={'vote': str(self.choice.id)})
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/poll/%d/' % (self.poll.id, ))
+        self.assertIn('1 vote', response.content.decode('UTF-8'))
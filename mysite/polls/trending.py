@@ -0,0 +1,38 @@
+"""Trending and most voted polls, read from maintained scores.
+
+``Poll.vote_total`` and ``Poll.trend_score`` are both bumped by every vote
+(see ``polls.votes``). The trend score is a decayed vote count: rather than
+decaying it on every read, ``decay_trend_scores`` scales every live score
+by the same factor, which leaves the ranking as if each vote's weight had
+halved every ``POLLS_TRENDING_HALF_LIFE`` seconds since it was cast. Both
+lists are the top of an index, whatever the number of polls or votes.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from polls.models import Poll
+
+ORDERINGS = {
+    'trending': ('-trend_score', '-id'),
+    'top': ('-vote_total', '-id'),
+}
+
+
+def top_polls(ordering, limit):
+    """The first ``limit`` polls by an ``ORDERINGS`` name, in one query."""
+    return list(Poll.objects.order_by(*ORDERINGS[ordering])[:limit])
+
+
+def decay_trend_scores(elapsed):
+    """Decay every trend score by ``elapsed`` seconds' worth of half-life.
+
+    Scores decayed below ``POLLS_TRENDING_MIN_SCORE`` drop to 0, so idle
+    polls stop being rewritten. Returns the number of polls decayed.
+    """
+    factor = 0.5 ** (float(elapsed) / settings.POLLS_TRENDING_HALF_LIFE)
+    minimum = settings.POLLS_TRENDING_MIN_SCORE
+    with transaction.commit_on_success():
+        decayed = Poll.objects.filter(trend_score__gte=minimum).update(
+            trend_score=F('trend_score') * factor)
+        Poll.objects.filter(trend_score__gt=0, trend_score__lt=minimum).update(trend_score=0)
+    return decayed
@@ -0,0 +1,76 @@
+"""Bring the polls tables of an older database up to date.
+
+``syncdb`` creates the tables of new models but never alters an existing
+one, so a database created before the polls models gained their counter,
+change marker and trend columns and indexes fails on every page.
+``upgrade_schema`` adds the missing columns, with their field's default in
+every existing row, and the missing indexes. Run ``syncdb`` first so that
+the new tables exist.
+"""
+import re
+
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+
+# Names of the existing indexes of a table, by database vendor
+_INDEX_NAMES_SQL = {
+    'sqlite': "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+    'postgresql': 'SELECT indexname FROM pg_indexes WHERE tablename = %s',
+    'mysql': ('SELECT index_name FROM information_schema.statistics '
+              'WHERE table_schema = DATABASE() AND table_name = %s'),
+}
+
+
+def _literal(value):
+    # DDL cannot take query parameters
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'%s'" % (str(value).replace("'", "''"), )
+
+
+def _add_column_sql(connection, model, field):
+    sql = 'ALTER TABLE %s ADD COLUMN %s %s' % (
+        connection.ops.quote_name(model._meta.db_table),
+        connection.ops.quote_name(field.column), field.db_type(connection=connection))
+    if not field.null:
+        sql += ' NOT NULL DEFAULT %s' % (
+            _literal(field.get_db_prep_save(field.get_default(), connection=connection)), )
+    return sql
+
+
+def upgrade_statements(using=DEFAULT_DB_ALIAS):
+    """The statements adding the columns and indexes missing from the
+    existing polls tables."""
+    connection = connections[using]
+    try:
+        index_names_sql = _INDEX_NAMES_SQL[connection.vendor]
+    except KeyError:
+        raise ValueError('Upgrading %s databases is not supported' % (connection.vendor, ))
+    cursor = connection.cursor()
+    tables = set(connection.introspection.table_names(cursor))
+    statements = []
+    for model in models.get_models(models.get_app('polls')):
+        table = model._meta.db_table
+        if table not in tables:
+            continue
+        columns = set(row[0] for row in connection.introspection.get_table_description(
+            cursor, table))
+        statements.extend(_add_column_sql(connection, model, field)
+                          for field in model._meta.local_fields if field.column not in columns)
+        cursor.execute(index_names_sql, [table])
+        indexes = set(row[0] for row in cursor.fetchall())
+        for sql in connection.creation.sql_indexes_for_model(model, no_style()):
+            name = re.match(r'CREATE INDEX (\S+)', sql).group(1).strip('"`')
+            if name not in indexes:
+                statements.append(sql)
+    return statements
+
+
+def upgrade_schema(using=DEFAULT_DB_ALIAS):
+    """Run ``upgrade_statements`` in one transaction; returns them."""
+    statements = upgrade_statements(using)
+    with transaction.commit_on_success(using=using):
+        cursor = connections[using].cursor()
+        for sql in statements:
+            cursor.execute(sql)
+    return statements
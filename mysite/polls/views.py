@@ -1,25 +1,317 @@
 # Create your views here.
 
+import json
+import time
+from collections import defaultdict
+
+from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.shortcuts import render
-from django.http import HttpResponseRedirect
-from polls.models import Choice, Poll
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect,
+    StreamingHttpResponse)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from polls.cache import results_html
+from polls.dedup import get_deduplicator, voter_key
+from polls.export import EXPORT_FORMATS
+from polls.models import ArchivedPoll, Poll, change_marker
 from polls.forms import PollVoteForm
+from polls.live import hub, results_delta
+from polls.pagination import keyset_page
+from polls.ratelimit import rate_limit_votes
+from polls.search import search as search_polls
+from polls.trending import ORDERINGS, top_polls
+from polls.votes import apply_vote_counts, choice_polls, record_vote
 
 
 def home(request):
-    context = {'polls': Poll.objects.all()}
+    ordering = request.GET.get('sort')
+    if ordering:
+        if ordering not in ORDERINGS:
+            return HttpResponseBadRequest('Unknown ordering')
+        # Rankings move with every vote, so they are a single top-N page
+        context = {'polls': top_polls(ordering, settings.POLLS_PER_PAGE),
+                   'next_cursor': None, 'ordering': ordering}
+        return render(request, 'home.html', context)
+
+    polls = Poll.objects.all()
+    try:
+        polls, next_cursor = keyset_page(
+            polls, request.GET.get('after'), settings.POLLS_PER_PAGE)
+    except (ValueError, OverflowError):
+        return HttpResponseBadRequest('Invalid page cursor')
+    context = {'polls': polls, 'next_cursor': next_cursor}
     return render(request, 'home.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '')
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+    if not 1 <= page <= settings.POLLS_SEARCH_MAX_PAGE:
+        raise Http404
+    polls, has_next = search_polls(query, page, settings.POLLS_PER_PAGE)
+    context = {'query': query, 'polls': polls, 'page': page,
+               'next_page': page + 1 if has_next else None}
+    return render(request, 'search.html', context)
+
+
+@rate_limit_votes
 def poll(request, poll_id):
     if request.method == 'POST':
-        choice = Choice.objects.get(id=request.POST['vote'])
-        choice.votes += 1
-        choice.save()
-        return HttpResponseRedirect(reverse('polls.views.poll', args=[poll_id, ]))
+        # Only the id is needed to validate against the cached choices
+        form = PollVoteForm(poll=Poll(pk=poll_id), data=request.POST)
+        if form.is_valid():
+            deduplicator, voter = get_deduplicator(), voter_key(request)
+            if deduplicator is not None and not deduplicator.claim(int(poll_id), voter):
+                return HttpResponseForbidden('You have already voted on this poll')
+            recorded = False
+            try:
+                recorded = record_vote(poll_id, form.cleaned_data['vote'])
+            finally:
+                # A vote that was not counted leaves the voter free to retry
+                if deduplicator is not None:
+                    deduplicator.release(int(poll_id), voter, recorded)
+            if recorded:
+                return HttpResponseRedirect(reverse('polls.views.poll', args=[poll_id, ]))
+        # Only pay for the extra lookup when the vote was rejected
+        get_object_or_404(Poll, pk=poll_id)
+        return HttpResponseBadRequest('Invalid vote')
 
-    poll = Poll.objects.get(pk=poll_id)
+    try:
+        poll = Poll.objects.get(pk=poll_id)
+    except Poll.DoesNotExist:
+        # Archived polls keep a read-only results page
+        poll = get_object_or_404(ArchivedPoll, pk=poll_id)
+        results = render_to_string('poll_results.html', {'results': poll.results()})
+        context = {'poll': poll, 'results_html': results, 'form': None}
+        return render(request, 'poll.html', context)
     form = PollVoteForm(poll=poll)
-    context = {'poll': poll, 'form': form}
+    context = {'poll': poll, 'results_html': results_html(poll), 'form': form}
     return render(request, 'poll.html', context)
+
+
+def _json_response(data, status=200):
+    return HttpResponse(json.dumps(data), content_type='application/json', status=status)
+
+
+def _poll_change_marker(request, poll_id):
+    # Shared by the ETag and Last-Modified functions: one query per request,
+    # or two for an archived poll
+    if not hasattr(request, '_poll_change_marker'):
+        marker = change_marker(poll_id)
+        if marker is None:
+            marker = next((('archived', archived_at) for archived_at in ArchivedPoll.objects
+                           .filter(pk=poll_id).values_list('archived_at', flat=True)[:1]), None)
+        request._poll_change_marker = marker
+    return request._poll_change_marker
+
+
+def _results_etag(request, poll_id):
+    marker = _poll_change_marker(request, poll_id)
+    return marker and '%s-%s' % (marker[0], marker[1].isoformat())
+
+
+def _results_last_modified(request, poll_id):
+    marker = _poll_change_marker(request, poll_id)
+    return marker and marker[1]
+
+
+@condition(etag_func=_results_etag, last_modified_func=_results_last_modified)
+def poll_results(request, poll_id):
+    """The poll's question and results as JSON.
+
+    Conditional GETs of an unchanged poll are answered with a 304 after a
+    single lookup of the poll's change marker; no choices are loaded.
+    Archived polls are served from the archive.
+    """
+    try:
+        poll = Poll.objects.get(pk=poll_id)
+    except Poll.DoesNotExist:
+        poll = get_object_or_404(ArchivedPoll, pk=poll_id)
+    results = poll.results()
+    return _json_response({
+        'id': poll.pk,
+        'question': poll.question,
+        'total_votes': results['total_votes'],
+        'choices': results['choices'],
+    })
+
+
+# Largest value of an IntegerField primary key
+MAX_ID = 2 ** 31 - 1
+
+
+def _api_client(request, api_keys):
+    # Name of the client whose API key, out of api_keys, the request
+    # carries, or None
+    scheme, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'token' or not key:
+        return None
+    for client_key, client in api_keys.items():
+        if constant_time_compare(key.strip(), client_key):
+            return client
+    return None
+
+
+def _api_key_required():
+    response = HttpResponse('A valid API key is required', status=401)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def _parse_vote_entry(entry):
+    if not isinstance(entry, dict):
+        raise ValueError('Entry must be an object')
+    values = []
+    for name in ('poll_id', 'choice_id', 'count'):
+        value = entry.get(name)
+        # bool is an int subclass, but true is not a vote count
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError('%s must be an integer' % (name, ))
+        values.append(value)
+    # Out of range ids could not even be looked up
+    for name, value in zip(('poll_id', 'choice_id'), values):
+        if not 1 <= value <= MAX_ID:
+            raise ValueError('%s is not a valid id' % (name, ))
+    if values[2] < 1:
+        raise ValueError('count must be positive')
+    if values[2] > settings.POLLS_BULK_VOTES_MAX_COUNT:
+        raise ValueError('count must be at most %d' % (settings.POLLS_BULK_VOTES_MAX_COUNT, ))
+    return values
+
+
+@csrf_exempt
+@require_POST
+def bulk_votes(request):
+    """Apply a JSON list of ``{poll_id, choice_id, count}`` votes at once.
+
+    Only clients listed in ``POLLS_BULK_VOTES_API_KEYS`` are served. All
+    choices are looked up together and all valid entries are applied in one
+    transaction; invalid entries, and those past the request's vote limit,
+    are reported and skipped.
+    """
+    if _api_client(request, settings.POLLS_BULK_VOTES_API_KEYS) is None:
+        return _api_key_required()
+    try:
+        entries = json.loads(request.body.decode('UTF-8'))
+    except ValueError:
+        return HttpResponseBadRequest('Body must be JSON')
+    if not isinstance(entries, list):
+        return HttpResponseBadRequest('Body must be a JSON list')
+    if len(entries) > settings.POLLS_BULK_VOTES_MAX_ENTRIES:
+        return HttpResponseBadRequest(
+            'At most %d entries per request' % (settings.POLLS_BULK_VOTES_MAX_ENTRIES, ))
+
+    parsed, results = [], []
+    for entry in entries:
+        try:
+            parsed.append(_parse_vote_entry(entry))
+            results.append({'status': 'ok'})
+        except ValueError as e:
+            parsed.append(None)
+            results.append({'status': 'error', 'error': str(e)})
+
+    polls_by_choice = choice_polls(entry[1] for entry in parsed if entry is not None)
+    counts, accepted = defaultdict(int), 0
+    for entry, result in zip(parsed, results):
+        if entry is None:
+            continue
+        poll_id, choice_id, count = entry
+        if polls_by_choice.get(choice_id) != poll_id:
+            result.update(status='error', error='Unknown choice for this poll')
+            continue
+        if accepted + count > settings.POLLS_BULK_VOTES_MAX_REQUEST_VOTES:
+            result.update(status='error', error='Over the limit of %d votes per request' % (
+                settings.POLLS_BULK_VOTES_MAX_REQUEST_VOTES, ))
+            continue
+        counts[(poll_id, choice_id)] += count
+        accepted += count
+    apply_vote_counts(counts)
+
+    return _json_response({
+        'accepted': accepted,
+        'rejected': sum(1 for result in results if result['status'] == 'error'),
+        'results': results,
+    })
+
+
+def export_results(request, format):
+    """Stream all polls, their choices and vote counts as CSV, JSON or JSON
+    lines.
+
+    Only staff users and clients listed in ``POLLS_EXPORT_API_KEYS`` are
+    served: the export reads every row of the poll tables.
+    """
+    if not (request.user.is_staff or _api_client(request, settings.POLLS_EXPORT_API_KEYS)):
+        return _api_key_required()
+    rows, content_type = EXPORT_FORMATS[format]
+    response = StreamingHttpResponse(rows(settings.POLLS_EXPORT_CHUNK_SIZE),
+                                     content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="poll-results.%s"' % (format, )
+    return response
+
+
+def _server_sent_event(revision, data):
+    return 'event: results\nid: %d\ndata: %s\n\n' % (revision, json.dumps(data))
+
+
+def _live_results_events(poll_id):
+    hub.subscribe(poll_id)
+    try:
+        revision, results = hub.wait(poll_id, None, 0)
+        if results is None:
+            return
+        yield _server_sent_event(revision, results)
+        deadline = time.time() + settings.POLLS_LIVE_STREAM_SECONDS
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            new_revision, new_results = hub.wait(
+                poll_id, revision, min(remaining, settings.POLLS_LIVE_HEARTBEAT_SECONDS))
+            if new_results is None:
+                return
+            if new_revision == revision:
+                yield ': keepalive\n\n'
+                continue
+            yield _server_sent_event(new_revision, results_delta(results, new_results))
+            revision, results = new_revision, new_results
+    finally:
+        hub.unsubscribe(poll_id)
+
+
+def poll_live(request, poll_id):
+    """Server-Sent Events stream of a poll's results.
+
+    The first event carries the full results, later ones only the choices
+    that changed. The stream ends after ``POLLS_LIVE_STREAM_SECONDS`` and
+    the browser's EventSource reconnects.
+    """
+    get_object_or_404(Poll, pk=poll_id)
+    response = StreamingHttpResponse(_live_results_events(int(poll_id)),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def poll_live_wait(request, poll_id):
+    """Long-poll fallback: full results once the revision passes ``since``."""
+    poll_id = int(poll_id)
+    try:
+        since = int(request.GET['since']) if 'since' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid revision')
+    hub.subscribe(poll_id)
+    try:
+        revision, results = hub.wait(poll_id, since, settings.POLLS_LIVE_LONG_POLL_SECONDS)
+    finally:
+        hub.unsubscribe(poll_id)
+    if results is None:
+        raise Http404
+    return _json_response(dict(results, revision=revision))
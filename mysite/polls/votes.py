@@ -0,0 +1,188 @@
+import random
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from polls import history
+from polls.buffer import get_vote_buffer
+from polls.cache import invalidate_results, is_poll_choice, poll_counter_shards
+from polls.models import Choice, ChoiceVoteShard, Poll, with_change_marker
+from polls.signals import votes_recorded
+
+# Keeps ``pk__in`` lists below SQLite's limit on query parameters
+UPDATE_BATCH_SIZE = 500
+
+
+def record_vote(poll_id, choice_id):
+    """Add one vote to a choice of the given poll.
+
+    The increment is a single conditional ``UPDATE ... SET votes = votes + 1``
+    scoped to both the choice and the poll, so concurrent voters never lose
+    updates and a choice id from another poll is never touched. The poll's
+    ``vote_total`` and trend score are bumped in the same transaction, and
+    the vote is then counted into the choice's history. Returns ``True`` if
+    the vote was counted.
+
+    With the vote buffer enabled the choice is only checked against the
+    poll's cached choices, and the vote is written by the buffer's next flush.
+    Polls with counter shards take the vote on a random shard instead; see
+    ``compact_vote_shards``.
+    """
+    buffer = get_vote_buffer()
+    if buffer is not None:
+        if not is_poll_choice(poll_id, int(choice_id)):
+            return False
+        buffer.add(poll_id, choice_id)
+        return True
+
+    shards = poll_counter_shards(poll_id)
+    if shards:
+        return _record_sharded_vote(poll_id, choice_id, random.randrange(shards))
+
+    with transaction.commit_on_success():
+        updated = Choice.objects.filter(pk=choice_id, poll_id=poll_id).update(
+            votes=F('votes') + 1)
+        if updated:
+            Poll.objects.filter(pk=poll_id).update(**with_change_marker(
+                vote_total=F('vote_total') + 1, trend_score=F('trend_score') + 1))
+    if updated:
+        counts = {(int(poll_id), int(choice_id)): 1}
+        history.add_votes(counts)
+        votes_recorded.send(sender=Choice, counts=counts)
+    return updated == 1
+
+
+def _record_sharded_vote(poll_id, choice_id, shard):
+    # Concurrent votes for one choice mostly update different rows, and
+    # neither the choice nor the poll row is locked
+    with transaction.commit_on_success():
+        shards = ChoiceVoteShard.objects.filter(choice=choice_id, poll=poll_id, shard=shard)
+        updated = shards.update(votes=F('votes') + 1, changed_at=timezone.now())
+        if not updated:
+            # First vote on this shard
+            if not Choice.objects.filter(pk=choice_id, poll_id=poll_id).exists():
+                return False
+            savepoint = transaction.savepoint()
+            try:
+                ChoiceVoteShard.objects.create(poll_id=poll_id, choice_id=choice_id,
+                                               shard=shard, votes=1)
+            except IntegrityError:
+                # A concurrent vote created it first
+                transaction.savepoint_rollback(savepoint)
+                shards.update(votes=F('votes') + 1)
+            else:
+                transaction.savepoint_commit(savepoint)
+    # The results and the poll's change marker include shard votes; its
+    # totals move on when the shards are compacted. History is counted now,
+    # so the vote lands in the minute it was cast in.
+    history.add_votes({(int(poll_id), int(choice_id)): 1})
+    invalidate_results(poll_id)
+    return True
+
+
+def _grouped_increments(model, fields, increments, **updates):
+    # One UPDATE per distinct increment rather than one per row
+    ids_by_increment = defaultdict(list)
+    for pk, increment in increments.items():
+        ids_by_increment[increment].append(pk)
+    for increment, pks in ids_by_increment.items():
+        increment_updates = dict(updates, **dict((field, F(field) + increment) for field in fields))
+        for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+            model.objects.filter(pk__in=pks[start:start + UPDATE_BATCH_SIZE]).update(
+                **increment_updates)
+
+
+def apply_vote_counts(counts):
+    """Add many votes at once, in one transaction.
+
+    ``counts`` maps ``(poll_id, choice_id)`` to a number of votes; every
+    choice must already be known to belong to its poll. Choices and polls
+    that get the same number of votes share an ``UPDATE``.
+    """
+    if not any(counts.values()):
+        return
+    with transaction.commit_on_success():
+        _add_vote_counts(counts)
+    history.add_votes(counts)
+    votes_recorded.send(sender=Choice, counts=dict(counts))
+
+
+def _add_vote_counts(counts):
+    choice_increments = {}
+    poll_increments = defaultdict(int)
+    for (poll_id, choice_id), count in counts.items():
+        if count:
+            choice_increments[choice_id] = count
+            poll_increments[poll_id] += count
+    _grouped_increments(Choice, ('votes', ), choice_increments)
+    # The revision moves by the number of votes, so that compacting shard
+    # votes leaves polls.models.change_marker where the votes had put it
+    _grouped_increments(Poll, ('vote_total', 'trend_score', 'revision'), poll_increments,
+                        changed_at=timezone.now())
+
+
+def compact_vote_shards():
+    """Move the votes held in counter shards into the choices' and polls'
+    totals, ``UPDATE_BATCH_SIZE`` shards per transaction.
+
+    Shards are locked while read and decremented by what was read rather
+    than zeroed, so votes landing meanwhile are kept for the next
+    compaction. Their history was counted when they were cast. Returns the
+    number of votes moved.
+    """
+    moved, last_id = 0, 0
+    while True:
+        with transaction.commit_on_success():
+            shards = list(ChoiceVoteShard.objects.select_for_update()
+                          .filter(pk__gt=last_id, votes__gt=0).order_by('pk')
+                          .values_list('pk', 'poll_id', 'choice_id', 'votes')[:UPDATE_BATCH_SIZE])
+            if not shards:
+                return moved
+            counts = defaultdict(int)
+            for pk, poll_id, choice_id, votes in shards:
+                counts[poll_id, choice_id] += votes
+            _grouped_increments(ChoiceVoteShard, ('votes', ),
+                                dict((pk, -votes) for pk, poll_id, choice_id, votes in shards))
+            _add_vote_counts(counts)
+        votes_recorded.send(sender=Choice, counts=dict(counts))
+        moved += sum(counts.values())
+        last_id = shards[-1][0]
+
+
+def choice_polls(choice_ids):
+    """Map each existing choice id in ``choice_ids`` to its poll id."""
+    choice_ids = list(set(choice_ids))
+    polls = {}
+    for start in range(0, len(choice_ids), UPDATE_BATCH_SIZE):
+        polls.update(Choice.objects.filter(
+            pk__in=choice_ids[start:start + UPDATE_BATCH_SIZE]).values_list('pk', 'poll_id'))
+    return polls
+
+
+def rebuild_vote_totals(poll_ids):
+    """Recompute ``Poll.vote_total`` from the choices of the given polls.
+
+    Done as one ``UPDATE`` with a correlated subquery, so votes landing while
+    the rebuild runs are not lost.
+    """
+    poll_ids = list(poll_ids)
+    if not poll_ids:
+        return
+    qn = connection.ops.quote_name
+    sql = (
+        'UPDATE {poll} SET {total} = ('
+        'SELECT COALESCE(SUM({votes}), 0) FROM {choice} WHERE {choice}.{fk} = {poll}.{pk}'
+        ') WHERE {pk} IN ({params})'
+    ).format(
+        poll=qn(Poll._meta.db_table),
+        total=qn('vote_total'),
+        votes=qn('votes'),
+        choice=qn(Choice._meta.db_table),
+        fk=qn(Choice._meta.get_field('poll').column),
+        pk=qn(Poll._meta.pk.column),
+        params=', '.join(['%s'] * len(poll_ids)),
+    )
+    with transaction.commit_on_success():
+        connection.cursor().execute(sql, poll_ids)
+        transaction.set_dirty()